@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+
+import math, threading, time
+from dataclasses import dataclass, field
+from typing import List, Tuple
+from sermeasure import SerMeasure, Snapshot
+
+###################################################
+# running min, max, mean, count and last of a measure channel (O(1) per sample)
+class Accumulator:
+    __slots__ = ['n', 'sum', 'min', 'max', 'last']
+
+    def __init__(self):
+        self.n, self.sum = 0, 0.
+        self.min, self.max = math.inf, -math.inf
+        self.last = None
+
+    def add(self, x: float):
+        self.n += 1
+        self.sum += x
+        if x < self.min: self.min = x
+        if x > self.max: self.max = x
+        self.last = x
+
+    @property
+    def mean(self) -> float:
+        return self.sum/self.n if self.n > 0 else None
+
+###################################################
+# one closed window of a device: accumulators of the measures, last state
+# strings and statuses, number of snapshots, [start, end) epoch time [sec]
+@dataclass
+class Aggregate:
+    name: str
+    meas:   List[Accumulator] = field(default_factory=list)
+    state:  List[str]  = field(default_factory=list)
+    status: List[bool] = field(default_factory=list)
+    n: int = 0
+    start: float = 0.
+    end: float = 0.
+
+###################################################
+# windowed aggregation of the snapshots between the acquisition and the sender
+#
+# windows: length of the windows of each device [sec], aligned on the epoch
+#          (0 = the device is not aggregated)
+#
+# add() takes every snapshot published by the workers (LatestTable.tap), and
+# drain() returns the windows which are over, once per window and device
+# (those of a device not ready, e.g. its units are not known yet, are kept
+# for a later drain, the oldest dropped beyond max_held and counted in n_dropped);
+# a window is closed by the first snapshot of the next one, or grace seconds
+# after its end (a device which stopped answering), and a snapshot which
+# arrives for a window already closed is counted in n_late and dropped
+#
+# loggers: binlog.BinLogger of a device keeps its raw snapshots
+class WindowAggregator:
+    def __init__(self, devs: List[SerMeasure], windows: List[float], grace: float = 2.):
+        self.names = [dev.name for dev in devs]
+        self.windows = windows
+        self.grace = grace
+        self.lock = threading.Lock()
+        self.current: List[Tuple[int, Aggregate]] = len(devs)*[None] # (window index, aggregate)
+        self.closed = len(devs)*[-math.inf] # index of the last closed window
+        self.done: List[Tuple[int, Aggregate]] = []
+        self.loggers = len(devs)*[None]
+        self.n_late = 0
+        self.max_held = 10000 # closed windows kept per device while it is not ready
+        self.n_dropped = 0
+
+    def add(self, i: int, snap: Snapshot):
+        w = self.windows[i]
+        if snap is None or w <= 0: return
+        if self.loggers[i] is not None: self.loggers[i].write(snap)
+        k = math.floor(snap.time/w)
+        with self.lock:
+            if k <= self.closed[i]:
+                self.n_late += 1
+                return
+            cur = self.current[i]
+            if cur is not None and cur[0] != k:
+                self.close(i)
+                cur = None
+            if cur is None:
+                cur = self.current[i] = (k, Aggregate(self.names[i], [Accumulator() for _ in snap.meas],
+                                                      start=k*w, end=(k + 1)*w))
+            agg = cur[1]
+            for acc, m in zip(agg.meas, snap.meas):
+                if m is not None and math.isfinite(m): acc.add(m)
+            agg.state, agg.status = snap.state, snap.status
+            agg.n += 1
+
+    # with the lock
+    def close(self, i: int):
+        k, agg = self.current[i]
+        self.current[i] = None
+        self.closed[i] = k
+        self.done.append((i, agg))
+
+    # closed windows (all the open ones too with flush, at the end)
+    # ready: devices whose windows can be returned (None = all)
+    def drain(self, now: float = None, flush: bool = False, ready: List[bool] = None) -> List[Tuple[int, Aggregate]]:
+        if now is None: now = time.time()
+        with self.lock:
+            for i, cur in enumerate(self.current):
+                if cur is not None and (flush or now >= cur[1].end + self.grace): self.close(i)
+            if ready is None: done, self.done = self.done, []
+            else:
+                done = [x for x in self.done if ready[x[0]]]
+                held, n = [], len(self.names)*[0]
+                for x in reversed(self.done): # the newest are kept
+                    if ready[x[0]]: continue
+                    n[x[0]] += 1
+                    if n[x[0]] <= self.max_held: held.append(x)
+                    else: self.n_dropped += 1
+                self.done = held[::-1]
+        return done
+
+    def close_loggers(self):
+        for i, x in enumerate(self.loggers):
+            if x is not None: x.close()
+            self.loggers[i] = None
+
+if __name__=="__main__":
+    # 10 Hz for a minute, 10 s windows: one point per channel per window
+    import random
+    from lineproto import LineSerializer
+    class Dev:
+        n_meas, n_state, n_status = 2, 1, 1
+        name = 'tpg'
+    rand = random.Random(1)
+    devs = [Dev()]
+    agg = WindowAggregator(devs, [10.])
+    ser = LineSerializer({}, [{}], [], devs)
+    n_raw, lines = 0, []
+    t0 = time.perf_counter()
+    for k in range(600):
+        snap = Snapshot('tpg', [1e-6*(1 + 0.01*rand.uniform(-1, 1)), 2e-3], ['On'], [True], 1e9 + k*0.1)
+        agg.add(0, snap)
+        n_raw += 4
+        lines += ser.aggregate_lines(agg.drain(now=snap.time))
+    dt = (time.perf_counter() - t0)/600
+    lines += ser.aggregate_lines(agg.drain(flush=True))
+    print('\n'.join(lines[:4]))
+    print(f'{n_raw} samples -> {len(lines)} lines, {dt*1e6:.1f} us per snapshot')
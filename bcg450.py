@@ -3,6 +3,9 @@
 from sermeasure import SerMeasure, UnitType
 from serial import Serial, SerialException, SerialTimeoutException
 from serial.tools.list_ports import comports
+from collections import deque
+import threading, time
+import metrics
     
 ##############################################
 # class for reading the pressure from TPG36X
@@ -16,6 +19,11 @@ class BCG450(SerMeasure):
     ACK = b'\x06'
     NAK = b'\x15'
     n_meas, n_state, n_status = 1, 0, 0
+    unit_name  = [ 'mbar', 'Torr', 'Pa' ]
+    unit_const = [ 12.5, 12.625, 10.5 ] # mbar, Torr, Pa
+    use_stream = True  # GetMeasure/GetUnit from the streaming reader
+    n_ring  = 4096     # number of frames kept in the ring buffer
+    stale_t = 1.       # [sec] the latest frame older than this is an error
     def __init__(self, name, port):
         self.name = name
         self.port = port
@@ -32,22 +40,22 @@ class BCG450(SerMeasure):
         self.err_BA = False
         self.err_EL = False
 
+        # streaming reader
+        self.stream: threading.Thread = None
+        self.streaming = False
+        self.latest = None # last good frame (see decode_frame), replaced atomically
+        self.ring = deque(maxlen=self.n_ring)
+        self.n_frame, self.n_bad = 0, 0
 
     def open(self):
-        try: 
-            self.ser = Serial(self.port, timeout=1, write_timeout=1) # default is okay
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in open: {str(e)}")
-            self.ser = None
-            self.ok = False
-        else: self.ok = True
+        self.ser = self.open_session(timeout=self.timeout, write_timeout=self.timeout) # default is okay
+        self.ok = self.ser is not None
         return self.ok
         
     def close(self):
+        if self.streaming: self.stop_stream() # restarted by the next update()
         if self.ser is None: return
-        try: self.ser.close()
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in close: {str(e)}")
+        self.close_session()
         self.ser = None
         self.ok = False
         
@@ -72,32 +80,56 @@ class BCG450(SerMeasure):
     #########################################
     # read unit
     def get_unit(self):
-        unit_name = [ 'mbar', 'Torr', 'Pa' ]
-        self.get_str()
-        return unit_name[self.unit] if self.ok else None
+        self.update()
+        return self.unit_name[self.unit] if self.ok else None
     #########################################
     
     #########################################
     # read pressure
     def get_pr(self):
-        unit_const = [ 12.5, 12.625, 10.5 ] # mbar, Torr, Pa
-        self.get_str()
-        return 10**(self.pres/4000 - unit_const[self.unit]) if self.ok else None
+        self.update()
+        return 10**(self.pres/4000 - self.unit_const[self.unit]) if self.ok else None
+    #########################################
+
+    #########################################
+    # mean pressure of the last n frames in the ring buffer (streaming only)
+    def get_pr_avg(self, n: int = 10):
+        frames = list(self.ring)[-n:]
+        if len(frames) == 0: return None
+        return sum(10**(f[1]/4000 - self.unit_const[f[2]]) for f in frames)/len(frames)
+    #########################################
+
+    #########################################
+    # update the status with the latest frame of the stream,
+    # or with a new string if streaming is not used
+    def update(self):
+        if not self.use_stream:
+            self.get_str()
+            return self.ok
+        if not self.streaming: self.start_stream()
+        frame = self.latest
+        t_end = time.time() + self.stale_t
+        while frame is None and time.time() < t_end: # the first frame after start
+            time.sleep(0.01)
+            frame = self.latest
+        self.ok = frame is not None and time.time() - frame[0] < self.stale_t
+        if self.ok: self.apply_frame(frame)
+        return self.ok
     #########################################
     
     def set_unit(self, u):
-        unit_name = [ 'mbar', 'Torr', 'Pa' ]
-        try: ind = unit_name.index(u)
+        try: ind = self.unit_name.index(u)
         except (ValueError) as e:
             print(f'Error in set_unit: {str(e)}')
             return
-        self.send_str(bytes.fromhex('108E'), unit_name.index(u))
+        self.send_str(bytes.fromhex('108E'), ind)
 
     def store_unit(self):
         self.send_str(bytes.fromhex('2007'), 0)        
 
     #########################################
     # read recent string
+    @metrics.timed(lambda: 'frame')
     def get_str(self):
         if not self.open(): return
         try:
@@ -106,32 +138,94 @@ class BCG450(SerMeasure):
         except (SerialException, SerialTimeoutException) as e:
             print(f"Error in get_str: {str(e)}")
             self.ok = False
+            self.close()
             return
         if len(r) < 18:
             print("Error in get_str: Shorter string")
+            metrics.count(self, 'timeouts')
             self.ok = False
             self.close()
             return
         for i in range(0,10):
-            if r[i] == 7 and r[i+1] == 5:
-                cs = sum(r[i+1:i+8]) % 256
-                if r[i+8] != cs: continue
+            if self.is_frame(r, i):
                 # found the right string
-                self.emis = r[i+2] & 0x3
-                self.unit = (r[i+2] >> 4) & 0x3
-                self.err_dia = ((r[i+3] & 0x1) == 0x1)
-                self.err_pirani = ((r[i+3] & 0x4) == 0x4)
-                self.err_BA = ((r[i+3] & 0x10) == 0x10)
-                self.err_BL = ((r[i+3] & 0x40) == 0x40)
-                self.pres = r[i+4]*256+r[i+5]
+                self.apply_frame(self.decode_frame(r, i))
                 self.ok = True
                 self.close()
+                self.ok = True # close() clears it, is_this() needs it
                 return
         print("Error in get_str: Cannot find a good string")
+        metrics.count(self, 'naks')
         self.ok = False
         self.close()
     #########################################            
 
+    #########################################
+    # frame: 0x07 0x05 status error pres_hi pres_lo ver type checksum
+    def is_frame(self, r, i: int):
+        return r[i] == 7 and r[i+1] == 5 and r[i+8] == sum(r[i+1:i+8]) % 256
+
+    # frame tuple: (time, pres, unit, emis, err_dia, err_pirani, err_BA, err_BL)
+    def decode_frame(self, r, i: int):
+        return (time.time(), r[i+4]*256+r[i+5], (r[i+2] >> 4) & 0x3, r[i+2] & 0x3,
+                (r[i+3] & 0x1) == 0x1, (r[i+3] & 0x4) == 0x4,
+                (r[i+3] & 0x10) == 0x10, (r[i+3] & 0x40) == 0x40)
+
+    def apply_frame(self, frame):
+        _, self.pres, self.unit, self.emis, \
+            self.err_dia, self.err_pirani, self.err_BA, self.err_BL = frame
+    #########################################
+
+    #########################################
+    # streaming reader
+    #
+    # a dedicated thread keeps the port open and parses the continuous frames
+    # into self.latest (the last good frame) and self.ring (history); it has
+    # its own Serial handle with its own short timeout, so the transactions
+    # of the shared session (which may apply other settings) do not change it
+    def start_stream(self):
+        if self.stream is not None and self.stream.is_alive(): return
+        self.streaming = True
+        self.stream = threading.Thread(target=self.read_stream, daemon=True)
+        self.stream.start()
+
+    def stop_stream(self):
+        self.streaming = False
+        if self.stream is not None: self.stream.join()
+        self.stream = None
+        self.latest = None
+
+    def read_stream(self):
+        buf = bytearray()
+        ser = None
+        while self.streaming:
+            if ser is None:
+                try: ser = Serial(self.port, timeout=0.1, write_timeout=1)
+                except (SerialException, SerialTimeoutException) as e:
+                    print(f"Error in read_stream: {str(e)}")
+                    time.sleep(1)
+                    continue
+            try: buf += ser.read(max(1, ser.in_waiting))
+            except (SerialException, SerialTimeoutException) as e:
+                print(f"Error in read_stream: {str(e)}")
+                ser.close()
+                ser = None
+                continue
+            i = 0
+            while len(buf) - i >= 9:
+                if self.is_frame(buf, i):
+                    frame = self.decode_frame(buf, i)
+                    self.latest = frame
+                    self.ring.append(frame)
+                    self.n_frame += 1
+                    i += 9
+                else:
+                    self.n_bad += 1
+                    i += 1
+            del buf[:i]
+        if ser is not None: ser.close()
+    #########################################
+
     #########################################
     # write recent string
     def send_str(self, comm, val):
@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+
+import argparse, json, multiprocessing, os, platform, resource, shutil, signal, subprocess, sys, \
+       tempfile, threading, time
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from cmmsis import InfluxSender
+from sermeasure import SerSession
+from sermeasure_list import *
+
+###################################################
+# end-to-end acquisition benchmark
+#
+# the real drivers read simulated instruments (simdev.py, in a separate
+# process) or the mock devices, and InfluxSender writes to a local stand-in
+# of the influxdb http api; for each number of devices it measures
+#   latency : percentiles of the cycle latency of the devices [ms]
+#   rate    : snapshots per second (achieved and expected)
+#   cpu     : cpu time of this process per snapshot [us]
+#   memory  : rss at the beginning and the end of the run [MB]
+#   sink    : lines, bytes and requests per second received by the stand-in
+# and writes them to a json file; --compare prints the ratios to a former file
+sim_mix = ['TPG36X', 'TIC100', 'LS218', 'VSM7XX', 'BCG450'] # LS335 cannot open a pty
+mock_mix = [M1, M2, M3]
+
+###################################################
+# stand-in of influxdb: POST /api/v2/write is counted and answered 204,
+# GET /stats returns the counters (json)
+class InfluxStandIn(BaseHTTPRequestHandler):
+    stats = {'requests': 0, 'lines': 0, 'bytes': 0}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['lines'] += body.count(b'\n') + (0 if body.endswith(b'\n') or len(body) == 0 else 1)
+            self.stats['bytes'] += len(body)
+        self.send_response(204)
+        self.end_headers()
+
+    def do_GET(self):
+        with self.lock: body = json.dumps(self.stats).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): pass
+
+def serve_influx(port: int):
+    ThreadingHTTPServer(('127.0.0.1', port), InfluxStandIn).serve_forever()
+
+def influx_stats(url: str) -> Dict[str, int]:
+    from urllib.request import urlopen
+    with urlopen(url + '/stats', timeout=5) as f: return json.load(f)
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+###################################################
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024 # peak, not current
+
+# simulators of n devices in a child process: (process, [(class name, pty)])
+def start_sims(n: int, args):
+    spec = [f'{x}:{len(range(i, n, len(sim_mix)))}' for i, x in enumerate(sim_mix) if i < n]
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simdev.py'), *spec,
+           '--latency', str(args.latency), '--drop', str(args.drop), '--garbage', str(args.garbage)]
+    if args.baud: cmd += ['--baud', str(args.baud)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    ports = []
+    for _ in range(n):
+        name, _, port = proc.stdout.readline().split()
+        ports.append((name, port))
+    return proc, ports
+
+###################################################
+# one run: n devices for duration seconds
+def run(n: int, engine: str, args, url: str, ports) -> Dict:
+    if args.mock: dev_list = [[f'mock{i}', mock_mix[i % len(mock_mix)], True] for i in range(n)]
+    else:         dev_list = [[port, globals()[name], True] for name, port in ports[:n]]
+    sender = InfluxSender()
+    sender.url, sender.token, sender.org, sender.bucket = url, 'bench', 'bench', 'bench'
+    sender.use_async = engine == 'async'
+    sender.change_only = args.change_only
+    sender.spool_path = tempfile.mkdtemp(prefix='cmms_bench_')
+    sender.set_device_setting(args.freq, dev_list, {'bench': 'true'}, [{} for _ in range(n)], [],
+                              dev_window=n*[args.window])
+    sender.running = True
+    sink0 = influx_stats(url)
+    th = threading.Thread(target=sender.write_influx, daemon=True)
+    th.start()
+
+    # warm-up: until every device has published once (or the warm-up time is over)
+    t_end = time.time() + args.warmup
+    while time.time() < t_end:
+        table = getattr(sender, 'table', None)
+        if table is not None and all(x is not None for x in table.snapshot()): break
+        time.sleep(0.05)
+
+    # the latency of a device is taken when its snapshot changes
+    lat: List[float] = []
+    last = n*[None]
+    n_snap, n_meas = 0, 0
+    rss0, cpu0, t0 = rss_mb(), time.process_time(), time.perf_counter()
+    sink1 = influx_stats(url)
+    while time.perf_counter() - t0 < args.duration:
+        for i, (snap, el) in enumerate(zip(sender.table.snapshot(), sender.latency())):
+            if snap is None or snap.time == last[i]: continue
+            if last[i] is not None:
+                lat.append(el)
+                n_snap += 1
+                n_meas += len(snap.meas)
+            last[i] = snap.time
+        time.sleep(args.poll)
+    elapsed = time.perf_counter() - t0
+    cpu, rss1 = time.process_time() - cpu0, rss_mb()
+    sink2 = influx_stats(url)
+    missed = sum(sender.missed())
+    sender.running = False
+    th.join(args.freq + 10)
+    backlog = sender.spool.pending_bytes() if hasattr(sender, 'spool') else 0
+    shutil.rmtree(sender.spool_path, ignore_errors=True)
+    SerSession.close_all()
+
+    lat = np.array(lat)*1e3
+    pct = lambda q: float(np.percentile(lat, q)) if len(lat) > 0 else None
+    sink = {k: (sink2[k] - sink1[k])/elapsed for k in sink2}
+    return {'devices': n, 'engine': engine, 'duration': elapsed,
+            'latency_ms': {'p50': pct(50), 'p90': pct(90), 'p99': pct(99), 'max': pct(100),
+                           'mean': float(lat.mean()) if len(lat) > 0 else None},
+            'rate': {'snapshots_per_s': n_snap/elapsed, 'measures_per_s': n_meas/elapsed,
+                     'expected_per_s': n/args.freq, 'missed_deadlines': missed},
+            'cpu_us_per_snapshot': cpu/n_snap*1e6 if n_snap > 0 else None,
+            'memory_mb': {'start': rss0, 'end': rss1, 'growth': rss1 - rss0},
+            'sink': {'lines_per_s': sink['lines'], 'bytes_per_s': sink['bytes'],
+                     'requests_per_s': sink['requests'], 'lines_total': sink2['lines'] - sink0['lines'],
+                     'spool_backlog_bytes': backlog}}
+
+###################################################
+# ratios new/old of the main figures of the runs with the same devices and engine
+def compare(new: Dict, old: Dict):
+    keys = [('latency_ms', 'p50'), ('latency_ms', 'p99'), ('rate', 'snapshots_per_s'),
+            ('cpu_us_per_snapshot', None), ('memory_mb', 'growth'), ('sink', 'lines_per_s')]
+    prev = {(r['devices'], r['engine']): r for r in old['results']}
+    print(f"{'devices':>8} {'engine':>7} " + ' '.join(f'{(a if b is None else b):>16}' for a, b in keys))
+    for r in new['results']:
+        o = prev.get((r['devices'], r['engine']))
+        if o is None: continue
+        cols = []
+        for a, b in keys:
+            x, y = (r[a], o[a]) if b is None else (r[a][b], o[a][b])
+            cols.append(f'{x/y:>15.2f}x' if x is not None and y else f'{"-":>16}')
+        print(f"{r['devices']:>8} {r['engine']:>7} " + ' '.join(cols))
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='end-to-end acquisition benchmark')
+    parser.add_argument('--devices', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--engine', choices=['thread', 'async', 'both'], default='thread')
+    parser.add_argument('--duration', type=float, default=20., help='measuring time of a run [sec]')
+    parser.add_argument('--warmup', type=float, default=10., help='longest warm-up of a run [sec]')
+    parser.add_argument('--freq', type=float, default=1., help='update period [sec]')
+    parser.add_argument('--poll', type=float, default=0.005, help='sampling period of the latencies [sec]')
+    parser.add_argument('--mock', action='store_true', help='mock devices (m1.py) instead of the simulators')
+    parser.add_argument('--change-only', action='store_true', help='deadbands and heartbeat (deadband.py)')
+    parser.add_argument('--window', type=float, default=0., help='aggregation window [sec] (aggregate.py)')
+    parser.add_argument('--latency', type=float, default=0., help='answer delay of the simulators [sec]')
+    parser.add_argument('--baud', type=int, default=9600, help='baud-rate pacing of the simulators (0 = off)')
+    parser.add_argument('--drop', type=float, default=0.)
+    parser.add_argument('--garbage', type=float, default=0.)
+    parser.add_argument('--out', default='bench.json')
+    parser.add_argument('--compare', default=None, help='former result file')
+    parser.add_argument('--verbose', action='store_true', help='output of the drivers')
+    args = parser.parse_args()
+
+    port = free_port()
+    influx = multiprocessing.Process(target=serve_influx, args=(port,), daemon=True)
+    influx.start()
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100): # until the stand-in answers
+        try:
+            influx_stats(url)
+            break
+        except OSError: time.sleep(0.05)
+
+    engines = ['thread', 'async'] if args.engine == 'both' else [args.engine]
+    results = []
+    for n in args.devices:
+        for engine in engines:
+            # new simulators for every run: fresh devices, and a pty once opened
+            # with 7O1 (LS218) may refuse it the next time (see simdev.py)
+            sims, ports = (None, []) if args.mock else start_sims(n, args)
+            stdout = sys.stdout
+            if not args.verbose: sys.stdout = open(os.devnull, 'w') # the drivers print a lot
+            try: r = run(n, engine, args, url, ports)
+            finally:
+                if not args.verbose: sys.stdout.close()
+                sys.stdout = stdout
+                if sims is not None:
+                    sims.send_signal(signal.SIGINT)
+                    sims.communicate()
+            results.append(r)
+            print(f"{n:>4} devices {engine:>6}: latency p50 {r['latency_ms']['p50'] or 0:.1f} ms "
+                  f"p99 {r['latency_ms']['p99'] or 0:.1f} ms, {r['rate']['snapshots_per_s']:.1f}"
+                  f"/{r['rate']['expected_per_s']:.1f} snapshots/s, "
+                  f"cpu {r['cpu_us_per_snapshot'] or 0:.0f} us/snapshot, "
+                  f"memory {r['memory_mb']['growth']:+.1f} MB, sink {r['sink']['lines_per_s']:.0f} lines/s")
+
+    influx.terminate()
+    out = {'version': git_version(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+           'config': vars(args), 'results': results}
+    with open(args.out, 'w') as f: json.dump(out, f, indent=1)
+    print(f'results in {args.out}')
+    if args.compare is not None:
+        with open(args.compare) as f: compare(out, json.load(f))
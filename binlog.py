@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+import gzip, json, os, shutil, struct, sys, threading, time, datetime as dt
+from typing import Dict, List
+from sermeasure import SerMeasure, Snapshot
+
+###################################################
+# compact binary acquisition log
+#
+# file   : MAGIC + uint32 (header length) + header (json) + records
+# header : class, name, channel counts, units, types, state/status names, start time
+# records: 1 byte type + payload
+#   'R' data  : float64 time + float32 x n_meas + uint16 x n_state (string ids)
+#               + uint32 (status bits)
+#   'S' string: uint16 id + uint16 length + utf8, defines a state string id
+#               before its first use
+MAGIC = b'CMMSLOG1'
+REC_DATA, REC_STR = b'R', b'S'
+STR_HEAD = struct.Struct('<HH')
+
+def data_struct(n_meas: int, n_state: int) -> struct.Struct:
+    return struct.Struct('<d%df%dHI' % (n_meas, n_state))
+
+###################################################
+# buffered writer with a time/size flush policy, rotation of the files and
+# optional gzip compression of the closed files (off by default: logreader
+# maps the plain files and indexes them, but has to decompress a .gz whole)
+class BinLogger:
+    def __init__(self, dev: SerMeasure, units: List[str] = None, path: str = 'log',
+                 flush_t: float = 10., flush_bytes: int = 64 << 10,
+                 rotate_t: float = 86400., rotate_bytes: int = 64 << 20, compress: bool = False):
+        self.header = {'class': dev.__class__.__name__, 'name': dev.name,
+                       'n_meas': dev.n_meas, 'n_state': dev.n_state, 'n_status': dev.n_status,
+                       'units': units if units is not None else dev.n_meas * [''],
+                       'types': [x.name for x in dev.type[:dev.n_meas]],
+                       'state_names':  [dev.GetStateName(i) for i in range(dev.n_state)],
+                       'status_names': [dev.GetStatusName(i) for i in range(dev.n_status)]}
+        self.rec = data_struct(dev.n_meas, dev.n_state)
+        self.path = path
+        self.flush_t, self.flush_bytes = flush_t, flush_bytes
+        self.rotate_t, self.rotate_bytes = rotate_t, rotate_bytes
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.f = None
+        self.open_file()
+
+    def open_file(self):
+        now = time.time()
+        name = '%s_%s_%s.cmms' % (self.header['class'], self.header['name'],
+                                  dt.datetime.fromtimestamp(now).strftime('%y%m%d_%H%M%S'))
+        self.fname = os.path.join(self.path, name)
+        n = 0
+        while os.path.exists(self.fname) or os.path.exists(self.fname + '.gz'): # rotated in the same second
+            n += 1
+            self.fname = os.path.join(self.path, name.replace('.cmms', '_%d.cmms' % n))
+        self.f = open(self.fname, 'wb')
+        head = json.dumps({**self.header, 'start': now}).encode('utf8')
+        self.buf = bytearray(MAGIC + struct.pack('<I', len(head)) + head)
+        self.strings: Dict[str, int] = {} # state string -> id in this file
+        self.t_open = self.t_flush = now
+        self.size = 0
+
+    def write(self, snap: Snapshot):
+        with self.lock:
+            ids = []
+            for s in snap.state:
+                s = str(s)
+                if s not in self.strings:
+                    self.strings[s] = len(self.strings)
+                    b = s.encode('utf8')
+                    self.buf += REC_STR + STR_HEAD.pack(self.strings[s], len(b)) + b
+                ids.append(self.strings[s])
+            bits = sum(1 << i for i, x in enumerate(snap.status) if x)
+            meas = [float(x) if x is not None else float('nan') for x in snap.meas]
+            self.buf += REC_DATA + self.rec.pack(snap.time, *meas, *ids, bits)
+            now = time.time()
+            if len(self.buf) >= self.flush_bytes or now - self.t_flush >= self.flush_t:
+                self.flush_buf(now)
+            if self.size >= self.rotate_bytes or now - self.t_open >= self.rotate_t:
+                self.rotate()
+
+    def flush_buf(self, now: float = None):
+        self.f.write(self.buf)
+        self.f.flush()
+        self.size += len(self.buf)
+        self.buf = bytearray()
+        self.t_flush = time.time() if now is None else now
+
+    def flush(self):
+        with self.lock: self.flush_buf()
+
+    def rotate(self):
+        self.close_file()
+        self.open_file()
+
+    def close_file(self):
+        self.flush_buf()
+        self.f.close()
+        if self.compress: threading.Thread(target=compress_file, args=(self.fname,)).start()
+
+    def close(self):
+        with self.lock:
+            if self.f.closed: return
+            self.close_file()
+
+def compress_file(fname: str):
+    with open(fname, 'rb') as fi, gzip.open(fname + '.gz', 'wb') as fo:
+        shutil.copyfileobj(fi, fo)
+    os.remove(fname)
+
+###################################################
+# reading
+def open_log(fname: str):
+    return gzip.open(fname, 'rb') if fname.endswith('.gz') else open(fname, 'rb')
+
+def read_header(f) -> Dict:
+    if f.read(len(MAGIC)) != MAGIC: raise ValueError('Not a CMMS binary log')
+    n, = struct.unpack('<I', f.read(4))
+    return json.loads(f.read(n).decode('utf8'))
+
+# records: (time, meas, states, statuses)
+def read_records(fname: str):
+    with open_log(fname) as f:
+        head = read_header(f)
+        rec = data_struct(head['n_meas'], head['n_state'])
+        nm, ns, nb = head['n_meas'], head['n_state'], head['n_status']
+        strings: Dict[int, str] = {}
+        while True:
+            t = f.read(1)
+            if t == REC_DATA:
+                b = f.read(rec.size)
+                if len(b) < rec.size: break # partially written record
+                r = rec.unpack(b)
+                yield (r[0], list(r[1:1+nm]), [strings.get(x, '') for x in r[1+nm:1+nm+ns]],
+                       [(r[-1] >> i) & 1 == 1 for i in range(nb)])
+            elif t == REC_STR:
+                b = f.read(STR_HEAD.size)
+                if len(b) < STR_HEAD.size: break
+                i, n = STR_HEAD.unpack(b)
+                strings[i] = f.read(n).decode('utf8')
+            else: break
+
+###################################################
+# converter to the text format of the former logs
+#   yyyy-MM-dd hh:mm:ss meas... states... statuses...
+def to_text(fname: str, out: str = None):
+    if out is None: out = fname.removesuffix('.gz').removesuffix('.cmms') + '.txt'
+    with open(out, 'w') as fo:
+        for t, meas, states, statuses in read_records(fname):
+            logstr = dt.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S ')
+            logstr += ''.join('%6.3E ' % x for x in meas)
+            logstr += ''.join('%s ' % x for x in states)
+            logstr += ''.join(str(x) + ' ' for x in statuses)
+            fo.write(logstr + '\n')
+    return out
+
+if __name__=="__main__":
+    if len(sys.argv) < 2: print('Usage: binlog.py log.cmms[.gz] ...')
+    for x in sys.argv[1:]: print(f'{x} -> {to_text(x)}')
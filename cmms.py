@@ -1,26 +1,37 @@
 from PyQt5 import QtGui
-from PyQt5.QtCore import Qt, QTimer, QDateTime
+from PyQt5.QtCore import Qt, QTimer, QDateTime, QObject, QRunnable, QThreadPool, pyqtSignal
 from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QLabel, \
                             QVBoxLayout, QHBoxLayout, QLineEdit, QWidget, QGridLayout, \
                             QGroupBox, QComboBox, QMessageBox, QTabWidget, QCheckBox, \
                             QLCDNumber, QStatusBar
 
 import re
-import sys, inspect
+import sys, time
 import datetime as dt
-from serman import SerMan
-from sermeasure import UnitType, SerMeasure
+from serman import SerMan, PortWatcher, ProbeCache
+from sermeasure import UnitType, SerMeasure, SerSession
+from binlog import BinLogger
+import units
+from ringbuf import RingBuffer
+from trend import QTrend
+import metrics
 
 from sermeasure_list import *
 
 from typing import Dict, List
 
 update_t = 3000
+metrics_port = 9108 # localhost port of the prometheus endpoint (metrics.py, 0 = off)
+
+trend_t = 6*3600 # history of the trends [sec]
+trend_spans = {'10 min': 600., '1 h': 3600., '6 h': 21600.}
 
 class CMMS_Port(QWidget):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.sm = SerMan()
+        self.pool = QThreadPool() # acquisition threads, a slow device never blocks the GUI
+        self.pool.setMaxThreadCount(64)
         self.devcl_list: List[str] = []
         self.dev_list: List[CMMS_Measure] = []
         self.initUI()
@@ -28,6 +39,15 @@ class CMMS_Port(QWidget):
         self.timer.setInterval(update_t)
         self.timer.timeout.connect(self.timeout)
         self.timer.start()
+        ####################
+        # hot-plug: the events of the watcher thread come through queued signals
+        self.port_signals = PortSignals()
+        self.port_signals.added.connect(self.port_added)
+        self.port_signals.removed.connect(self.port_removed)
+        self.watcher = PortWatcher(self.sm)
+        self.watcher.subscribe(self.port_signals.added.emit, self.port_signals.removed.emit)
+        self.watcher.start()
+        ####################
 
     def initUI(self):
         lb_portlist = QLabel("Port List")
@@ -62,28 +82,56 @@ class CMMS_Port(QWidget):
         self.dev_update()
         
     def dev_update(self):
-        for name, obj in inspect.getmembers(sys.modules[__name__]):          
-            if inspect.isclass(obj) and obj.__base__.__name__ == 'SerMeasure':
-                self.devcl_list.append(name)        
+        self.devcl_list = list(serm_name_list) # not appended again on every update
         self.cb_devlist.clear()
         self.cb_devlist.insertItems(0, self.devcl_list)
                 
     def ports_update(self):
         self.sm.load_ports()
+        self.ports_list_update()
+
+    def ports_list_update(self):
+        current = self.cb_portlist.currentText()
         self.cb_portlist.clear()
         self.cb_portlist.insertItems(0, self.sm.string_ports(True))          
+        if current in self.sm.string_ports(True): self.cb_portlist.setCurrentText(current)
     
     def add_dev(self):
-        port = self.sm.get_port_dev(self.cb_portlist.currentIndex())
+        port = self.sm.get_port(self.cb_portlist.currentIndex())
         dev_cl  = self.cb_devlist.currentText()
         name = self.le_devname.text().strip()
         if name == '': name = dev_cl + str(len(self.dev_list))
-        dev_class_ = getattr(sys.modules[__name__], dev_cl, None)
-        dev = dev_class_(name, port)
+        dev_class_ = drivers.get(dev_cl)
+        if dev_class_ is None: return
+        dev = dev_class_(name, port.device if port is not None else None)
         self.dev_list.append(CMMS_Measure(dev, self))
+        self.dev_list[-1].hwid = ProbeCache.key(port) if port is not None else None
         self.lo_devices.addWidget(self.dev_list[-1])
+
+    # a replugged device is bound again to its (possibly renamed) port by the
+    # hwid of the adapter and acquired at once; an unknown one is preselected
+    def port_added(self, port, cl):
+        self.sm.add_port(port)
+        self.ports_list_update()
+        key = ProbeCache.key(port)
+        rebound = False
+        for meas in self.dev_list:
+            if meas.hwid == key and meas.detached:
+                meas.attach(port.device)
+                rebound = True
+        if not rebound and cl is not None:
+            self.cb_portlist.setCurrentText(port.device)
+            self.cb_devlist.setCurrentText(cl.__name__)
+
+    def port_removed(self, port):
+        self.sm.remove_port(port.device)
+        self.ports_list_update()
+        for meas in self.dev_list:
+            if meas.dev.port == port.device: meas.detach()
     
     def close_dev(self, meas):
+        meas.logger.close()
+        for x in meas.q_trends: x.release()
         meas.close()
         self.lo_devices.removeWidget(meas)
         self.dev_list.remove(meas)
@@ -94,6 +142,10 @@ class CMMS_Port(QWidget):
     def timeout(self):
         for x in [e.timeout for e in self.dev_list]: x()
 
+    def close_logs(self):
+        self.watcher.stop()
+        for e in self.dev_list: e.logger.close()
+
 class QCBIndicator(QCheckBox):
     def __init__(self, *args):
         super().__init__(*args)
@@ -115,13 +167,11 @@ class QMeasureNumber(QLCDNumber):
         
 
 class QMeasureUnit(QComboBox):
-    pres_units = [ 'Torr', 'Pa', 'atm', 'psi', 'mbar' ]
-    pres_fac =  { 'Pa': 1, 'Torr': 0.00750064 , 'atm': 9.86923e-06, 'psi': 0.000145038, 'mbar': 0.01}
+    pres_units = [ 'Torr', 'Pa', 'atm', 'psi', 'mbar', 'hPa', 'Micron' ]
 
     temp_units = [ 'K', '\N{DEGREE SIGN}C', '\N{DEGREE SIGN}F' ]
 
     perc_units = [ '%', '\N{PER MILLE SIGN}', ' ']
-    perc_fac =  { '%': 1, '\N{PER MILLE SIGN}': 10 , ' ': 0.01 }
 
     def __init__(self, type: UnitType, *args) -> None:
         super().__init__(*args)
@@ -131,28 +181,9 @@ class QMeasureUnit(QComboBox):
         self.type = type
         self.setCurrentIndex(0)
         
-    def convUnit(self, inpUnit: str, inpVal: float):
-        if self.type is UnitType.Pres:
-            if inpUnit not in self.pres_units: return 0
-            return self.pres_fac[self.currentText()]/self.pres_fac[inpUnit]*inpVal
-        elif self.type is UnitType.Temp:
-            if inpUnit not in self.temp_units: return 0
-            if inpUnit == 'K':
-                if self.currentText() == 'K':                return inpVal
-                if self.currentText() == '\N{DEGREE SIGN}C': return inpVal - 273.15
-                if self.currentText() == '\N{DEGREE SIGN}F': return (inpVal - 273.15)*9/5+32
-            if inpUnit == '\N{DEGREE SIGN}C': 
-                if self.currentText() == 'K':                return inpVal + 273.15
-                if self.currentText() == '\N{DEGREE SIGN}C': return inpVal
-                if self.currentText() == '\N{DEGREE SIGN}F': return inpVal*9/5+32
-            if inpUnit == '\N{DEGREE SIGN}F':
-                if self.currentText() == 'K':                return (inpVal - 32)*5/9 + 273.15
-                if self.currentText() == '\N{DEGREE SIGN}C': return (inpVal - 32)*5/9
-                if self.currentText() == '\N{DEGREE SIGN}F': return inpVal
-        elif self.type is UnitType.Perc:
-            if inpUnit not in self.perc_units: return 0
-            return self.perc_fac[self.currentText()]/self.perc_fac[inpUnit]*inpVal
-        return 0
+    # scalar or numpy array (units.py), nan for an unknown unit
+    def convUnit(self, inpUnit: str, inpVal):
+        return units.convert(inpVal, inpUnit, self.currentText())
 
 class QMeasureValue(QWidget):
     def __init__(self, type: UnitType, *args):
@@ -171,6 +202,9 @@ class QMeasureValue(QWidget):
         self.measure.display('----------')
 
     def setInputValue(self, value: float, flagSci = True):
+        if value is None: # no valid reading
+            self.setNoValue()
+            return
         convValue = self.unit.convUnit(self.input_unit,value)
         strVal = ('%.3E' if flagSci else '%.3f') % convValue
         self.measure.display(strVal)
@@ -201,17 +235,47 @@ class QStatus(QCBIndicator):
         self.setChecked(status)
 
 
+class AcqSignals(QObject):
+    done = pyqtSignal(object, bool) # snapshot (None if failed), is_open
+
+# hot-plug events of the port watcher, delivered in the gui thread
+class PortSignals(QObject):
+    added = pyqtSignal(object, object) # port, class (None if unknown)
+    removed = pyqtSignal(object)       # port
+
+###################################################
+# one acquisition of a device in a worker thread
+class AcqTask(QRunnable):
+    def __init__(self, dev: SerMeasure):
+        super().__init__()
+        self.dev = dev
+        self.signals = AcqSignals()
+
+    def run(self):
+        snap = None
+        t = time.perf_counter()
+        try:
+            if not self.dev.is_open():
+                self.dev.open() 
+            if self.dev.is_open(): snap = self.dev.ReadAll()
+        except Exception as e:
+            print(f"Error in {self.dev.name}: {str(e)}")
+        metrics.cycle(self.dev, time.perf_counter() - t)
+        self.signals.done.emit(snap, bool(self.dev.is_open()))
+
 class CMMS_Measure(QWidget):
     def __init__(self, dev: SerMeasure, parent: CMMS_Port, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.dev = dev
         self.pare = parent
+        self.task: AcqTask = None
+        self.hwid: str = None   # usb adapter of the port (serman.ProbeCache.key)
+        self.detached = False   # the port is unplugged
+        self.initUI()
         ####################
-        # logger
-        now = QDateTime.currentDateTime().toString('yyMMdd_hhmmss')
-        self.logger = open('log/%s_%s_%s.txt' % (self.dev.__class__.__name__, self.dev.name, now), 'w')
+        # logger (binlog.py, 'python binlog.py <file>' converts it to the text format)
+        self.logger = BinLogger(self.dev, [x.input_unit for x in self.q_meas])
         ####################
-        self.initUI()
 
     def initUI(self):
         lb_name = QLabel(self.dev.name)
@@ -232,6 +296,30 @@ class CMMS_Measure(QWidget):
         for i in range(self.dev.n_status):
             self.q_status.append(QStatus(self.dev.GetStatusName(i), self))
 
+        ####################
+        # trends of the measures, hidden until the 'Trend' button is checked
+        self.q_trends: list[QTrend] = []
+        for i, meas in enumerate(self.q_meas):
+            self.q_trends.append(QTrend(RingBuffer(trend_t*1000//update_t + 1),
+                                        lambda v, u=meas: u.unit.convUnit(u.input_unit, v),
+                                        self.dev.type[i] == UnitType.Pres, self))
+        self.cb_span = QComboBox()
+        self.cb_span.addItems(list(trend_spans))
+        self.cb_span.currentTextChanged.connect(lambda x: [e.setSpan(trend_spans[x]) for e in self.q_trends])
+        self.w_trend = QWidget()
+        layoutm_trend = QHBoxLayout()
+        layoutm_trend.setContentsMargins(0, 0, 0, 0)
+        [layoutm_trend.addWidget(i) for i in self.q_trends]
+        layoutm_trend.addWidget(self.cb_span, alignment = Qt.AlignTop)
+        self.w_trend.setLayout(layoutm_trend)
+        self.w_trend.setVisible(False)
+        pb_trend = QPushButton('Trend')
+        pb_trend.setFixedWidth(70)
+        pb_trend.setCheckable(True)
+        pb_trend.toggled.connect(self.w_trend.setVisible)
+        pb_trend.toggled.connect(lambda x: QTimer.singleShot(0, self.pare.parentWidget().adjustSize))
+        ####################
+
         self.cb_indic = QCBIndicator('status')
         self.cb_indic.setFixedWidth(70)
 
@@ -252,40 +340,59 @@ class CMMS_Measure(QWidget):
         layoutm.addLayout(layoutm_state)
         layoutm.addLayout(layoutm_status)
         layoutm.addLayout(layoutm_meas)
+        layoutm.addWidget(self.w_trend)
         layout.addLayout(layoutm)
         layout.addWidget(self.cb_indic)
+        layout.addWidget(pb_trend)
         layout.addWidget(pb_close)
         self.setLayout(layout)
         
         self.timeout()
         
+    # the acquisition runs in the thread pool of CMMS_Port, and the result comes
+    # back through a queued signal to update_values on the GUI thread
     def timeout(self):
-        if not self.dev.is_open():
-            self.dev.open() 
-        self.cb_indic.setChecked(self.dev.is_open())
-        if self.cb_indic.isChecked():
-            logstr = QDateTime.currentDateTime().toString('yyyy-MM-dd hh:mm:ss ')
+        if self.task is not None: return # the previous acquisition is still running
+        if self.detached: return
+        self.task = AcqTask(self.dev)
+        self.task.signals.done.connect(self.update_values)
+        self.pare.pool.start(self.task)
+
+    def detach(self):
+        self.detached = True
+        SerSession.get(self.dev.port).reset() # the handle of the unplugged port is dead
+        self.cb_indic.setChecked(False)
+        for i in self.q_meas: i.setNoValue()
+
+    def attach(self, port: str):
+        self.dev.close()
+        self.dev.ok = False
+        self.dev.port = port
+        self.detached = False
+        self.timeout()
+
+    def update_values(self, snap, is_open: bool):
+        self.task = None
+        self.cb_indic.setChecked(is_open)
+        if snap is not None:
             for i, lcd in enumerate(self.q_meas):
-                meas = self.dev.GetMeasure(i)
-                lcd.setInputValue(meas, self.dev.type[i] != UnitType.Perc)
-                logstr = logstr + ('%6.3E ' % meas)
+                lcd.setInputValue(snap.meas[i], self.dev.type[i] != UnitType.Perc)
             for i, state in enumerate(self.q_states):
-                stat = self.dev.GetState(i)
-                state.setState(stat)
-                logstr = logstr + ('%s ' % stat)
+                state.setState(snap.state[i])
             for i, status in enumerate(self.q_status):
-                statu = self.dev.GetStatus(i)
-                status.setStatus(statu)
-                logstr = logstr + str(statu) + ' '
-            self.logger.write(logstr + '\n')
-            self.logger.flush()
+                status.setStatus(snap.status[i])
+            for i, trend in enumerate(self.q_trends):
+                trend.append(snap.time, snap.meas[i])
+            self.logger.write(snap)
         else:
             for i in self.q_meas: i.setNoValue()
+            for i in self.q_trends: i.append(time.time(), None) # gap in the trend
         
         
 class CMMS_GUI(QMainWindow):
     def __init__(self):
         super().__init__()
+        self.metrics = metrics.serve(metrics_port) if metrics_port > 0 else None
         self.initUI()
 
     def initUI(self):
@@ -307,6 +414,11 @@ class CMMS_GUI(QMainWindow):
         self.adjustSize()
         self.show()
 
+    def closeEvent(self, event):
+        self.centralWidget().close_logs()
+        if self.metrics is not None: self.metrics.shutdown()
+        super().closeEvent(event)
+
     def updateStatusBar(self):
         self.timeLabel.setText(QDateTime.currentDateTime().toString('yyyy-MM-dd hh:mm:ss'))
 
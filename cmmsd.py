@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+
+import argparse, copy, json, os, re, signal, sys, threading, time, tomllib
+from typing import Dict, List
+
+from cmmsis import InfluxSender
+from sermeasure import SerSession
+from sermeasure_list import *
+from serman import SerMan, PortWatcher, ProbeCache
+import metrics
+
+###################################################
+# headless acquisition daemon
+#
+#   python3 cmmsd.py cmmsd.toml
+#
+# the influx sink, the devices, the tags and the rates come from a TOML (or
+# YAML) file instead of the CMMSIS menus, and the acquisition starts at once;
+# the resolved configuration (every default filled in, the ports of the usb
+# adapters and the classes of the 'auto' devices found) is written to
+# <config>.resolved.toml, which starts without probing next time
+#
+# SIGTERM and SIGINT stop it cleanly, e.g. as a systemd service:
+#   [Service]
+#   WorkingDirectory=/opt/cmms
+#   ExecStart=/usr/bin/python3 /opt/cmms/cmmsd.py /etc/cmms/cmmsd.toml
+#   Restart=on-failure
+#
+# see cmmsd.example.toml for the format
+defaults = {
+    'influx': {'url': 'http://grafmon.local:8086', 'token_file': 'influx_token.txt',
+               'org': 'CENS', 'bucket': 'cmms'},
+    'run': {'period': 1.0,        # [sec] update period of the sender and the devices
+            'engine': 'thread',   # 'thread' or 'async' (serasync)
+            'normalize': False,   # measures in SI units
+            'change_only': False, # deadbands and heartbeat instead of every sample (deadband.py)
+            'heartbeat': 60.0,    # [sec] longest silence of a series with change_only
+            'keep_raw': False,    # raw snapshots of the aggregated devices in the binary log
+            'log': 'log',         # directory of the binary log
+            'sink': 'influx',     # 'influx' or 'stdout' (line protocol, for checking)
+            'spool': 'spool',     # directory of the store-and-forward spool
+            'metrics_port': 9109, # prometheus endpoint on localhost (0 = off)
+            'hotplug': True},     # follow unplugged and replugged usb adapters
+    'tags': {},
+    'device': [],
+}
+device_defaults = {'class': 'auto', 'enabled': True, 'period': 0., 'window': 0., 'channel_periods': [],
+                   'channel_deadbands': [], 'tags': {}, 'channel_tags': []}
+device_options = ['name', 'address'] # driver attributes set from the entry
+
+#########################################
+# reading and writing of the configuration
+def is_yaml(path: str) -> bool:
+    return path.endswith('.yaml') or path.endswith('.yml')
+
+def load_config(path: str) -> Dict:
+    if is_yaml(path):
+        import yaml # optional, only for yaml files
+        with open(path) as f: conf = yaml.safe_load(f) or {}
+    else:
+        with open(path, 'rb') as f: conf = tomllib.load(f)
+    out = copy.deepcopy(defaults)
+    for k, v in conf.items():
+        if isinstance(v, dict) and isinstance(out.get(k), dict) and k != 'tags': out[k].update(v)
+        else: out[k] = v
+    out['device'] = [{**copy.deepcopy(device_defaults), **d} for d in out['device']]
+    return out
+
+def save_config(conf: Dict, path: str):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        if is_yaml(path):
+            import yaml
+            yaml.safe_dump(conf, f, sort_keys=False)
+        else: f.write(dump_toml(conf))
+    os.replace(tmp, path)
+
+def resolved_name(path: str) -> str:
+    base, ext = os.path.splitext(path)
+    return base + '.resolved' + (ext if is_yaml(path) else '.toml')
+
+# TOML of a configuration: scalars, lists and inline tables in tables and
+# arrays of tables (tomllib reads only)
+def dump_toml(conf: Dict) -> str:
+    out = [f'{toml_key(k)} = {toml_value(v)}' for k, v in conf.items()
+           if not isinstance(v, dict) and not is_table_array(v)]
+    for k, v in conf.items():
+        if isinstance(v, dict):
+            out += ['', f'[{toml_key(k)}]'] + [f'{toml_key(a)} = {toml_value(b)}' for a, b in v.items()]
+    for k, v in conf.items():
+        if is_table_array(v):
+            for d in v:
+                out += ['', f'[[{toml_key(k)}]]'] + [f'{toml_key(a)} = {toml_value(b)}' for a, b in d.items()]
+    return '\n'.join(out) + '\n'
+
+def is_table_array(v) -> bool:
+    return isinstance(v, list) and len(v) > 0 and all(isinstance(x, dict) for x in v)
+
+def toml_key(k: str) -> str:
+    return k if re.fullmatch('[A-Za-z0-9_-]+', k) else json.dumps(k)
+
+def toml_value(v) -> str:
+    if isinstance(v, bool): return 'true' if v else 'false'
+    if isinstance(v, (int, float)): return repr(v)
+    if isinstance(v, str): return json.dumps(v, ensure_ascii=False)
+    if isinstance(v, dict): return '{' + ', '.join(f'{toml_key(a)} = {toml_value(b)}' for a, b in v.items()) + '}'
+    if isinstance(v, (list, tuple)): return '[' + ', '.join(toml_value(x) for x in v) + ']'
+    raise TypeError(f'no TOML value for {v!r}')
+#########################################
+
+#########################################
+# ports and classes of the devices
+#
+# hwid (serman.ProbeCache.key of the usb adapter) wins over port, so a device
+# is found after its port has been renamed; class 'auto' is probed (the probe
+# cache makes it a single query for a known adapter)
+#
+# a device which is not found keeps its entry as written by the user (class
+# 'auto' and its enabled flag), so it is probed again at the next start;
+# make_sender skips it for this run only
+def resolve(conf: Dict, sm: SerMan) -> Dict:
+    conf = copy.deepcopy(conf)
+    by_dev = {x.device: x for x in sm.ports}
+    by_hwid = {ProbeCache.key(x): x for x in sm.ports}
+    for d in conf['device']:
+        port = by_hwid.get(d.get('hwid', ''))
+        if port is not None: d['port'] = port.device
+        else: port = by_dev.get(d.get('port', ''))
+        if port is not None and 'hwid' not in d: d['hwid'] = ProbeCache.key(port)
+        if d['class'] in ['', 'auto']:
+            cl = sm.find_port_class(port) if port is not None else None
+            if cl is None: print(f"Error in resolve: no device found on {d.get('port', d.get('hwid'))}")
+            else: d['class'] = cl.__name__
+        elif d['class'] not in serm_name_list:
+            print(f"Error in resolve: unknown class {d['class']}")
+        if 'port' not in d:
+            print(f"Error in resolve: no port of {d.get('hwid')}")
+    return conf
+#########################################
+
+def make_sender(conf: Dict) -> InfluxSender:
+    run, influx = conf['run'], conf['influx']
+    sender = InfluxSender()
+    if run['sink'] == 'influx':
+        sender.set_influx_setting(influx['url'], influx['token_file'], influx['org'], influx['bucket'])
+    sender.use_async = run['engine'] == 'async'
+    sender.normalize = run['normalize']
+    sender.change_only = run['change_only']
+    sender.heartbeat = run['heartbeat']
+    sender.keep_raw = run['keep_raw']
+    sender.log_path = run['log']
+    sender.spool_path = run['spool']
+    dev_list, tag_dev, tag_chan, dev_freq, chan_freq, chan_deadband, dev_window = [], [], [], [], [], [], []
+    for d in conf['device']:
+        cl = dict(zip(serm_name_list, serm_class_list)).get(d['class'])
+        if cl is None or 'port' not in d: continue # not found by resolve
+        dev_list.append([d['port'], cl, d['enabled'], {k: d[k] for k in device_options if k in d}])
+        tag_dev.append(d['tags'])
+        n = cl.n_meas + cl.n_status + cl.n_state
+        tag_chan.append(d['channel_tags'] + (n - len(d['channel_tags']))*[{}])
+        dev_freq.append(d['period'])
+        chan_freq.append(d['channel_periods'])
+        chan_deadband.append(d['channel_deadbands'])
+        dev_window.append(d['window'])
+    sender.set_device_setting(run['period'], dev_list, conf['tags'], tag_dev, tag_chan, dev_freq, chan_freq,
+                              chan_deadband, dev_window)
+    return sender
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='CMMS acquisition daemon')
+    parser.add_argument('config', help='TOML or YAML configuration')
+    parser.add_argument('--resolved', default=None, help='resolved configuration (default <config>.resolved.toml)')
+    parser.add_argument('--check', action='store_true', help='resolve and write the configuration only')
+    args = parser.parse_args(argv)
+
+    t = time.perf_counter()
+    try: conf = load_config(args.config)
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Error in load_config: {str(e)}")
+        return 1
+    sm = SerMan()
+    conf = resolve(conf, sm)
+    save_config(conf, args.resolved or resolved_name(args.config))
+    if args.check: return 0
+    try: sender = make_sender(conf)
+    except (OSError, IndexError) as e: # token file
+        print(f"Error in make_sender: {str(e)}")
+        return 1
+    if sender.n_dev == 0:
+        print('No enabled devices.')
+        return 1
+
+    stop = threading.Event()
+    for s in [signal.SIGINT, signal.SIGTERM]: signal.signal(s, lambda *args: stop.set())
+    server = metrics.serve(conf['run']['metrics_port']) if conf['run']['metrics_port'] > 0 else None
+
+    write = None
+    if conf['run']['sink'] == 'stdout': write = lambda lines: print('\n'.join(lines), flush=True)
+    sender.running = True
+    job = threading.Thread(target=sender.write_influx, args=(write,))
+    job.start()
+
+    # hot-plug: the same handling as CMMSIS
+    watcher = None
+    if conf['run']['hotplug']:
+        hwids = {d['hwid']: d for d in conf['device'] if d['enabled'] and 'hwid' in d}
+        def added(port, cl):
+            d = hwids.get(ProbeCache.key(port))
+            if d is None: return
+            print(f" Port {port.device} added: {d['class']}")
+            old, d['port'] = d['port'], port.device
+            sender.attach(old, port.device)
+        def removed(port):
+            print(f' Port {port.device} removed')
+            sender.detach(port.device)
+        watcher = PortWatcher(sm)
+        watcher.subscribe(added, removed)
+        watcher.start()
+    print(f'{sender.n_dev} devices started in {time.perf_counter() - t:.2f} s')
+
+    while not stop.wait(1.):
+        if not job.is_alive(): break # the sink could not start
+    failed = not job.is_alive()
+    sender.running = False
+    job.join()
+    if watcher is not None: watcher.stop()
+    if server is not None: server.shutdown()
+    SerSession.close_all()
+    return 1 if failed else 0
+
+if __name__=="__main__":
+    sys.exit(main())
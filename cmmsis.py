@@ -14,9 +14,17 @@ import re
 import threading
 from typing import List, Dict
 
-from sermeasure import SerMeasure
+from sermeasure import SerMeasure, SerSession, Snapshot
 from sermeasure_list import *
-from serman import SerMan
+from serman import SerMan, PortWatcher, ProbeCache
+from serasync import AioEngine
+from scheduler import FixedRate, DeviceSchedule
+from spool import Spool, SpoolDrainer
+from lineproto import LineSerializer
+from deadband import ChangeFilter
+from aggregate import WindowAggregator
+from binlog import BinLogger
+import metrics, units
 
 def is_url(text):
     url_pattern = "^https?:\\/\\/(?:www\\.)?[-a-zA-Z0-9@:%._\\+~#=]{1,256}\\.[a-zA-Z0-9()]{1,6}\\b(?:[-a-zA-Z0-9()@:%_\\+.~#?&\\/=]*)$"
@@ -42,27 +50,84 @@ float_validator = Validator.from_callable(
     is_float, error_message='This input is not a floating number.',
     move_cursor_to_end=True)
 
+###################################################
+# latest snapshot of each device, shared by the workers and the sender
+# tap: also called with every published snapshot (e.g. WindowAggregator.add)
+class LatestTable():
+    def __init__(self, n: int):
+        self.lock = threading.Lock()
+        self.snaps: List[Snapshot] = n * [None]
+        self.tap = None
+
+    def publish(self, i: int, snap: Snapshot):
+        with self.lock: self.snaps[i] = snap
+        if self.tap is not None: self.tap(i, snap)
+
+    def snapshot(self) -> List[Snapshot]:
+        with self.lock: return list(self.snaps)
+
+###################################################
+# persistent acquisition worker of a device
+# it polls the device at its own fixed rate (scheduler.DeviceSchedule) and
+# publishes the snapshot into the table, so a slow or hung device never
+# blocks the others
 class ThreadSermeasure(threading.Thread):
-    def __init__(self, serm: SerMeasure):
-        super().__init__()
+    def __init__(self, serm: SerMeasure, idx: int, table: LatestTable, freq: float,
+                 chan_freq: List[float] = None, read_units: bool = False):
+        super().__init__(daemon=True)
         self.dev = serm
-        self.meas = []
-        self.state = []
-        self.status = []
+        self.idx = idx
+        self.table = table
+        self.sched = DeviceSchedule(freq, chan_freq)
+        self.elapsed = 0. # latency of the last cycle [sec]
+        self.stopped = threading.Event()
+        self.units: List[str] = None
+        self.unit_poll = units.UnitPoll(serm.name) if read_units else None # None: the units are not needed
 
     def run(self):
-        self.meas = []
-        self.state = []
-        self.status = []
-        for i in range(self.dev.n_meas): self.meas.append(self.dev.GetMeasure(i))
-        for i in range(self.dev.n_state): self.state.append(self.dev.GetState(i))
-        for i in range(self.dev.n_status): self.status.append(self.dev.GetStatus(i))
+        snap = None
+        while not self.stopped.is_set():
+            due = self.sched.due()
+            if len(due) > 0:
+                t = time.perf_counter()
+                try:
+                    if due == 'all' or snap is None: snap = self.dev.ReadAll()
+                    else:                            snap = self.read_channels(snap, due)
+                    self.table.publish(self.idx, snap)
+                    if self.unit_poll is not None and self.unit_poll.due() and self.dev.is_open():
+                        self.units = self.unit_poll.read(self.dev.GetUnits())
+                except Exception as e:
+                    print(f"Error in {self.dev.name}: {str(e)}")
+                self.elapsed = time.perf_counter() - t
+                metrics.cycle(self.dev, self.elapsed)
+                self.sched.advance(due)
+            self.stopped.wait(self.sched.remaining())
+
+    # update only the measures of the due channels
+    def read_channels(self, snap: Snapshot, chans: List[int]) -> Snapshot:
+        meas = list(snap.meas)
+        for i in chans: meas[i] = self.dev.GetMeasure(i)
+        return Snapshot(snap.name, meas, snap.state, snap.status, time.time())
+
+    def stop(self):
+        self.stopped.set()
 
     
 class InfluxSender():
     def __init__(self):
         self.t = 0
         self.running = True
+        self.use_async = False # True: one asyncio loop (serasync) instead of a thread per device
+        self.engine: AioEngine = None
+        self.workers: List[ThreadSermeasure] = []
+        self.devs: List[SerMeasure] = []
+        self.spool_path = 'spool' # directory of the store-and-forward spool
+        self.normalize = False # True: measures are sent in SI units (Pa, K, fraction)
+        self.change_only = False # True: deadbands and heartbeat (deadband.py) instead of every sample
+        self.heartbeat = 60. # [sec] longest silence of a series with change_only
+        self.aggregator: WindowAggregator = None
+        self.keep_raw = False # True: raw snapshots of the aggregated devices in the binary log
+        self.log_path = 'log' # directory of the binary log
 
     def set_influx_setting(self, url, token, org, bucket):
         self.url = url
@@ -71,29 +136,137 @@ class InfluxSender():
         with open(token) as f:
             self.token = f.readline().rsplit()[0]
 
-    def set_device_setting(self, freq, dev_list, tag_gen, tag_dev, tag_chan):
+    # dev_freq : update period of each device (0 = freq)
+    # chan_freq: update periods of the measure channels of each device (0 = device period)
+    # chan_deadband: deadbands of the measure channels of each device ({} = default of the type)
+    # dev_window: aggregation window of each device (0 = every sample, see aggregate.py)
+    def set_device_setting(self, freq, dev_list, tag_gen, tag_dev, tag_chan,
+                           dev_freq = None, chan_freq = None, chan_deadband = None, dev_window = None):
         self.freq = freq
         self.tag_gen = tag_gen
         self.dev_list = []
         self.tag_dev = []
-        for tag, dev in zip(tag_dev, dev_list):
+        self.tag_chan = []
+        self.dev_freq = []
+        self.chan_freq = []
+        self.chan_deadband = []
+        self.dev_window = []
+        if dev_freq is None: dev_freq = len(dev_list) * [0.]
+        if dev_window is None: dev_window = len(dev_list) * [0.]
+        if chan_freq is None: chan_freq = len(dev_list) * [[]]
+        if chan_deadband is None: chan_deadband = len(dev_list) * [[]]
+        tag_chan = tag_chan + (len(dev_list) - len(tag_chan)) * [[]]
+        for tag, tagc, dev, df, cf, cd, dw in zip(tag_dev, tag_chan, dev_list, dev_freq, chan_freq, chan_deadband,
+                                                  dev_window):
             if dev[2]: 
                 self.dev_list.append(dev)
                 self.tag_dev.append(tag)
+                self.tag_chan.append(tagc)
+                self.dev_freq.append(df if df > 0 else freq)
+                self.chan_freq.append(cf)
+                self.chan_deadband.append(cd)
+                self.dev_window.append(dw)
         self.n_dev = len(self.dev_list)
+        # [sec] snapshots older than this are marked as stale
+        self.stale_t = 3*max(self.dev_freq + [freq])
+        self.sent_t = self.n_dev * [None] # time of the last snapshot of make_points
+        self.stale = self.n_dev * [False]
+
+    # devices of the selected list; the optional 4th item of an entry holds
+    # driver attributes (e.g. {'address': 2} of a VSM7XX)
+    def make_devs(self, name: str = None) -> List[SerMeasure]:
+        devs = []
+        for x in self.dev_list:
+            dev = x[1](name or x[1].__name__, x[0])
+            for k, v in (x[3] if len(x) > 3 else {}).items(): setattr(dev, k, v)
+            devs.append(dev)
+        return devs
+
+    def make_serializer(self, devs: List[SerMeasure]) -> LineSerializer:
+        serializer = LineSerializer(self.tag_gen, self.tag_dev, self.tag_chan, devs, self.normalize)
+        if self.change_only: serializer.filter = ChangeFilter(devs, self.chan_deadband, self.heartbeat)
+        return serializer
+
+    def start_workers(self, devs: List[SerMeasure]):
+        self.devs = devs
+        self.table = LatestTable(len(devs))
+        self.aggregator = None
+        if any(x > 0 for x in self.dev_window):
+            self.aggregator = WindowAggregator(devs, self.dev_window, grace=2*max(self.dev_freq))
+            self.table.tap = self.aggregator.add
+        if self.use_async:
+            self.engine = AioEngine(devs, self.dev_freq, callback=self.table.publish, chan_freq=self.chan_freq,
+                                    read_units=self.need_units())
+            self.engine.start()
+            return
+        self.workers = [ThreadSermeasure(dev, i, self.table, self.dev_freq[i], self.chan_freq[i], self.need_units())
+                        for i, dev in enumerate(devs)]
+        [th.start() for th in self.workers]
+
+    def stop_workers(self):
+        if self.engine is not None: self.engine.stop()
+        self.engine = None
+        [th.stop() for th in self.workers]
+        [th.join() for th in self.workers]
+        self.workers = []
+        [dev.close() for dev in self.devs]
+        if self.aggregator is not None: self.aggregator.close_loggers()
+
+    # hot-plug: the worker of a device whose port is unplugged is stopped,
+    # and a new one starts when the device is back (possibly on a new port);
+    # the asyncio engine only needs the new port (AioSerial reopens it);
+    # the last snapshot of a detached device is kept, so it is reported as Stale
+    def detach(self, port: str):
+        for i, dev in enumerate(self.devs):
+            if dev.port != port: continue
+            SerSession.get(port).reset() # the handle of the unplugged port is dead
+            if i < len(self.workers):
+                self.workers[i].stop()
+                self.workers[i].join(2*dev.timeout + 1.)
+
+    def attach(self, old_port: str, port: str):
+        for i, dev in enumerate(self.devs):
+            if dev.port != old_port: continue
+            dev.port = port
+            if i < len(self.workers) and self.workers[i].stopped.is_set():
+                self.workers[i] = ThreadSermeasure(dev, i, self.table, self.dev_freq[i], self.chan_freq[i],
+                                                   self.need_units())
+                self.workers[i].start()
+
+    def latency(self) -> List[float]:
+        if self.engine is not None: return self.engine.elapsed
+        return [th.elapsed for th in self.workers]
+
+    # the units are read only for the normalization and the raw logs
+    def need_units(self) -> bool:
+        return self.normalize or (self.keep_raw and self.aggregator is not None)
+
+    def units(self) -> List[List[str]]:
+        if self.engine is not None: return self.engine.units
+        return [th.units for th in self.workers]
+
+    def missed(self) -> List[int]:
+        if self.engine is not None: return [x.n_missed() for x in self.engine.sched]
+        return [th.sched.n_missed() for th in self.workers]
 
     def job_test(self):
         self.running = True
 
         print(self.dev_list)
-        devs = [x[1]('test', x[0]) for x in self.dev_list]
+        devs = self.make_devs('test')
+        self.serializer = self.make_serializer(devs)
+        self.start_workers(devs)
+        tick = FixedRate(self.freq)
         while self.running:
-            ths = [ThreadSermeasure(dev) for dev in devs]
-            [th.start() for th in ths]
-            [th.join() for th in ths]
-            self.make_points(ths)
-            #for th in ths: print(th.meas, th.status, th.state)
-            time.sleep(self.freq)
+            self.make_lines(self.table.snapshot())
+            print(f'Persistent: {SerSession.persistent}, cycle latency: ' +
+                  ', '.join(f'{dev.name} {t*1e3:.1f} ms' for dev, t in zip(devs, self.latency())) +
+                  f', missed deadlines: {self.missed()}' +
+                  (f', not written: {self.serializer.filter.reduction()*100:.1f} %'
+                   if self.serializer.filter is not None else ''))
+            tick.advance()
+            tick.wait()
+        self.stop_workers()
         
 
     def write_test(self):
@@ -118,42 +291,90 @@ class InfluxSender():
                 return
             time.sleep(self.freq) # separate points by 1 second
 
-    def write_influx(self):
-        pset = PointSettings()
-        for k, v in self.tag_gen.items(): pset.add_default_tag(k, v)
-        try:
-            write_client = influxdb_client.InfluxDBClient(url=self.url, token=self.token, org=self.org)
-            write_api = write_client.write_api(write_options=SYNCHRONOUS, point_settings=pset)
-        except:
-            print('Error in InfluxSender')
-            return
+    # the points go through the disk spool (spool.py): a short outage of the
+    # influx server only delays them, and the backlog is drained when it is back
+    # write: another sink taking a list of line-protocol records (None = influx)
+    def write_influx(self, write = None):
+        write_client = None
+        if write is None:
+            try:
+                write_client = influxdb_client.InfluxDBClient(url=self.url, token=self.token, org=self.org)
+                write_api = write_client.write_api(write_options=SYNCHRONOUS)
+            except:
+                print('Error in InfluxSender')
+                return
+            write = lambda lines: write_api.write(self.bucket, self.org, lines)
+        self.spool = Spool(self.spool_path)
+        drainer = SpoolDrainer(self.spool, write)
+        drainer.start()
         
-        devs = [x[1](x[1].__name__, x[0]) for x in self.dev_list]
+        devs = self.make_devs()
+        self.serializer = self.make_serializer(devs)
+        self.start_workers(devs)
+        tick = FixedRate(self.freq)
         while self.running:
-            ths = [ThreadSermeasure(dev) for dev in devs]
-            [th.start() for th in ths]
-            [th.join() for th in ths]
-            pts = self.make_points(ths)
-            write_api.write(self.bucket, self.org, pts)
-            #try: write_api.write(self.bucket, self.org, pts)
-            #except:
-            #    print('Error in InfluxSender')
-            #    return
-            time.sleep(self.freq)
-
-    def make_points(self, ths: List[ThreadSermeasure]) -> List[Point]:
+            self.spool.append(self.make_lines(self.table.snapshot()))
+            tick.advance()
+            tick.wait()
+        self.stop_workers()
+        if self.aggregator is not None: # the last windows
+            self.spool.append(self.serializer.aggregate_lines(self.aggregator.drain(flush=True)))
+        drainer.stop()
+        drainer.join()
+        self.spool.close()
+        if write_client is not None: write_client.close()
+
+    # line protocol of the latest snapshots with the precompiled series keys,
+    # and of the closed windows of the aggregated devices
+    def make_lines(self, snaps: List[Snapshot]) -> List[str]:
+        if self.normalize:
+            for i, u in enumerate(self.units()):
+                if u is not None and self.serializer.conv[i] is None: self.serializer.set_units(i, u)
+        if self.aggregator is None: return self.serializer.lines(snaps, self.stale_t)
+        if self.keep_raw: self.open_raw_logs()
+        aggs = self.aggregator.drain(ready=self.serializer.ready())
+        return (self.serializer.lines(snaps, self.stale_t, [w > 0 for w in self.dev_window]) +
+                self.serializer.aggregate_lines(aggs))
+
+    # raw log of each aggregated device, from the time its units are known
+    def open_raw_logs(self):
+        for i, u in enumerate(self.units()):
+            if self.dev_window[i] <= 0 or u is None or self.aggregator.loggers[i] is not None: continue
+            try:
+                os.makedirs(self.log_path, exist_ok=True)
+                self.aggregator.loggers[i] = BinLogger(self.devs[i], u, self.log_path)
+            except OSError as e:
+                print(f"Error in open_raw_logs: {str(e)}")
+                self.keep_raw = False
+
+    # points of the latest snapshots (reference of make_lines, see the benchmark in lineproto)
+    # the time of a point is the acquisition time of the snapshot, which is
+    # written once; a device whose snapshot is older than stale_t has a point
+    # Stale=True at the current time (False once when it is fresh again)
+    def make_points(self, snaps: List[Snapshot]) -> List[Point]:
         points = []
-        for th, tag in zip(ths, self.tag_dev):
-            ptm, pta, ptb = Point("Measure"), Point("State"), Point("Status")
-            for k, v in tag.items(): 
-                ptm = ptm.tag(k, v)
-                pta = pta.tag(k, v)
-                ptb = ptb.tag(k, v)
-            points += [ptm.tag("dev", th.dev.name).tag("channel", i).field("value", float(m)) for i, m in enumerate(th.meas)]
-            points += [pta.tag("dev", th.dev.name).tag("channel", i).field("value", m) for i, m in enumerate(th.state)]
-            points += [ptb.tag("dev", th.dev.name).tag("channel", i).field("value", m) for i, m in enumerate(th.status)]
+        now = time.time()
+        for d, (snap, tag) in enumerate(zip(snaps, self.tag_dev)):
+            if snap is None: continue # not acquired yet
+            stale = now - snap.time > self.stale_t
+            if stale or self.stale[d]:
+                pt = Point("Stale")
+                for k, v in self.tag_gen.items(): pt.tag(k, v)
+                for k, v in tag.items(): pt.tag(k, v)
+                points.append(pt.tag("dev", snap.name).field("value", stale).time(int(now*1e9), WritePrecision.NS))
+                self.stale[d] = stale
+            if snap.time == self.sent_t[d]: continue # already written
+            self.sent_t[d] = snap.time
+            for meas, vals in [("Measure", [float(m) if m is not None else None for m in snap.meas]),
+                               ("State", snap.state), ("Status", snap.status)]:
+                for i, m in enumerate(vals):
+                    if m is None: continue # no valid reading
+                    pt = Point(meas)
+                    for k, v in self.tag_gen.items(): pt.tag(k, v)
+                    for k, v in tag.items(): pt.tag(k, v)
+                    pt.tag("dev", snap.name).tag("channel", i).field("value", m)
+                    points.append(pt.time(int(snap.time*1e9), WritePrecision.NS))
         return points
-        #print(len(points), points)
 
 class CMMSIS():
     
@@ -169,12 +390,18 @@ class CMMSIS():
         self.dev_n = 0
         self.sel_n = 0
         self.dev_list: List[List[str,SerMeasure,bool]] = [] #[['/dev/ttyUSB0', M1, True], ['/dev/ttyUSB1', M2, False]]
+        self.hwids: List[str] = [] # usb adapter of each device (serman.ProbeCache.key)
 
         self.tag_gen: Dict = {} #{'tagg':'t'}
         self.tag_dev: List[Dict] = [] # [{'taggen': 'tag1'}, {'taggen2': 'tag2'}]
         self.tag_chan: List[List[Dict]] = []
 
+        self.dev_freq: List[float] = []        # update period of each device (0 = freq)
+        self.chan_freq: List[List[float]] = [] # update periods of the measures (0 = device period)
+        self.dev_window: List[float] = []      # aggregation window of each device (0 = every sample)
+
         self.freq = 1.0 # [sec]
+        self.metrics_port = 9109 # localhost port of the prometheus endpoint (metrics.py, 0 = off)
         self.status = 0 # 0 = Idle, 1 = Running
         ########################################################
 
@@ -185,7 +412,8 @@ class CMMSIS():
                 'Influx Setting': ['URL', 'Token File', 'Organization', 'Bucket', 'Back'],
                 'Serial Setting': ['Port Update', 'Device Scan', 'Select', 'Back'],
                 'Tag Setting'   : ['General', 'Device', 'Channel', 'Back'],
-                'Run':            ['Frequency', 'Start', 'Stop', 'Back'],
+                'Run':            ['Frequency', 'Device Frequency', 'Window', 'Engine', 'Normalize',
+                                   'Change Only', 'Start', 'Stop', 'Back'],
             }
         ########################################################
         # WordCompleter를 사용하여 자동 완성을 설정합니다.
@@ -200,14 +428,22 @@ class CMMSIS():
         self.sender = InfluxSender()
         self.job = threading.Thread()
         self.update_submenu_info()
+        self.watcher = PortWatcher(self.sm)
+        self.watcher.subscribe(self.port_added, self.port_removed)
+        self.watcher.start()
 
     def update_submenu_info(self):
         self.submenu_info = {
                 'Influx Setting': [self.influx_url, self.influx_token, self.influx_org, self.influx_bucket, ''],
                 'Serial Setting': [f'{self.port_n} Ports', f'{self.dev_n} Available Devices', f'{self.sel_n} Selected Devices', ''],
                 'Tag Setting' : None,
-                'Run': [f'{self.freq} sec', ['<ansigreen>Idle</ansigreen>',
-                                             '<ansired>Running</ansired>'][self.status], '', '']}            
+                'Run': [f'{self.freq} sec', '', 'Raw log kept' if self.sender.keep_raw else '',
+                        'Asyncio' if self.sender.use_async else 'Thread',
+                        'SI units' if self.sender.normalize else 'Device units',
+                        f'Deadbands, heartbeat {self.sender.heartbeat:g} sec' if self.sender.change_only
+                        else 'Every sample',
+                        ['<ansigreen>Idle</ansigreen>',
+                         '<ansired>Running</ansired>'][self.status], '', '']}            
 
     def display_menu(self, menu_items, menu_infos = None, flag_idx = True, flag_title = False):
         print("\n", '=' * 30, 'CMMS: Influx Sender', '=' * 30)
@@ -255,22 +491,25 @@ class CMMSIS():
                 print(f'  {i:>2}. {x}')
             print(f'  {self.port_n} ports found.')
         elif choice == 'Device Scan':
-            dev_cl_list = self.sm.find_ports_class()
+            ports = self.sm.ports # the same list while the port watcher updates sm.ports
+            dev_cl_list = self.sm.find_ports_class(ports)
             self.dev_n = len(dev_cl_list) - dev_cl_list.count(None)
-            port_lists = self.sm.string_ports()
+            port_lists = self.sm.string_ports(ports=ports)
             print( ' Scanning the serial port devices.')
             self.dev_list = []
-            for i, (x, y) in enumerate(zip(port_lists, dev_cl_list), 1):
+            self.hwids = []
+            for i, (x, y, port) in enumerate(zip(port_lists, dev_cl_list, ports), 1):
                 if y is None: continue
                 print(f'  {i:>2}. {x}: {y.__name__}')
                 self.dev_list.append([x, y, False])
+                self.hwids.append(ProbeCache.key(port))
             print(f'  {self.dev_n} devices found.')
             #######################################################################
             # tag-related arrays
             while len(self.tag_dev) < len(self.dev_list): self.tag_dev.append({})
             while len(self.tag_chan) < len(self.dev_list): self.tag_chan.append([])
             for i, dev in enumerate(self.dev_list):
-                tags = self.tag_chan[i-1]
+                tags = self.tag_chan[i]
                 n = dev[1].n_meas + dev[1].n_status + dev[1].n_state
                 while len(tags) < n: tags.append({})
             #######################################################################
@@ -386,6 +625,67 @@ class CMMSIS():
                     print('Wrong choice. Try again.')        
         elif choice == 'Frequency':
             self.freq = float(prompt('Input a update period: ', validator=float_validator))
+        elif choice == 'Device Frequency':
+            if len(self.dev_list) == 0:
+                return
+            while len(self.dev_freq) < len(self.dev_list): self.dev_freq.append(0.)
+            while len(self.chan_freq) < len(self.dev_list): self.chan_freq.append([])
+            while True:
+                self.display_menu([(f'{x[0]:<20}: {x[1].__name__:<10} => (' + ('O' if x[2] else 'X') + 
+                                    f'), Period: {self.dev_freq[idx] or self.freq} sec, ' +
+                                    f'Channels: {self.chan_freq[idx]}') 
+                                    for idx, x in enumerate(self.dev_list)])
+                sel = prompt(' Set a period: <device> <sec> or <device> <measure> <sec> ("0" for Back): ').split()
+                if len(sel) == 0: continue
+                if sel[0] == '0' or sel[0] == 'Back':
+                    break
+                elif len(sel) == 2 and sel[0].isdecimal() and 1 <= int(sel[0]) <= len(self.dev_list) \
+                     and is_float(sel[1]):
+                    self.dev_freq[int(sel[0])-1] = float(sel[1])
+                elif len(sel) == 3 and sel[0].isdecimal() and 1 <= int(sel[0]) <= len(self.dev_list) \
+                     and sel[1].isdecimal() and 1 <= int(sel[1]) <= self.dev_list[int(sel[0])-1][1].n_meas \
+                     and is_float(sel[2]):
+                    chans = self.chan_freq[int(sel[0])-1]
+                    while len(chans) < self.dev_list[int(sel[0])-1][1].n_meas: chans.append(0.)
+                    chans[int(sel[1])-1] = float(sel[2])
+                else:
+                    print('Wrong choice. Try again.')
+        elif choice == 'Window':
+            if len(self.dev_list) == 0:
+                return
+            while len(self.dev_window) < len(self.dev_list): self.dev_window.append(0.)
+            while True:
+                self.display_menu([(f'{x[0]:<20}: {x[1].__name__:<10} => (' + ('O' if x[2] else 'X') +
+                                    f'), Window: {self.dev_window[idx] or "off"}' +
+                                    (' sec' if self.dev_window[idx] else ''))
+                                    for idx, x in enumerate(self.dev_list)] +
+                                  [f'Raw log of the aggregated devices: {"on" if self.sender.keep_raw else "off"}'])
+                sel = prompt(' Set a window: <device> <sec> (0 sec = off), "r" for the raw log ("0" for Back): ').split()
+                if len(sel) == 0: continue
+                if sel[0] == '0' or sel[0] == 'Back':
+                    break
+                elif sel[0] == 'r' or sel[0] == 'R':
+                    self.sender.keep_raw = not self.sender.keep_raw
+                elif len(sel) == 2 and sel[0].isdecimal() and 1 <= int(sel[0]) <= len(self.dev_list) \
+                     and is_float(sel[1]):
+                    self.dev_window[int(sel[0])-1] = float(sel[1])
+                else:
+                    print('Wrong choice. Try again.')
+        elif choice == 'Engine':
+            if self.job.is_alive():
+                print(' Sender is running.')
+            else:
+                self.sender.use_async = not self.sender.use_async
+        elif choice == 'Normalize':
+            if self.job.is_alive():
+                print(' Sender is running.')
+            else:
+                self.sender.normalize = not self.sender.normalize
+        elif choice == 'Change Only':
+            if self.job.is_alive():
+                print(' Sender is running.')
+            else:
+                self.sender.change_only = not self.sender.change_only
         elif choice == 'Start':
             if self.job.is_alive():
                 print(' Sender is running.')
@@ -394,7 +694,11 @@ class CMMSIS():
                     print('No selcted devices.')
                     return
                 self.sender.set_influx_setting(self.influx_url, self.influx_token, self.influx_org, self.influx_bucket)
-                self.sender.set_device_setting(self.freq, self.dev_list, self.tag_gen, self.tag_dev, self.tag_chan)
+                while len(self.dev_freq) < len(self.dev_list): self.dev_freq.append(0.)
+                while len(self.chan_freq) < len(self.dev_list): self.chan_freq.append([])
+                while len(self.dev_window) < len(self.dev_list): self.dev_window.append(0.)
+                self.sender.set_device_setting(self.freq, self.dev_list, self.tag_gen, self.tag_dev, self.tag_chan,
+                                               self.dev_freq, self.chan_freq, None, self.dev_window)
 
                 self.job = threading.Thread(target=self.sender.write_influx)
                 self.job.start()
@@ -416,7 +720,31 @@ class CMMSIS():
             pass
         self.update_submenu_info()
 
+    #########################################
+    # hot-plug events (in the thread of the port watcher)
+    #
+    # a device comes back by the hwid of its adapter, also on a renamed port
+    def port_added(self, port, cl):
+        self.sm.add_port(port)
+        self.port_n = self.sm.n_ports()
+        print(f' Port {port.device} added' + (f': {cl.__name__}' if cl is not None else ''))
+        key = ProbeCache.key(port)
+        for dev, hwid in zip(self.dev_list, self.hwids):
+            if hwid != key: continue
+            old, dev[0] = dev[0], port.device
+            if self.job.is_alive() and dev[2]: self.sender.attach(old, port.device)
+        self.update_submenu_info()
+
+    def port_removed(self, port):
+        self.sm.remove_port(port.device)
+        self.port_n = self.sm.n_ports()
+        print(f' Port {port.device} removed')
+        if self.job.is_alive(): self.sender.detach(port.device)
+        self.update_submenu_info()
+    #########################################
+
     def main(self):
+        server = metrics.serve(self.metrics_port) if self.metrics_port > 0 else None
         while True:
             self.display_menu(self.main_menu_items)
             try:
@@ -447,6 +775,8 @@ class CMMSIS():
             except EOFError:
                 break
 
+        self.watcher.stop()
+        if server is not None: server.shutdown()
         if self.job.is_alive(): 
             self.sender.running = False
             self.job.join()
@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+
+import math
+from typing import Dict, List
+from sermeasure import SerMeasure, UnitType
+
+###################################################
+# deadband of a measure channel
+#
+#   abs: |x - last| > width                 (device units, or SI if normalized)
+#   rel: |x - last| > width*|last|
+#   log: |log10(x/last)| > width [decades]  (pressures over many decades)
+#
+# last is the last written value, so a slow drift is written when it
+# has moved by the width; a width of 0 writes every change
+class Deadband:
+    __slots__ = ['kind', 'width']
+    kinds = ['abs', 'rel', 'log']
+
+    def __init__(self, kind: str = 'abs', width: float = 0.):
+        if kind not in self.kinds: raise ValueError(f'unknown deadband {kind}')
+        self.kind = kind
+        self.width = width
+
+    # spec: {'abs': 0.01}, {'rel': 0.001} or {'log': 0.002}; {} = default
+    @classmethod
+    def parse(cls, spec: Dict):
+        if not spec: return None
+        try:
+            (kind, width), = spec.items()
+            return cls(kind, float(width))
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Error in Deadband: {str(e)}")
+            return None
+
+    def exceeded(self, last: float, x: float) -> bool:
+        if self.kind == 'abs': return abs(x - last) > self.width
+        if self.kind == 'rel': return abs(x - last) > self.width*abs(last)
+        if x <= 0 or last <= 0: return x != last
+        return abs(math.log10(x/last)) > self.width
+
+    def __repr__(self):
+        return f'{{{self.kind}: {self.width}}}'
+
+# deadbands of the channels without their own setting
+type_default = {UnitType.Pres: Deadband('log', 0.001),  # 0.23 %
+                UnitType.Temp: Deadband('abs', 0.001),  # 1 mK
+                UnitType.Perc: Deadband('rel', 0.001)}
+
+###################################################
+# change-only emission of the series of the devices
+#
+# a measure is written when it leaves the deadband of the last written value,
+# a state or a status when it changes; every series is written at least
+# once per heartbeat [sec] of acquisition time (so that it stays alive in
+# the dashboards)
+#
+# chan_deadband: deadband specs of the measures of each device (see Deadband.parse)
+class ChangeFilter:
+    def __init__(self, devs: List[SerMeasure], chan_deadband: List[List[Dict]] = None,
+                 heartbeat: float = 60.):
+        self.heartbeat = heartbeat
+        self.bands: List[List[Deadband]] = []
+        self.last = [] # per device: (value, time) of the measures, states and statuses
+        for i, dev in enumerate(devs):
+            specs = chan_deadband[i] if chan_deadband is not None and i < len(chan_deadband) else []
+            types = getattr(dev, 'type', [])
+            bands = []
+            for ch in range(dev.n_meas):
+                band = Deadband.parse(specs[ch]) if ch < len(specs) else None
+                if band is None and ch < len(types): band = type_default.get(types[ch])
+                bands.append(band if band is not None else Deadband())
+            self.bands.append(bands)
+            self.last.append((dev.n_meas*[None], dev.n_state*[None], dev.n_status*[None]))
+        self.n_seen, self.n_kept = 0, 0
+
+    # kind: 0 = measure, 1 = state, 2 = status
+    def keep(self, i: int, kind: int, ch: int, x, t: float) -> bool:
+        self.n_seen += 1
+        last = self.last[i][kind][ch]
+        if last is not None and t - last[1] < self.heartbeat:
+            if kind == 0: changed = self.bands[i][ch].exceeded(last[0], x)
+            else:         changed = x != last[0]
+            if not changed: return False
+        self.last[i][kind][ch] = (x, t)
+        self.n_kept += 1
+        return True
+
+    # fraction of the samples not written
+    def reduction(self) -> float:
+        return 1 - self.n_kept/self.n_seen if self.n_seen > 0 else 0.
+
+if __name__=="__main__":
+    # a day at 1 Hz: a pressure pumping down with 0.1 % noise, two temperatures
+    # stable within 0.5 mK, one state and one status (as a TIC100 and a LS335)
+    import random, time
+    from sermeasure import Snapshot
+    from lineproto import LineSerializer
+    class Dev:
+        n_meas, n_state, n_status = 3, 1, 1
+        type = [UnitType.Pres, UnitType.Temp, UnitType.Temp]
+        name = 'dev'
+    rand = random.Random(1)
+    devs = [Dev()]
+    ser = LineSerializer({}, [{}], [], devs)
+    ser.filter = ChangeFilter(devs)
+    n_all = 0
+    t0 = time.perf_counter()
+    for k in range(86400):
+        p = (1e-7 + 1e3*math.exp(-k/600))*(1 + 0.001*rand.uniform(-1, 1))
+        T = [4.2 + 0.0005*rand.uniform(-1, 1), 40. + 0.0005*rand.uniform(-1, 1)]
+        snap = Snapshot('dev', [p] + T, ['Running' if k > 60 else 'Starting'], [False], float(k))
+        n_all += 5
+        ser.lines([snap])
+    f = ser.filter
+    print(f'{f.n_kept}/{n_all} samples written, reduction {f.reduction()*100:.1f} %, '
+          f'{(time.perf_counter() - t0)/86400*1e6:.1f} us per snapshot')
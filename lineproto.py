@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+
+import time, math
+from typing import Dict, List
+from sermeasure import SerMeasure, Snapshot
+import units
+
+###################################################
+# influxdb line protocol
+#
+# measurement,tag1=v1,tag2=v2 field=value timestamp
+def escape_measurement(s: str) -> str:
+    return s.replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ')
+
+def escape_key(s: str) -> str:
+    return escape_measurement(s).replace('=', '\\=')
+
+def format_field(v) -> str:
+    if isinstance(v, bool): return 'true' if v else 'false'
+    if isinstance(v, int):  return f'{v}i'
+    if isinstance(v, float): return repr(v)
+    return '"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+# 'measurement,tags value=' with the tags sorted by key
+def series_key(measurement: str, tags: Dict) -> str:
+    s = escape_measurement(measurement)
+    for k in sorted(tags):
+        if str(tags[k]) == '': continue # influxdb does not accept empty tag values
+        s += ',' + escape_key(str(k)) + '=' + escape_key(str(tags[k]))
+    return s + ' value='
+
+###################################################
+# precompiled serializer of the snapshots
+#
+# the series key of each channel (measurement + general, device and channel
+# tags) is built once, and only the field value and the timestamp are
+# appended per sample
+#
+# tag_chan of a device: tags of the measures, then the statuses, then the states
+#
+# normalize: the measures are converted to the SI unit of their type (units.py)
+#            once the units of the device are known (set_units), and not
+#            written until then
+#
+# filter: deadband.ChangeFilter for change-only emission (None = every sample)
+#
+# a snapshot is written once at its acquisition time; the staleness of a
+# device is the series Stale (value=true at the time of writing while its
+# latest snapshot is older than stale_t, false once when it is fresh again),
+# so the points of a snapshot are never rewritten
+class LineSerializer:
+    def __init__(self, tag_gen: Dict, tag_dev: List[Dict], tag_chan: List[List[Dict]],
+                 devs: List[SerMeasure], normalize: bool = False):
+        self.normalize = normalize
+        self.filter = None
+        self.conv = len(devs) * [None] # (scale, offset) of each measure to SI
+        self.sent = len(devs) * [None] # time of the last snapshot written
+        self.stale = len(devs) * [False]
+        self.keys = []
+        self.stale_keys = []
+        for i, dev in enumerate(devs):
+            dtag = tag_dev[i] if i < len(tag_dev) else {}
+            ctag = tag_chan[i] if i < len(tag_chan) else []
+            def key(measurement, ch, k):
+                tags = {**tag_gen, **dtag, **(ctag[k] if k < len(ctag) else {}),
+                        'dev': dev.name, 'channel': ch}
+                return series_key(measurement, tags)
+            self.keys.append(([key('Measure', ch, ch) for ch in range(dev.n_meas)],
+                              [key('State',   ch, dev.n_meas + dev.n_status + ch) for ch in range(dev.n_state)],
+                              [key('Status',  ch, dev.n_meas + ch) for ch in range(dev.n_status)]))
+            self.stale_keys.append(series_key('Stale', {**tag_gen, **dtag, 'dev': dev.name}))
+
+    # the units are kept only if every one converts (see units.checked)
+    def set_units(self, i: int, u: List[str]) -> bool:
+        conv = [units.factors(x, units.si_unit(x)) for x in u]
+        if not all(math.isfinite(a) and math.isfinite(b) for a, b in conv): return False
+        self.conv[i] = conv
+        return True
+
+    # lines of the snapshots not written yet, and of the staleness of the
+    # devices whose snapshot is older than stale_t
+    # aggregated: devices written by aggregate_lines, only their staleness here
+    def lines(self, snaps: List[Snapshot], stale_t: float = None, aggregated: List[bool] = None) -> List[str]:
+        lines = []
+        now = time.time()
+        f = self.filter
+        for i, ((kmeas, kstate, kstatus), snap, conv) in enumerate(zip(self.keys, snaps, self.conv)):
+            if snap is None: continue # not acquired yet
+            stale = stale_t is not None and now - snap.time > stale_t
+            if stale or self.stale[i]:
+                lines.append(self.stale_keys[i] + ('true ' if stale else 'false ') + str(int(now*1e9)))
+                self.stale[i] = stale
+            if aggregated is not None and aggregated[i]: continue
+            if snap.time == self.sent[i]: continue # already written
+            tail = ' ' + str(int(snap.time*1e9))
+            meas = snap.meas
+            if self.normalize:
+                if conv is None: meas = [] # units not known yet: written again with them
+                else: meas = [a*m + b if m is not None else None for (a, b), m in zip(conv, meas)]
+            if not self.normalize or conv is not None: self.sent[i] = snap.time
+            if f is None:
+                lines += [k + repr(float(m)) + tail for k, m in zip(kmeas, meas)
+                          if m is not None and math.isfinite(m)] # nan and inf are not accepted
+                lines += [k + format_field(str(m)) + tail for k, m in zip(kstate, snap.state)]
+                lines += [k + ('true' if m else 'false') + tail for k, m in zip(kstatus, snap.status)]
+                continue
+            t = snap.time
+            lines += [k + repr(float(m)) + tail for ch, (k, m) in enumerate(zip(kmeas, meas))
+                      if m is not None and math.isfinite(m) and f.keep(i, 0, ch, m, t)]
+            lines += [k + format_field(str(m)) + tail for ch, (k, m) in enumerate(zip(kstate, snap.state))
+                      if f.keep(i, 1, ch, m, t)]
+            lines += [k + ('true' if m else 'false') + tail for ch, (k, m) in enumerate(zip(kstatus, snap.status))
+                      if f.keep(i, 2, ch, m, t)]
+        return lines
+
+    # lines of the closed windows of aggregate.WindowAggregator: the mean in
+    # the field value (the same series as the raw samples) with min, max,
+    # count and last, or the last state or status with the count, at the
+    # end of the window
+    # with normalize, the windows of a device are drained once its units are
+    # known (see ready); without them (the last flush) the measures are left out
+    def aggregate_lines(self, aggs) -> List[str]:
+        lines = []
+        for i, agg in aggs:
+            kmeas, kstate, kstatus = self.keys[i]
+            conv = self.conv[i] if self.normalize else len(agg.meas)*[(1., 0.)]
+            if conv is None: conv = []
+            tail = ' ' + str(int(agg.end*1e9))
+            for k, acc, (a, b) in zip(kmeas, agg.meas, conv):
+                if acc.n == 0: continue
+                lines.append(k + repr(a*acc.mean + b) + ',min=' + repr(a*acc.min + b) + ',max=' +
+                             repr(a*acc.max + b) + f',count={acc.n}i,last=' + repr(a*acc.last + b) + tail)
+            count = f',count={agg.n}i'
+            lines += [k + format_field(str(m)) + count + tail for k, m in zip(kstate, agg.state)]
+            lines += [k + ('true' if m else 'false') + count + tail for k, m in zip(kstatus, agg.status)]
+        return lines
+
+    # devices whose measures can be written (their units are known with normalize)
+    def ready(self) -> List[bool]:
+        return [not self.normalize or x is not None for x in self.conv]
+
+###################################################
+# benchmark: Point objects (InfluxSender.make_points) vs precompiled keys
+if __name__=="__main__":
+    from dataclasses import replace
+    from m1 import M1, M2, M3
+    from cmmsis import InfluxSender
+    n_dev, n_cycle = 30, 200
+    devs = [[M1, M2, M3][i % 3](f'dev{i}', f'/dev/ttyUSB{i}') for i in range(n_dev)]
+    tag_gen = {'site': 'CENS', 'room': 'exp1'}
+    tag_dev = [{'system': f's{i % 4}', 'rack': 'r1'} for i in range(n_dev)]
+    tag_chan = [[{'sensor': f'c{k}'} for k in range(dev.n_meas + dev.n_state + dev.n_status)] for dev in devs]
+    snaps = [dev.ReadAll() for dev in devs]
+    n_pts = sum(len(s.meas) + len(s.state) + len(s.status) for s in snaps)
+    cycles = [[replace(s, time=s.time + k) for s in snaps] for k in range(n_cycle)] # a snapshot is written once
+
+    sender = InfluxSender()
+    sender.set_device_setting(1., [['', type(dev), True] for dev in devs], tag_gen, tag_dev, tag_chan)
+    t = time.perf_counter()
+    for x in cycles: [pt.to_line_protocol() for pt in sender.make_points(x)]
+    t_old = time.perf_counter() - t
+
+    ser = LineSerializer(tag_gen, tag_dev, tag_chan, devs)
+    t = time.perf_counter()
+    for x in cycles: ser.lines(x)
+    t_new = time.perf_counter() - t
+
+    print(f'Point objects     : {n_pts*n_cycle/t_old:12.0f} points/s')
+    print(f'Precompiled keys  : {n_pts*n_cycle/t_new:12.0f} points/s')
@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+
+import glob, gzip, json, mmap, os, struct, sys, time, datetime as dt
+import numpy as np
+from bisect import bisect_right
+from typing import Dict, List
+from binlog import MAGIC, REC_DATA, REC_STR, STR_HEAD, read_header
+from sermeasure_list import drivers
+import units
+
+###################################################
+# time-indexed reader of the acquisition logs
+#
+# a sparse index (time -> offset of every step-th record) is built once and
+# cached beside the log as <log>.idx; a range query bisects the index and
+# seeks to the first record instead of scanning the file
+#
+# binary logs (binlog.py, .cmms or .cmms.gz) and the former text logs (.txt)
+# are supported; uncompressed files are memory-mapped, compressed ones are
+# decompressed in memory (BinLogger does not compress by default)
+#
+# a text log line is 'yyyy-MM-dd hh:mm:ss meas... states... statuses...'; the
+# channel counts are those of the driver in the file name (sermeasure_list),
+# or guessed from the first line for an unknown driver
+class LogReader:
+    step = 1024 # records per index entry
+    chunk = 1 << 16 # records decoded at once
+
+    def __init__(self, fname: str):
+        self.fname = fname
+        self.binary = '.cmms' in fname
+        self.f = open(fname, 'rb')
+        if fname.endswith('.gz'):
+            with gzip.open(fname, 'rb') as f: self.data = f.read()
+        elif os.path.getsize(fname) > 0:
+            self.data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        else: self.data = b''
+        if self.binary:
+            self.head = read_header(_Bytes(self.data))
+            self.n_meas, self.n_state, self.n_status = \
+                self.head['n_meas'], self.head['n_state'], self.head['n_status']
+            self.dtype = np.dtype([('k', 'S1'), ('t', '<f8'), ('m', '<f4', (self.n_meas,)),
+                                   ('s', '<u2', (self.n_state,)), ('b', '<u4')])
+        else:
+            self.head = {}
+            drv = drivers.get(os.path.basename(fname).split('_')[0])
+            self.n_meas, self.n_state, self.n_status = \
+                (drv.n_meas, drv.n_state, drv.n_status) if drv is not None else (None, None, None)
+        self.load_index()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap): self.data.close()
+        self.f.close()
+
+    #########################################
+    # index
+    def idx_name(self):
+        return self.fname + '.idx'
+
+    def load_index(self):
+        self.t_idx, self.off_idx = [], []
+        self.strings: Dict[int, str] = {}
+        self.end = self.first_offset() # offset up to which the file is indexed
+        self.n_rec = 0
+        try:
+            with open(self.idx_name()) as f: idx = json.load(f)
+            if idx['size'] <= len(self.data) and idx['step'] == self.step:
+                self.t_idx, self.off_idx, self.end, self.n_rec = idx['t'], idx['off'], idx['end'], idx['n']
+                self.strings = {int(k): v for k, v in idx['strings'].items()}
+        except (OSError, ValueError, KeyError):
+            pass
+        if self.end < len(self.data): # new file or it has grown
+            self.build_index()
+            self.save_index()
+
+    def save_index(self):
+        try:
+            with open(self.idx_name(), 'w') as f:
+                json.dump({'size': len(self.data), 'step': self.step, 'end': self.end, 'n': self.n_rec,
+                           't': self.t_idx, 'off': self.off_idx, 'strings': self.strings}, f)
+        except OSError as e:
+            print(f"Error in save_index: {str(e)}")
+
+    def first_offset(self):
+        if not self.binary: return 0
+        n, = struct.unpack_from('<I', self.data, len(MAGIC))
+        return len(MAGIC) + 4 + n
+
+    def build_index(self):
+        for t, off in self.scan_records(self.end):
+            if self.n_rec % self.step == 0:
+                self.t_idx.append(t)
+                self.off_idx.append(off)
+            self.n_rec += 1
+
+    # (time, offset) of the records from off, and self.end after the last complete one
+    def scan_records(self, off: int):
+        data, n = self.data, len(self.data)
+        if self.binary:
+            size = self.dtype.itemsize
+            while off < n:
+                if data[off:off+1] == REC_STR:
+                    if off + 1 + STR_HEAD.size > n: break
+                    i, k = STR_HEAD.unpack_from(data, off + 1)
+                    self.strings[i] = bytes(data[off+1+STR_HEAD.size:off+1+STR_HEAD.size+k]).decode('utf8')
+                    off += 1 + STR_HEAD.size + k
+                elif data[off:off+1] == REC_DATA:
+                    if off + size > n: break
+                    yield struct.unpack_from('<d', data, off + 1)[0], off
+                    off += size
+                else: break
+                self.end = off
+        else:
+            while off < n:
+                e = data.find(b'\n', off)
+                if e < 0: break
+                t = parse_time(data[off:off+19])
+                if t is not None: yield t, off
+                off = self.end = e + 1
+    #########################################
+
+    #########################################
+    # range query
+    #
+    # ch  : measure channel, or 'state<i>' / 'status<i>'
+    # unit: unit of the returned measures (units.py), None = as logged
+    #       (the text logs do not record their units)
+    # return: (times, values) as numpy arrays
+    def read(self, ch = 0, t0: float = None, t1: float = None, unit: str = None):
+        if t0 is None: t0 = -np.inf
+        if t1 is None: t1 = np.inf
+        i = max(0, bisect_right(self.t_idx, t0) - 1)
+        off = self.off_idx[i] if i < len(self.off_idx) else self.end
+        if self.binary: t, v = self.read_binary(ch, off, t1)
+        else:           t, v = self.read_text(ch, off, t1)
+        sel = (t >= t0) & (t <= t1)
+        t, v = t[sel], v[sel]
+        if unit is not None and isinstance(ch, int): v = units.convert(v, self.unit(ch), unit)
+        return t, v
+
+    def unit(self, ch: int) -> str:
+        u = self.head.get('units', [])
+        return u[ch] if ch < len(u) else ''
+
+    def read_binary(self, ch, off: int, t1: float):
+        ts, vs = [], []
+        data, end, size = self.data, self.end, self.dtype.itemsize
+        while off < end:
+            if data[off:off+1] == REC_STR:
+                i, k = STR_HEAD.unpack_from(data, off + 1)
+                off += 1 + STR_HEAD.size + k
+                continue
+            # a run of data records, vectorized until the next string record
+            n = min((end - off) // size, self.chunk)
+            recs = np.frombuffer(data, self.dtype, n, off)
+            bad = np.nonzero(recs['k'] != REC_DATA)[0]
+            if len(bad) > 0: recs = recs[:bad[0]]
+            stop = np.searchsorted(recs['t'], t1, side='right')
+            ts.append(recs['t'][:stop])
+            vs.append(self.column(recs[:stop], ch))
+            if stop < len(recs): break
+            off += len(recs) * size
+        if len(ts) == 0: return np.zeros(0), np.zeros(0)
+        return np.concatenate(ts), np.concatenate(vs)
+
+    def column(self, recs, ch):
+        if isinstance(ch, int): return recs['m'][:, ch].astype(np.float64)
+        if ch.startswith('state'):
+            return np.array([self.strings.get(x, '') for x in recs['s'][:, int(ch[5:])]], dtype=object)
+        return (recs['b'] >> int(ch[6:])) & 1 == 1
+
+    def read_text(self, ch, off: int, t1: float):
+        ts, vs = [], []
+        data = self.data
+        while off < self.end:
+            e = data.find(b'\n', off)
+            line = bytes(data[off:e]).decode('utf8').split()
+            off = e + 1
+            t = parse_time(' '.join(line[:2]).encode())
+            if t is None: continue
+            if t > t1: break
+            cols = line[2:]
+            if self.n_meas is None: self.guess_columns(cols)
+            ts.append(t)
+            if isinstance(ch, int):        vs.append(float(cols[ch]))
+            elif ch.startswith('state'):   vs.append(cols[self.n_meas + int(ch[5:])])
+            else:                          vs.append(cols[self.n_meas + self.n_state + int(ch[6:])] == 'True')
+        return np.array(ts), np.array(vs, dtype=object if isinstance(ch, str) and ch.startswith('state') else None)
+
+    # trailing True/False columns are the statuses, leading numbers the measures
+    def guess_columns(self, cols: List[str]):
+        self.n_status = 0
+        while self.n_status < len(cols) and cols[-1 - self.n_status] in ['True', 'False']: self.n_status += 1
+        self.n_meas = 0
+        for x in cols[:len(cols) - self.n_status]:
+            try: float(x)
+            except ValueError: break
+            self.n_meas += 1
+        self.n_state = len(cols) - self.n_status - self.n_meas
+
+    #########################################
+    # min/max/mean per bucket of dt seconds
+    def downsample(self, ch = 0, t0: float = None, t1: float = None, dt: float = 60., unit: str = None):
+        return downsample(*self.read(ch, t0, t1, unit), dt)
+
+def downsample(t: np.ndarray, v: np.ndarray, dt: float):
+    if len(t) == 0: return {'t': t, 'min': v, 'max': v, 'mean': v}
+    b = np.floor((t - t[0])/dt).astype(np.int64)
+    starts = np.concatenate([[0], np.nonzero(np.diff(b))[0] + 1])
+    v = v.astype(np.float64)
+    count = np.diff(np.concatenate([starts, [len(v)]]))
+    return {'t': t[0] + b[starts]*dt,
+            'min': np.minimum.reduceat(v, starts),
+            'max': np.maximum.reduceat(v, starts),
+            'mean': np.add.reduceat(v, starts)/count}
+
+# 'yyyy-MM-dd hh:mm:ss' at the beginning of a text log line
+def parse_time(b: bytes):
+    try: return dt.datetime.strptime(b[:19].decode(), '%Y-%m-%d %H:%M:%S').timestamp()
+    except (ValueError, UnicodeDecodeError): return None
+
+# file-like access to the header of a mapped log
+class _Bytes:
+    def __init__(self, data): self.data, self.pos = data, 0
+    def read(self, n):
+        r = bytes(self.data[self.pos:self.pos+n])
+        self.pos += n
+        return r
+
+###################################################
+# read a channel from all the (rotated) logs of a device
+#   files: e.g. glob.glob('log/TIC100_TIC1000_*')
+def read_logs(files: List[str], ch = 0, t0: float = None, t1: float = None, dt: float = None,
+              unit: str = None):
+    ts, vs = [], []
+    for fname in sorted(x for x in files if not x.endswith('.idx')):
+        r = LogReader(fname)
+        t, v = r.read(ch, t0, t1, unit)
+        r.close()
+        ts.append(t)
+        vs.append(v)
+    if len(ts) == 0: return np.zeros(0), np.zeros(0)
+    t, v = np.concatenate(ts), np.concatenate(vs)
+    order = np.argsort(t, kind='stable')
+    t, v = t[order], v[order]
+    return downsample(t, v, dt) if dt is not None else (t, v)
+
+if __name__=="__main__":
+    if len(sys.argv) < 2: print('Usage: logreader.py "log/<Class>_<name>_*" [channel] [bucket sec] [unit]')
+    else:
+        t = time.perf_counter()
+        r = read_logs(glob.glob(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 0,
+                      dt=float(sys.argv[3]) if len(sys.argv) > 3 and float(sys.argv[3]) > 0 else None,
+                      unit=sys.argv[4] if len(sys.argv) > 4 else None)
+        n = len(r['t']) if isinstance(r, dict) else len(r[0])
+        print(f'{n} points in {time.perf_counter() - t:.3f} s')
@@ -2,7 +2,10 @@
 
 from serial import Serial, PARITY_ODD, SerialException, SerialTimeoutException
 from serial.tools.list_ports import comports
-from sermeasure import SerMeasure, UnitType
+from sermeasure import SerMeasure, UnitType, Snapshot
+from serasync import AioSerial
+import metrics
+import time
 
 class LS218(SerMeasure):
     vid_pid = (0x067B, 0x2303)
@@ -20,13 +23,10 @@ class LS218(SerMeasure):
         self.verbose = False
 
     def open(self):
-        try:
-            self.ser = Serial(self.port, baudrate=9600, 
-                                bytesize=7, stopbits=1, parity=PARITY_ODD,
-                                timeout=1, write_timeout=1) # default is okay
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in open: {str(e)}")
-            self.ser = None
+        self.ser = self.open_session(baudrate=9600, 
+                                     bytesize=7, stopbits=1, parity=PARITY_ODD,
+                                     timeout=self.timeout, write_timeout=self.timeout) # default is okay
+        if self.ser is None:
             self.ok = False
         else:
             self.ok = True
@@ -36,9 +36,7 @@ class LS218(SerMeasure):
     
     def close(self):
         if self.ser is None: return
-        try: self.ser.close()
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in close: {str(e)}")
+        self.close_session()
         self.ser = None
 
     def is_open(self):
@@ -59,6 +57,23 @@ class LS218(SerMeasure):
     def GetStatusName(self, i: int): pass
     def GetStatus(self, i: int):     pass
 
+    # all channels with one 'KRDG? 0' instead of one query per channel
+    def ReadAll(self):
+        t = time.time()
+        return Snapshot(self.name, self.parse_temps(self.query('KRDG? 0'), 'ReadAll'), [], [], t)
+
+    # temperatures of a 'KRDG? 0' answer, None for the channels without a
+    # valid reading (no answer or a malformed one), so they show as missing
+    def parse_temps(self, r, where: str):
+        if r is None: return self.n_meas * [None]
+        try: meas = [float(x) for x in r.split(',')]
+        except ValueError as e:
+            print(f"Error in {where}: {str(e)}")
+            metrics.count(self, 'naks')
+            self.ok = False
+            return self.n_meas * [None]
+        return (meas + self.n_meas * [None])[:self.n_meas]
+
     def get_mod_no(self):
         return self.query_idn()[1]
 
@@ -134,6 +149,7 @@ class LS218(SerMeasure):
         self.ok = True
         return True
 
+    @metrics.timed()
     def query(self, command):
         if self.command(command):
             try: r = self.ser.readline().decode('utf8').rstrip()
@@ -143,17 +159,49 @@ class LS218(SerMeasure):
                 self.close()
                 return None
             if self.verbose: print("The recieved string is: ", r)
-            self.close()
             if len(r) < 2: 
                 print(f"Error in query: No answer")
+                metrics.count(self, 'timeouts')
                 self.ok = False
+                self.close()
                 return None
+            self.close()
             return r
         else:
             self.close()
             return None
     #################################
 
+    #################################
+    # asyncio transactions (see serasync)
+    @metrics.timed()
+    async def aquery(self, command):
+        if command == '': return None
+        try:
+            aser = AioSerial.get(self.port, baudrate=9600,
+                                 bytesize=7, stopbits=1, parity=PARITY_ODD,
+                                 timeout=1, write_timeout=1)
+            async with aser.lock:
+                aser.reset_input_buffer()
+                aser.write( bytes(command + '\n', 'utf8') )
+                r = (await aser.readline()).decode('utf8').rstrip()
+        except (SerialException, SerialTimeoutException) as e:
+            print(f"Error in aquery: {str(e)}")
+            self.ok = False
+            return None
+        if len(r) < 2:
+            print(f"Error in aquery: No answer")
+            metrics.count(self, 'timeouts')
+            self.ok = False
+            return None
+        self.ok = True
+        return r
+
+    async def AReadAll(self):
+        t = time.time()
+        return Snapshot(self.name, self.parse_temps(await self.aquery('KRDG? 0'), 'AReadAll'), [], [], t)
+    #################################
+
 ################################################################################
 
 if __name__=="__main__":
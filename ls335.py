@@ -1,7 +1,8 @@
 #!/usr/bin/python3
 
 from lakeshore import Model335, generic_instrument
-from sermeasure import SerMeasure, UnitType
+from sermeasure import SerMeasure, UnitType, Snapshot
+import time
 
 class LS335(SerMeasure):
     chs = ['A', 'B']
@@ -14,21 +15,23 @@ class LS335(SerMeasure):
         self.ser = None
         self.ok = False
         print(f'LS335 with name: {self.name} and port: {self.port}  opened')
-        self.open()
+        self.tc = None # opened by the first transaction, after SerMan has set timeout
 
         self.verbose = False
 
     def open(self):
+        if self.tc is not None: return True
         try:
-            self.tc = Model335(com_port=self.port, baud_rate=57600)
-        except generic_instrument.InstrumentException:
+            self.tc = Model335(com_port=self.port, baud_rate=57600, timeout=self.timeout)
+        except (OSError, generic_instrument.InstrumentException) as e:
+            print(f"Error in open: {str(e)}")
             self.tc = None
             self.ok = False
         else: self.ok = True
         return self.ok
     
     def close(self):
-        if self.tc:  del self.tc
+        if self.tc: self.tc = None # a second close() must not fail
 
     def is_open(self):
         if self.tc == None:
@@ -59,6 +62,20 @@ class LS335(SerMeasure):
     def GetStatusName(self, i: int): pass
     def GetStatus(self, i: int):     pass
 
+    # all channels with one 'KRDG? 0' instead of one query per channel;
+    # a failed transaction gives None for every channel and reopens the port
+    # next time
+    def ReadAll(self):
+        t = time.time()
+        meas = self.n_meas * [None]
+        if self.open():
+            try: meas = (self.get_temp_all() + self.n_meas * [None])[:self.n_meas]
+            except (OSError, ValueError, generic_instrument.InstrumentException) as e:
+                print(f"Error in ReadAll: {str(e)}")
+                self.ok = False
+                self.close()
+        return Snapshot(self.name, meas, [], [], t)
+
     def get_mod_no(self):
         return self.tc.model_number
 
@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+
+import asyncio, functools, os, threading, time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from sermeasure import SerSession
+from serbus import SerBus
+
+###################################################
+# transaction metrics of the drivers
+#
+# histograms of the latency of the transaction primitives per device
+# (driver class and port), primitive (op) and command, counters of the
+# failed transactions, timeouts and NAKs, the transactions saved by the
+# cycle caches of the drivers, histograms of the acquisition cycles
+# and the port counters of SerSession and SerBus; render() writes them in the
+# prometheus text format and serve() exposes them on http://localhost:<port>/metrics
+#
+# a transaction costs two perf_counter() calls, a dict lookup and a bisect
+# (a few us, against milliseconds on the serial line); CMMS_METRICS=0
+# disables the recording
+enabled = os.environ.get('CMMS_METRICS', '1') != '0'
+buckets = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5.) # [sec]
+
+class Histogram:
+    __slots__ = ['counts', 'sum', 'count']
+
+    def __init__(self):
+        self.counts = (len(buckets) + 1)*[0] # the last one is +Inf
+        self.sum, self.count = 0., 0
+
+    def observe(self, x: float):
+        self.counts[bisect_left(buckets, x)] += 1
+        self.sum += x
+        self.count += 1
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.trans: Dict[Tuple[str, str, str, str], Histogram] = {}    # (driver, port, op, cmd)
+        self.failures: Dict[Tuple[str, str, str, str], int] = {}
+        self.counters: Dict[Tuple[str, str, str], int] = {}             # (name, driver, port)
+        self.gauges: Dict[Tuple[str, str, str], float] = {}             # (name, driver, port)
+        self.cycles: Dict[Tuple[str, str], Histogram] = {}              # (driver, port)
+
+    def observe(self, key: Tuple[str, str, str, str], dt: float, ok: bool):
+        with self.lock:
+            h = self.trans.get(key)
+            if h is None: h = self.trans[key] = Histogram()
+            h.observe(dt)
+            if not ok: self.failures[key] = self.failures.get(key, 0) + 1
+
+    def count(self, name: str, driver: str, port: str, n: int = 1):
+        with self.lock:
+            key = (name, driver, port)
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def gauge(self, name: str, driver: str, port: str, x: float):
+        with self.lock: self.gauges[(name, driver, port)] = x
+
+    def cycle(self, driver: str, port: str, dt: float):
+        with self.lock:
+            h = self.cycles.get((driver, port))
+            if h is None: h = self.cycles[(driver, port)] = Histogram()
+            h.observe(dt)
+
+    def clear(self):
+        with self.lock: self.trans, self.failures, self.counters, self.gauges, self.cycles = {}, {}, {}, {}, {}
+
+    #########################################
+    # prometheus text exposition format
+    def render(self) -> str:
+        out: List[str] = []
+        with self.lock:
+            trans = {k: (list(h.counts), h.sum, h.count) for k, h in self.trans.items()}
+            failures, counters, gauges = dict(self.failures), dict(self.counters), dict(self.gauges)
+            cycles = {k: (list(h.counts), h.sum, h.count) for k, h in self.cycles.items()}
+        tlab = ('driver', 'port', 'op', 'cmd')
+        histogram(out, 'cmms_transaction_seconds', 'latency of the serial transactions', tlab, trans)
+        out.append('# HELP cmms_transaction_failures_total transactions without a valid answer')
+        out.append('# TYPE cmms_transaction_failures_total counter')
+        for k, v in failures.items(): out.append(f'cmms_transaction_failures_total{labels(tlab, k)} {v}')
+        for name, what in [('timeouts', 'transactions without an answer in the timeout'),
+                           ('naks', 'negative acknowledgements or error answers'),
+                           ('saved', 'transactions saved by the cycle cache')]:
+            out.append(f'# HELP cmms_{name}_total {what}')
+            out.append(f'# TYPE cmms_{name}_total counter')
+            for (n, drv, port), v in counters.items():
+                if n == name: out.append(f'cmms_{name}_total{labels(("driver", "port"), (drv, port))} {v}')
+        for name, what in [('cycle_saved', 'transactions saved by the cycle cache in the last cycle')]:
+            out.append(f'# HELP cmms_{name} {what}')
+            out.append(f'# TYPE cmms_{name} gauge')
+            for (n, drv, port), v in gauges.items():
+                if n == name: out.append(f'cmms_{name}{labels(("driver", "port"), (drv, port))} {v}')
+        histogram(out, 'cmms_cycle_seconds', 'latency of the acquisition cycles', ('driver', 'port'), cycles)
+        stats = SerSession.stats()
+        for name, k, what in [('opens', 'open', 'openings of the port'),
+                              ('reconnects', 'reconnect', 'openings after an error'),
+                              ('open_seconds', 't_open', 'time spent in opening the port')]:
+            out.append(f'# HELP cmms_port_{name}_total {what}')
+            out.append(f'# TYPE cmms_port_{name}_total counter')
+            for port, s in stats.items(): out.append(f'cmms_port_{name}_total{labels(("port",), (port,))} {s[k]}')
+        # rate(cmms_bus_busy_seconds_total) is the utilization of a line
+        buses = SerBus.all_stats()
+        for name, k, what in [('busy_seconds', 't_busy', 'time the bus was busy with transactions'),
+                              ('wait_seconds', 't_wait', 'time the devices waited for a turn on the bus')]:
+            out.append(f'# HELP cmms_bus_{name}_total {what}')
+            out.append(f'# TYPE cmms_bus_{name}_total counter')
+            for port, s in buses.items(): out.append(f'cmms_bus_{name}_total{labels(("port",), (port,))} {s[k]}')
+        for name, k, what in [('transactions', 'transactions', 'transactions of an address on the bus'),
+                              ('timeouts', 'timeouts', 'transactions of an address without an answer')]:
+            out.append(f'# HELP cmms_bus_{name}_total {what}')
+            out.append(f'# TYPE cmms_bus_{name}_total counter')
+            for port, s in buses.items():
+                for a, v in s['addresses'].items():
+                    out.append(f'cmms_bus_{name}_total{labels(("port", "address"), (port, a))} {v[k]}')
+        return '\n'.join(out) + '\n'
+    #########################################
+
+def labels(names, values) -> str:
+    return '{' + ','.join('%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for n, v in zip(names, values)) + '}'
+
+def histogram(out: List[str], name: str, what: str, names, hists):
+    out.append(f'# HELP {name} {what}')
+    out.append(f'# TYPE {name} histogram')
+    for k, (counts, s, n) in hists.items():
+        acc = 0
+        for le, c in zip([str(x) for x in buckets] + ['+Inf'], counts):
+            acc += c
+            out.append(f'{name}_bucket{labels(names + ("le",), k + (le,))} {acc}')
+        out.append(f'{name}_sum{labels(names, k)} {s}')
+        out.append(f'{name}_count{labels(names, k)} {n}')
+
+registry = Registry()
+
+###################################################
+# instrumentation of the drivers
+#
+# @timed() on a transaction method (sync or async) of a SerMeasure: the
+# command label is the first argument (or cmd(*args) if given), and a call
+# which raises or after which the device is not ok counts as a failure
+def timed(cmd = None):
+    def deco(f):
+        op = f.__name__
+        def key(self, args):
+            c = cmd(*args) if cmd is not None else (str(args[0]) if len(args) > 0 else '')
+            return (type(self).__name__, str(self.port), op, c)
+        if asyncio.iscoroutinefunction(f):
+            @functools.wraps(f)
+            async def awrap(self, *args, **kwargs):
+                if not enabled: return await f(self, *args, **kwargs)
+                t, ok = time.perf_counter(), False
+                try:
+                    r = await f(self, *args, **kwargs)
+                    ok = bool(self.ok)
+                    return r
+                finally: registry.observe(key(self, args), time.perf_counter() - t, ok)
+            return awrap
+        @functools.wraps(f)
+        def wrap(self, *args, **kwargs):
+            if not enabled: return f(self, *args, **kwargs)
+            t, ok = time.perf_counter(), False
+            try:
+                r = f(self, *args, **kwargs)
+                ok = bool(self.ok)
+                return r
+            finally: registry.observe(key(self, args), time.perf_counter() - t, ok)
+        return wrap
+    return deco
+
+# name: 'timeouts', 'naks' or 'saved'
+def count(dev, name: str, n: int = 1):
+    if enabled: registry.count(name, type(dev).__name__, str(dev.port), n)
+
+# name: 'cycle_saved'
+def gauge(dev, name: str, x: float):
+    if enabled: registry.gauge(name, type(dev).__name__, str(dev.port), x)
+
+def cycle(dev, dt: float):
+    if enabled: registry.cycle(type(dev).__name__, str(dev.port), dt)
+
+###################################################
+# http endpoint, bound to localhost
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): pass
+
+# return: the server (shutdown() to stop it) or None if the port is not available
+def serve(port: int, host: str = '127.0.0.1'):
+    try: server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"Error in metrics.serve: {str(e)}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f'Metrics on http://{host}:{port}/metrics')
+    return server
+
+if __name__=="__main__":
+    class Dev:
+        port, ok = '/dev/null', True
+        @timed()
+        def query(self, command): return command
+    d = Dev()
+    n = 100000
+    t = time.perf_counter()
+    for _ in range(n): d.query('KRDG? 0')
+    print(f'{(time.perf_counter() - t)/n*1e6:.2f} us per instrumented call')
+    print(registry.render())
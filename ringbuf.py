@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+import numpy as np
+
+###################################################
+# preallocated ring buffer of (time, value) samples
+#
+# append is O(1) without allocation; data() returns the samples in time order
+class RingBuffer:
+    def __init__(self, n: int, dtype = np.float64):
+        self.t = np.zeros(n, np.float64)
+        self.v = np.full(n, np.nan, dtype)
+        self.n = n
+        self.i = 0      # next write position
+        self.count = 0  # number of samples held
+        self.total = 0  # number of samples ever appended
+
+    def append(self, t: float, v: float):
+        self.t[self.i] = t
+        self.v[self.i] = np.nan if v is None else v
+        self.i = (self.i + 1) % self.n
+        self.count = min(self.count + 1, self.n)
+        self.total += 1
+
+    def clear(self):
+        self.i, self.count, self.total = 0, 0, 0
+
+    def data(self):
+        if self.count < self.n: return self.t[:self.count], self.v[:self.count]
+        return np.concatenate([self.t[self.i:], self.t[:self.i]]), \
+               np.concatenate([self.v[self.i:], self.v[:self.i]])
+
+    # samples with t0 <= t <= t1
+    def window(self, t0: float, t1: float):
+        t, v = self.data()
+        a, b = np.searchsorted(t, t0), np.searchsorted(t, t1, side='right')
+        return t[a:b], v[a:b]
+
+    # the last k samples
+    def tail(self, k: int):
+        k = min(k, self.count)
+        idx = (self.i - k + np.arange(k)) % self.n
+        return self.t[idx], self.v[idx]
+
+    def last(self):
+        if self.count == 0: return None, None
+        return self.t[self.i - 1], self.v[self.i - 1]
+
+###################################################
+# decimation for the plots: one min/max pair per pixel column
+#
+# min and max of the samples in the columns [t0 + k*dt, t0 + (k+1)*dt), k < n_col
+# (nan for an empty column); t sorted
+def column_minmax(t: np.ndarray, v: np.ndarray, t0: float, dt: float, n_col: int):
+    cmin, cmax = np.full(n_col, np.nan), np.full(n_col, np.nan)
+    col = np.floor((t - t0)/dt).astype(np.int64)
+    ok = (col >= 0) & (col < n_col)
+    col, v = col[ok], v[ok]
+    if len(col) == 0: return cmin, cmax
+    starts = np.concatenate([[0], np.nonzero(np.diff(col))[0] + 1])
+    cmin[col[starts]] = np.fmin.reduceat(v, starts)
+    cmax[col[starts]] = np.fmax.reduceat(v, starts)
+    return cmin, cmax
+
+if __name__=="__main__":
+    import time
+    rb = RingBuffer(1 << 20)
+    for i in range(1 << 20): rb.append(float(i), np.sin(i*1e-4))
+    t0 = time.perf_counter()
+    for _ in range(100): column_minmax(*rb.data(), 0., rb.count/800, 800)
+    print(f'min/max of {rb.count} samples in 800 columns: {(time.perf_counter() - t0)*10:.2f} ms')
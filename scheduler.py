@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+
+import time, threading
+from typing import List
+
+###################################################
+# fixed-rate deadlines on the monotonic clock
+#
+# the k-th deadline is t0 + k*period whatever the acquisition takes,
+# so the real period does not drift; deadlines which have already passed
+# when a tick finishes are counted as missed and skipped
+class FixedRate:
+    def __init__(self, period: float, t0: float = None):
+        self.period = period
+        self.next = time.monotonic() if t0 is None else t0
+        self.n_tick, self.n_missed = 0, 0
+        self.lateness = 0. # delay of the last tick from its deadline [sec]
+
+    def remaining(self, now: float = None) -> float:
+        if now is None: now = time.monotonic()
+        return max(0., self.next - now)
+
+    def due(self, now: float = None) -> bool:
+        return self.remaining(now) <= 0.
+
+    # called when the work of the current deadline is done
+    def advance(self, now: float = None):
+        if now is None: now = time.monotonic()
+        self.n_tick += 1
+        self.next += self.period
+        if now > self.next:
+            missed = int((now - self.next) // self.period) + 1
+            self.n_missed += missed
+            self.next += missed * self.period
+
+    # sleep until the deadline (False if stopped meanwhile)
+    def wait(self, stopped: threading.Event = None) -> bool:
+        remain = self.remaining()
+        if stopped is None:
+            time.sleep(remain)
+        elif stopped.wait(remain): return False
+        self.lateness = time.monotonic() - self.next
+        return True
+
+###################################################
+# deadlines of a device and of its measure channels
+#
+# period     : period of the whole device (ReadAll) [sec]
+# chan_period: period of each measure channel, 0 or None = the device period
+#              a channel faster than the device is read alone (GetMeasure)
+class DeviceSchedule:
+    def __init__(self, period: float, chan_period: List[float] = None):
+        t0 = time.monotonic()
+        self.dev = FixedRate(period, t0)
+        self.chans = {i: FixedRate(p, t0) for i, p in enumerate(chan_period or [])
+                      if p and p < period}
+
+    def remaining(self) -> float:
+        return min([self.dev.remaining()] + [x.remaining() for x in self.chans.values()])
+
+    # 'all' when the device is due, otherwise the list of due channels
+    def due(self):
+        now = time.monotonic()
+        if self.dev.due(now): return 'all'
+        return [i for i, x in self.chans.items() if x.due(now)]
+
+    def advance(self, due):
+        now = time.monotonic()
+        if due == 'all':
+            self.dev.advance(now)
+            due = [i for i, x in self.chans.items() if x.due(now)]
+        for i in due: self.chans[i].advance(now)
+
+    def n_missed(self) -> int:
+        return self.dev.n_missed + sum(x.n_missed for x in self.chans.values())
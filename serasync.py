@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+
+import asyncio, time, threading
+from concurrent.futures import ThreadPoolExecutor
+from serial import Serial, SerialException, SerialTimeoutException
+from typing import Callable, Dict, List
+from sermeasure import SerMeasure, Snapshot
+from scheduler import DeviceSchedule
+import metrics, units
+
+###################################################
+# non-blocking serial transport on an asyncio event loop
+#
+# the port is opened with timeout=0 and watched with loop.add_reader,
+# so waiting for an answer never ties up a thread (posix only)
+class AioSerial:
+    ports: Dict[str, 'AioSerial'] = {}
+
+    def __init__(self, port: str, **settings):
+        self.port = port
+        self.ser = Serial(port, **{**settings, 'timeout': 0})
+        self.loop = asyncio.get_running_loop()
+        self.buf = bytearray()
+        self.waiter: asyncio.Future = None
+        self.lock = asyncio.Lock() # one transaction at a time on a port
+        self.loop.add_reader(self.ser.fileno(), self.on_readable)
+
+    # shared transport of the port in the running loop
+    @classmethod
+    def get(cls, port: str, **settings):
+        aser = cls.ports.get(port)
+        if aser is None or aser.ser is None or aser.loop is not asyncio.get_running_loop():
+            aser = cls.ports[port] = AioSerial(port, **settings)
+        elif any(aser.ser.getSettingsDict().get(k) != v for k, v in settings.items() if k != 'timeout'):
+            aser.ser.apply_settings({**settings, 'timeout': 0})
+        return aser
+
+    @classmethod
+    def close_all(cls):
+        for aser in list(cls.ports.values()): aser.close()
+        cls.ports.clear()
+
+    def on_readable(self):
+        try: data = self.ser.read(self.ser.in_waiting or 1)
+        except (SerialException, OSError) as e:
+            print(f"Error in on_readable: {str(e)}")
+            self.close()
+            data = b''
+        self.buf += data
+        if self.waiter is not None and not self.waiter.done(): self.waiter.set_result(None)
+
+    async def wait_data(self, t_end: float):
+        remain = t_end - self.loop.time()
+        if remain <= 0 or self.ser is None: return False
+        self.waiter = self.loop.create_future()
+        try: await asyncio.wait_for(self.waiter, remain)
+        except asyncio.TimeoutError: return False
+        finally: self.waiter = None
+        return True
+
+    def write(self, data: bytes):
+        if self.ser is None: raise SerialException(f'{self.port} is closed')
+        self.ser.write(data)
+
+    def reset_input_buffer(self):
+        self.buf.clear()
+        if self.ser is not None: self.ser.reset_input_buffer()
+
+    # read until term (included); partial data on timeout like Serial.read_until
+    async def read_until(self, term: bytes = b'\r', timeout: float = 1.):
+        t_end = self.loop.time() + timeout
+        while term not in self.buf:
+            if not await self.wait_data(t_end): break
+        n = self.buf.find(term)
+        n = len(self.buf) if n < 0 else n + len(term)
+        r = bytes(self.buf[:n])
+        del self.buf[:n]
+        return r
+
+    async def readline(self, timeout: float = 1.):
+        return await self.read_until(b'\n', timeout)
+
+    async def read(self, size: int, timeout: float = 1.):
+        t_end = self.loop.time() + timeout
+        while len(self.buf) < size:
+            if not await self.wait_data(t_end): break
+        r = bytes(self.buf[:size])
+        del self.buf[:size]
+        return r
+
+    def close(self):
+        if self.ser is None: return
+        try: self.loop.remove_reader(self.ser.fileno())
+        except (ValueError, OSError): pass
+        try: self.ser.close()
+        except (SerialException, SerialTimeoutException) as e:
+            print(f"Error in close: {str(e)}")
+        self.ser = None
+        if self.ports.get(self.port) is self: self.ports.pop(self.port)
+
+###################################################
+# asyncio acquisition engine
+#
+# one event loop polls every device with its AReadAll at its own fixed rate;
+# a device that does not answer within timeout is skipped for the cycle
+# without blocking the others
+#
+# freq     : update period for all devices, or a list of periods per device [sec]
+# chan_freq: update periods of the measure channels of each device (see DeviceSchedule)
+# read_units: the units are read after the acquisitions (units.UnitPoll)
+class AioEngine:
+    def __init__(self, devs: List[SerMeasure], freq, timeout: float = 1.,
+                 callback: Callable[[int, Snapshot], None] = None,
+                 chan_freq: List[List[float]] = None, read_units: bool = False):
+        self.devs = devs
+        self.freq = freq if isinstance(freq, list) else len(devs) * [freq]
+        self.chan_freq = chan_freq if chan_freq is not None else len(devs) * [None]
+        self.sched: List[DeviceSchedule] = []
+        self.timeout = timeout
+        self.callback = callback
+        self.elapsed = len(devs) * [0.] # latency of the last cycle [sec]
+        self.n_timeout = len(devs) * [0]
+        self.units: List[List[str]] = len(devs) * [None]
+        self.unit_poll = [units.UnitPoll(x.name) if read_units else None for x in devs]
+        self.thread: threading.Thread = None
+        self.loop: asyncio.AbstractEventLoop = None
+        self.stopped: asyncio.Event = None
+
+    async def poll(self, i: int, dev: SerMeasure):
+        sched = self.sched[i]
+        snap = None
+        while not self.stopped.is_set():
+            due = sched.due()
+            if len(due) > 0:
+                t = time.perf_counter()
+                try:
+                    if due == 'all' or snap is None: snap = await asyncio.wait_for(dev.AReadAll(), self.timeout)
+                    else:                            snap = await asyncio.wait_for(self.read_channels(dev, snap, due), self.timeout)
+                    if self.callback is not None: self.callback(i, snap)
+                    up = self.unit_poll[i]
+                    if up is not None and up.due():
+                        self.units[i] = up.read(await asyncio.wait_for(dev.AGetUnits(), self.timeout))
+                except asyncio.TimeoutError:
+                    self.n_timeout[i] += 1
+                    print(f"Error in {dev.name}: timeout")
+                except Exception as e:
+                    print(f"Error in {dev.name}: {str(e)}")
+                self.elapsed[i] = time.perf_counter() - t
+                metrics.cycle(dev, self.elapsed[i])
+                sched.advance(due)
+            try: await asyncio.wait_for(self.stopped.wait(), sched.remaining())
+            except asyncio.TimeoutError: pass
+
+    # update only the measures of the due channels (as ThreadSermeasure.read_channels)
+    async def read_channels(self, dev: SerMeasure, snap: Snapshot, chans: List[int]) -> Snapshot:
+        meas = list(snap.meas)
+        for c in chans: meas[c] = await dev.AGetMeasure(c)
+        return Snapshot(snap.name, meas, snap.state, snap.status, time.time())
+
+    async def main(self):
+        self.stopped = asyncio.Event()
+        self.sched = [DeviceSchedule(f, c) for f, c in zip(self.freq, self.chan_freq)]
+        self.loop = asyncio.get_running_loop()
+        # a thread per device for the drivers without async transactions (AReadAll
+        # in a thread): the default executor is too small to poll them together
+        self.loop.set_default_executor(ThreadPoolExecutor(max(1, len(self.devs))))
+        try: await asyncio.gather(*[self.poll(i, dev) for i, dev in enumerate(self.devs)])
+        finally: AioSerial.close_all()
+
+    # run the loop in a thread
+    def start(self):
+        self.thread = threading.Thread(target=asyncio.run, args=(self.main(),), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        while self.loop is None and self.thread is not None and self.thread.is_alive():
+            time.sleep(0.01) # not started yet
+        if self.loop is not None: self.loop.call_soon_threadsafe(self.stopped.set)
+        if self.thread is not None: self.thread.join()
+        self.thread = None
@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+
+import threading, time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List
+from serial import SerialException, SerialTimeoutException
+from sermeasure import SerSession
+
+###################################################
+# RS-485 multidrop bus: several addressed gauges (e.g. VSM7XX) on one line
+#
+# the bus owns the SerSession of the port and runs one transaction at a time
+# (the line is half duplex and the gauges answer one request at a time, so
+# requests are not pipelined); the waiting devices are served in their order
+# of arrival, which makes the devices of a line poll in round robin
+#
+# each address has its own answer timeout (sweep() learns it from the answer
+# time of the gauge), so a missing gauge does not hold the line for the full
+# serial timeout
+#
+# utilization: time the line was busy with transactions / elapsed time;
+# near 1 with a growing wait time, the line is saturated (see stats())
+class SerBus:
+    buses: Dict[str, 'SerBus'] = {}
+    lock = threading.Lock()
+    margin = 5.          # learned timeout = margin * answer time of the sweep,
+    min_timeout = 0.05   # [sec] bounded by min_timeout
+    write_timeout = 1.   # [sec]
+
+    def __init__(self, port: str):
+        self.port = port
+        self.session = SerSession.get(port)
+        self.timeouts: Dict[int, float] = {} # [sec] per address
+        self.stats_lock = threading.Lock()
+        # first come, first served
+        self.cond = threading.Condition()
+        self.next_ticket, self.serving = 0, 0
+        self.clear_stats()
+
+    # bus of the port, shared by every device on it
+    @classmethod
+    def get(cls, port: str):
+        with cls.lock:
+            if port not in cls.buses: cls.buses[port] = SerBus(port)
+            return cls.buses[port]
+
+    @classmethod
+    def all_stats(cls):
+        return {k: v.stats() for k, v in list(cls.buses.items())}
+
+    def timeout_of(self, address: int, timeout: float = 1.) -> float:
+        return min(timeout, self.timeouts.get(address, timeout))
+
+    def set_timeout(self, address: int, timeout: float):
+        self.timeouts[address] = timeout
+
+    #########################################
+    # turn on the line, in the order of arrival
+    @contextmanager
+    def turn(self):
+        t = time.perf_counter()
+        with self.cond:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while self.serving != ticket: self.cond.wait()
+        try: yield time.perf_counter() - t # waiting time
+        finally:
+            with self.cond:
+                self.serving += 1
+                self.cond.notify_all()
+
+    #########################################
+    # one request and its answer (terminator included, b'' on timeout)
+    # raise: SerialException, SerialTimeoutException (the port is reopened next time)
+    def transact(self, address: int, request: bytes, term: bytes = b'\r', timeout: float = 1.) -> bytes:
+        with self.turn() as wait:
+            t = time.perf_counter()
+            answer = b''
+            try:
+                ser = self.session.acquire(timeout=self.timeout_of(address, timeout),
+                                           write_timeout=self.write_timeout)
+                ser.write(request)
+                answer = ser.read_until(term)
+                self.session.release() # the port is closed here unless the sessions are persistent
+            except (SerialException, SerialTimeoutException):
+                self.session.release(True)
+                raise
+            finally: self.record(address, time.perf_counter() - t, answer.endswith(term), wait)
+        return answer
+
+    #########################################
+    # discovery: request(address) sent to every address, the addresses
+    # whose answer passes check(answer) are returned and their timeouts are
+    # set to margin times the answer time
+    def sweep(self, request: Callable[[int], bytes], check: Callable[[bytes], bool],
+              addresses: Iterable[int] = range(1, 17), timeout: float = 0.2, term: bytes = b'\r') -> List[int]:
+        found = []
+        for address in addresses:
+            self.timeouts.pop(address, None)
+            t = time.perf_counter()
+            try: answer = self.transact(address, request(address), term, timeout)
+            except (SerialException, SerialTimeoutException) as e:
+                print(f"Error in sweep: {str(e)}")
+                continue
+            if not check(answer): continue
+            self.timeouts[address] = max(self.min_timeout, self.margin*(time.perf_counter() - t))
+            found.append(address)
+        return found
+    #########################################
+
+    #########################################
+    # statistics
+    def record(self, address: int, dt: float, ok: bool, wait: float = 0.):
+        with self.stats_lock:
+            self.t_busy += dt
+            self.t_wait += wait
+            s = self.per_address.get(address)
+            if s is None: s = self.per_address[address] = {'transactions': 0, 'timeouts': 0, 't_busy': 0.}
+            s['transactions'] += 1
+            s['t_busy'] += dt
+            if not ok: s['timeouts'] += 1
+
+    def clear_stats(self):
+        self.t_start = time.perf_counter()
+        self.t_busy, self.t_wait = 0., 0. # [sec] on the line, waiting for a turn
+        self.per_address: Dict[int, Dict] = {}
+
+    def stats(self) -> Dict:
+        elapsed = max(time.perf_counter() - self.t_start, 1e-9)
+        with self.stats_lock: per = {k: dict(v) for k, v in self.per_address.items()}
+        n = sum(v['transactions'] for v in per.values())
+        for a, v in per.items():
+            v['mean_s'] = v['t_busy']/v['transactions'] if v['transactions'] > 0 else None
+            v['timeout_s'] = self.timeouts.get(a)
+        return {'utilization': self.t_busy/elapsed, 'transactions_per_s': n/elapsed,
+                'mean_wait_s': self.t_wait/n if n > 0 else 0., 't_busy': self.t_busy, 't_wait': self.t_wait,
+                'elapsed': elapsed, 'addresses': per}
+    #########################################
+
+if __name__=="__main__":
+    # 16 gauges on one simulated line, polled by a thread each
+    import simdev
+    from vsm7xx import VSM7XX
+    hub = simdev.SimHub()
+    hub.start()
+    sim = simdev.VSM7XXSim(addresses=list(range(1, 17)), latency=0.002, baud=9600)
+    hub.add(sim)
+
+    t = time.perf_counter()
+    devs = VSM7XX.discover(sim.port, range(1, 33), timeout=0.05)
+    print(f'{len(devs)} gauges found in {time.perf_counter() - t:.2f} s: {[x.address for x in devs]}')
+    bus = devs[0].bus # SerBus of the serbus module, not of __main__
+    bus.clear_stats()
+    def poll(dev, t_end):
+        while time.time() < t_end: dev.GetMeasure(0)
+    t_end = time.time() + 5
+    jobs = [threading.Thread(target=poll, args=(x, t_end)) for x in devs]
+    for x in jobs: x.start()
+    for x in jobs: x.join()
+    s = bus.stats()
+    print(f"utilization {s['utilization']:.2f}, {s['transactions_per_s']:.1f} transactions/s, "
+          f"mean wait {s['mean_wait_s']*1e3:.1f} ms")
+    for a, v in sorted(s['addresses'].items()):
+        print(f"  {a:>3}: {v['transactions']} transactions, {v['timeouts']} timeouts, "
+              f"{v['mean_s']*1e3:.1f} ms, timeout {v['timeout_s']*1e3:.0f} ms")
+    SerSession.close_all()
+    hub.stop()
@@ -1,18 +1,79 @@
 import serial
 import serial.tools.list_ports
+import json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
 from sermeasure import SerMeasure
 from sermeasure_list import *
 
+###################################################
+# on-disk cache of the probe results
+#
+# key  : usb vid:pid:serial number of the adapter, or its hwid if it has no
+#        serial number (then the location on the usb bus is part of it)
+# entry: class name, model and serial numbers of the instrument, port, time
+class ProbeCache:
+    def __init__(self, path: str = 'probe_cache.json'):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f: self.entries: Dict[str, Dict] = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def key(port) -> str:
+        if getattr(port, 'serial_number', None) and port.vid is not None:
+            return f'{port.vid:04X}:{port.pid:04X}:{port.serial_number}'
+        return port.hwid if getattr(port, 'hwid', 'n/a') != 'n/a' else port.device
+
+    def get(self, key: str) -> Dict:
+        with self.lock: return self.entries.get(key)
+
+    def put(self, key: str, entry: Dict):
+        with self.lock:
+            self.entries[key] = entry
+            self.save()
+
+    def drop(self, key: str):
+        with self.lock:
+            if self.entries.pop(key, None) is not None: self.save()
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f: json.dump(self.entries, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Error in ProbeCache: {str(e)}")
+
 class SerMan:
+    probe_t = 0.2     # [sec] serial timeout while probing
+    probe_workers = 16 # ports probed at the same time
+    use_cache = True  # probe cache (ProbeCache) consulted before probing
+
+    # ports is replaced, never modified in place (copy-on-write): a reader
+    # which holds the list (e.g. ports = sm.ports) iterates a consistent
+    # snapshot while the port watcher updates it from its thread, and the
+    # updates are serialized by lock
     def __init__(self):
+        self.cache = ProbeCache()
+        self.lock = threading.Lock()
         self.load_ports()
     
     def load_ports(self):
-        self.ports = []
-        for port in sorted(serial.tools.list_ports.comports()):
-            if port.device.find('ttyS') < 0:
-                self.ports.append(port)
-                
+        ports = scan_ports()
+        with self.lock: self.ports = ports
+
+    # incremental updates of the port list (PortWatcher)
+    def add_port(self, port):
+        with self.lock:
+            if any(x.device == port.device for x in self.ports): return
+            self.ports = sorted(self.ports + [port])
+
+    def remove_port(self, device: str):
+        with self.lock: self.ports = [x for x in self.ports if x.device != device]
+        
         
     def n_ports(self):
         return len(self.ports)
@@ -41,9 +102,9 @@ class SerMan:
             print('No such an index.')
             return None    
 
-    def string_ports(self, port_only: bool = True):
+    def string_ports(self, port_only: bool = True, ports: List = None):
         strs = []
-        for port, desc, hwid in sorted(self.ports):
+        for port, desc, hwid in sorted(self.ports if ports is None else ports):
             if port_only:
                 strs.append(f"{port}")
             else:
@@ -53,26 +114,124 @@ class SerMan:
     def print_ports(self, port_only: bool = True):
         print('\n'.join(self.string_ports(port_only)))
 
+    # classes in the order of probing for a port:
+    # vid_pid matching the usb adapter, then the classes without a hint, then the others
+    def probe_order(self, port):
+        def rank(cl):
+            hint = getattr(cl, 'vid_pid', None)
+            if hint is None: return 1
+            return 0 if hint == (port.vid, port.pid) else 2
+        return sorted(serm_class_list, key=rank)
+
+    # a cached class is confirmed by a single is_this() query (and the serial
+    # number when it is cached, since another unit of the same model may have
+    # been plugged in), the full probe runs only when the port is not in the
+    # cache or the confirmation fails
     def find_port_class(self, port):
-        print(f'Find a class for the port {port.name}.')
         if port is None:
             print('Cannot find such a port.')
             return None
-        for cl in serm_class_list:
-            try:
-                print(f' Trying the class {cl.__name__}')
-                dev = cl('port_check', port.device)
-                if dev.is_this(): return cl
-                #else: print(f' Not the class {cl.__name__}')
-            except (serial.SerialException, TypeError, UnicodeDecodeError) as e:
-                print(f"Error: {str(e)}")
-                continue
+        key = ProbeCache.key(port)
+        hit = self.cache.get(key) if self.use_cache else None
+        if hit is not None:
+            cl = next((x for x in serm_class_list if x.__name__ == hit['class']), None)
+            serial = hit.get('serial', '')
+            info = self.probe(cl, port, serial != '') if cl is not None else None
+            if info is not None and info.get('serial', serial) == serial:
+                print(f'Port {port.name}: {cl.__name__} (cached)')
+                return cl
+            self.cache.drop(key) # the instrument has changed
+        print(f'Find a class for the port {port.name}.')
+        for cl in self.probe_order(port):
+            info = self.probe(cl, port, True)
+            if info is None: continue
+            self.cache.put(key, {'class': cl.__name__, 'port': port.device, 'time': time.time(), **info})
+            return cl
         return None
 
-    def find_ports_class(self):
-        self.ports_class = [self.find_port_class(x) for x in self.ports]
+    # is_this() of a class on the port with the probe timeout
+    # return: None if not, or the model and serial numbers (if read_info)
+    def probe(self, cl, port, read_info: bool = True):
+        dev = None
+        try:
+            print(f' Trying the class {cl.__name__} on {port.name}')
+            dev = cl('port_check', port.device)
+            dev.timeout = self.probe_t
+            if not dev.is_this(): return None
+            info = {}
+            if read_info:
+                for k, f in [('model', 'get_mod_no'), ('serial', 'get_ser_no')]:
+                    try: info[k] = str(getattr(dev, f)()) if hasattr(dev, f) else ''
+                    except Exception: info[k] = ''
+            return info
+        except (serial.SerialException, TypeError, UnicodeDecodeError) as e:
+            print(f"Error: {str(e)}")
+            return None
+        finally:
+            if dev is not None:
+                try: dev.close()
+                except Exception: pass
+
+    # the ports are probed concurrently, the classes of a port one by one
+    # ports: the list probed (default: the current one), in the order of the result
+    def find_ports_class(self, ports: List = None):
+        if ports is None: ports = self.ports
+        t = time.perf_counter()
+        if len(ports) == 0: self.ports_class = []
+        else:
+            with ThreadPoolExecutor(min(self.probe_workers, len(ports))) as ex:
+                self.ports_class = list(ex.map(self.find_port_class, ports))
+        print(f'{len(ports)} ports probed in {time.perf_counter() - t:.1f} s')
         return self.ports_class
 
+def scan_ports():
+    return [x for x in sorted(serial.tools.list_ports.comports()) if x.device.find('ttyS') < 0]
+
+###################################################
+# hot-plug monitoring of the serial ports
+#
+# comports() is listed every period and compared with the previous list
+# (a few msec on linux); the new ports are probed (with the probe cache,
+# usually a single query) and the subscribers get
+#   added(port, class or None) and removed(port)
+# in the thread of the watcher
+class PortWatcher(threading.Thread):
+    def __init__(self, sm: SerMan, period: float = 0.5, probe: bool = True):
+        super().__init__(daemon=True)
+        self.sm = sm
+        self.period = period
+        self.probe = probe
+        self.added: List[Callable] = []
+        self.removed: List[Callable] = []
+        self.known = {x.device: x for x in sm.ports}
+        self.stopped = threading.Event()
+
+    def subscribe(self, added: Callable = None, removed: Callable = None):
+        if added is not None: self.added.append(added)
+        if removed is not None: self.removed.append(removed)
+
+    def run(self):
+        while not self.stopped.wait(self.period):
+            try: now = {x.device: x for x in scan_ports()}
+            except Exception as e:
+                print(f"Error in PortWatcher: {str(e)}")
+                continue
+            for dev in [x for x in self.known if x not in now]:
+                self.emit(self.removed, self.known.pop(dev))
+            for dev in [x for x in now if x not in self.known]:
+                port = self.known[dev] = now[dev]
+                cl = self.sm.find_port_class(port) if self.probe else None
+                self.emit(self.added, port, cl)
+
+    def emit(self, subscribers: List[Callable], *args):
+        for f in subscribers:
+            try: f(*args)
+            except Exception as e:
+                print(f"Error in PortWatcher: {str(e)}")
+
+    def stop(self):
+        self.stopped.set()
+
 if __name__ == "__main__":
     sm = SerMan()
     sm.print_ports(False)
@@ -1,15 +1,96 @@
 from abc import *
-from serial import Serial
+from serial import Serial, SerialException, SerialTimeoutException
 from enum import Enum, auto
+from dataclasses import dataclass, field
+from typing import Dict, List
+import os, time, threading, asyncio
 
 class UnitType(Enum):
     Pres = auto()
     Temp = auto()
     Perc = auto()
 
+###################################################
+# snapshot of all measures, states and statuses of a device
+# taken in one acquisition (see SerMeasure.ReadAll)
+@dataclass
+class Snapshot:
+    name: str
+    meas:   List[float] = field(default_factory=list)
+    state:  List[str]   = field(default_factory=list)
+    status: List[bool]  = field(default_factory=list)
+    time: float = 0. # epoch time of the acquisition [sec]
+
+###################################################
+# serial session shared by every driver on the same port
+#
+# persistent = True : the Serial handle is opened once and kept open,
+#                     it is reopened only after an I/O error
+# persistent = False: legacy behavior, open/close on every transaction
+#                     (CMMS_SER_PERSISTENT=0 in the environment)
+class SerSession:
+    persistent = os.environ.get('CMMS_SER_PERSISTENT', '1') != '0'
+    sessions: Dict[str, 'SerSession'] = {}
+    lock = threading.Lock()
+
+    def __init__(self, port: str):
+        self.port = port
+        self.ser: Serial = None
+        self.n_open, self.n_close, self.n_reconnect = 0, 0, 0
+        self.t_open = 0. # total time spent in opening the port [sec]
+        self.failed = False
+
+    @classmethod
+    def get(cls, port: str):
+        with cls.lock:
+            if port not in cls.sessions: cls.sessions[port] = SerSession(port)
+            return cls.sessions[port]
+
+    @classmethod
+    def stats(cls):
+        return {k: {'open': v.n_open, 'close': v.n_close, 'reconnect': v.n_reconnect,
+                    't_open': v.t_open} for k, v in cls.sessions.items()}
+
+    @classmethod
+    def close_all(cls):
+        for v in list(cls.sessions.values()): v.reset()
+
+    def acquire(self, **settings):
+        if self.ser is not None and self.ser.is_open:
+            # other drivers may probe the same port with different settings
+            if any(self.ser.getSettingsDict().get(k) != v for k, v in settings.items()):
+                try: self.ser.apply_settings(settings)
+                except Exception as e: # some ports (e.g. ptys) refuse a reconfiguration: reopen
+                    print(f"Error in acquire: {str(e)}")
+                    self.reset()
+                    return self.acquire(**settings)
+            self.ser.reset_input_buffer() # same as a freshly opened port
+            return self.ser
+        t = time.perf_counter()
+        self.ser = Serial(self.port, **settings)
+        self.t_open += time.perf_counter() - t
+        self.n_open += 1
+        if self.failed: self.n_reconnect += 1
+        self.failed = False
+        return self.ser
+
+    def release(self, error: bool = False):
+        if error: self.failed = True
+        if self.persistent and not error: return
+        self.reset()
+
+    def reset(self):
+        if self.ser is None: return
+        try: self.ser.close()
+        except (SerialException, SerialTimeoutException) as e:
+            print(f"Error in close: {str(e)}")
+        self.ser = None
+        self.n_close += 1
+
 # an abstract base class to declare methods for getting measurements via a serial port
 class SerMeasure(metaclass=ABCMeta):
     n_meas, n_state, n_status = 1, 1, 1
+    timeout = 1. # [sec] serial timeout of open(), shortened while probing (serman)
 
     # a constructor that initializes a name, port and n_meas attribute
     @abstractmethod
@@ -68,4 +149,48 @@ class SerMeasure(metaclass=ABCMeta):
 
     @abstractmethod
     def GetStatus(self, i: int):
-        if i >= self.n_status: return False
\ No newline at end of file
+        if i >= self.n_status: return False
+
+    # all measures, states and statuses in one call
+    # default: one query per item, drivers override it when the instrument
+    # can return everything in fewer transactions
+    def ReadAll(self) -> Snapshot:
+        t = time.time()
+        return Snapshot(self.name,
+                        [self.GetMeasure(i) for i in range(self.n_meas)],
+                        [self.GetState(i)   for i in range(self.n_state)],
+                        [self.GetStatus(i)  for i in range(self.n_status)], t)
+
+    # asyncio variant of ReadAll (see serasync.AioEngine)
+    # default: ReadAll in a worker thread, drivers with async transactions override it
+    async def AReadAll(self) -> Snapshot:
+        return await asyncio.to_thread(self.ReadAll)
+
+    async def AGetMeasure(self, i: int):
+        return await asyncio.to_thread(self.GetMeasure, i)
+
+    # units of all measures (units.py names)
+    def GetUnits(self) -> List[str]:
+        return [self.GetUnit(i) for i in range(self.n_meas)]
+
+    async def AGetUnits(self) -> List[str]:
+        return await asyncio.to_thread(self.GetUnits)
+
+    #########################################
+    # serial session helpers for the pyserial-based drivers
+    #
+    # open_session returns the shared Serial handle of the port (None if failed)
+    # close_session keeps the handle open unless an error occurred (self.ok False)
+    def open_session(self, **settings):
+        self.session = SerSession.get(self.port)
+        try: return self.session.acquire(**settings)
+        except (SerialException, SerialTimeoutException) as e:
+            print(f"Error in open: {str(e)}")
+            self.session.release(True)
+            return None
+
+    def close_session(self):
+        session = getattr(self, 'session', None)
+        if session is None: return
+        session.release(not self.ok)
+    #########################################
\ No newline at end of file
@@ -1,22 +1,80 @@
 #
 # list of SerMeasure-inherited class
 #
-from m1 import M1, M2, M3
-from tpg36x import TPG36X
-from ls335 import LS335
-from ls218 import LS218
-from tic100 import TIC100
-from bcg450 import BCG450
-from vsm7xx import VSM7XX
-
-import inspect, sys
-
-serm_class_list = []
-for name, obj in inspect.getmembers(sys.modules[__name__]):          
-    if inspect.isclass(obj) and obj.__base__.__name__ == 'SerMeasure':
-        serm_class_list.append(obj)
+# a declarative registry: module, usb ids and channel counts of each driver;
+# the module of a driver is imported only when the driver is first
+# instantiated, probed or asked for another attribute, so importing this list
+# costs nothing, and a driver whose optional dependency (deps) is missing is
+# disabled alone
+#
+# the channel counts n = (n_meas, n_state, n_status) are declared here so
+# that they are known without the import; they must be kept in sync with
+# the class (checked by tests/test_registry.py and the __main__ below)
+#
+import importlib, importlib.util
+from typing import Dict, List, Tuple
+
+class Driver:
+    def __init__(self, name: str, module: str, vid_pid: Tuple[int, int] = None,
+                 n: Tuple[int, int, int] = (1, 0, 0), deps: Tuple[str, ...] = ()):
+        self.__name__ = name
+        self.module = module
+        self.vid_pid = vid_pid # usb ids of the usual adapter (probe order of SerMan)
+        self.n_meas, self.n_state, self.n_status = n
+        self.deps = deps
+        self.cls = None
+        self.error = next((f'no module {x}' for x in deps if importlib.util.find_spec(x) is None), None)
+
+    @property
+    def available(self) -> bool:
+        return self.error is None
+
+    # the driver class
+    def load(self):
+        if self.cls is None:
+            try: self.cls = getattr(importlib.import_module(self.module), self.__name__)
+            except ImportError as e:
+                self.error = str(e)
+                print(f"Error in {self.__name__}: {self.error}")
+                raise
+        return self.cls
+
+    # used as the class: Driver(name, port) makes a device
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        if name.startswith('__'): raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        return f"<driver '{self.__name__}' ({self.module})>"
+
+drivers: Dict[str, Driver] = {x.__name__: x for x in [
+    Driver('BCG450', 'bcg450', (0x067B, 0x2303), (1, 0, 0)),
+    Driver('LS218',  'ls218',  (0x067B, 0x2303), (8, 0, 0)),
+    Driver('LS335',  'ls335',  (0x1FB9, 0x0300), (2, 0, 0), deps=('lakeshore',)),
+    Driver('M1',     'm1',     None,             (1, 0, 0)),
+    Driver('M2',     'm1',     None,             (3, 1, 1)),
+    Driver('M3',     'm1',     None,             (2, 1, 1)),
+    Driver('TIC100', 'tic100', None,             (4, 1, 2)),
+    Driver('TPG36X', 'tpg36x', (0x0403, 0x6001), (2, 0, 0)),
+    Driver('VSM7XX', 'vsm7xx', None,             (1, 0, 0)),
+]}
+globals().update(drivers) # TPG36X, LS218, ... as names of this module
+
+serm_class_list: List[Driver] = [x for x in drivers.values() if x.available]
 serm_name_list = [x.__name__ for x in serm_class_list]
+for x in drivers.values():
+    if not x.available: print(f'{x.__name__} is disabled: {x.error}')
 
 if __name__=="__main__":
+    import time
     print(serm_class_list)
-    print(serm_name_list)
\ No newline at end of file
+    print(serm_name_list)
+    for x in serm_class_list: # the declarations must match the classes
+        t = time.perf_counter()
+        cl = x.load()
+        n = (cl.n_meas, cl.n_state, cl.n_status)
+        print(f'{x.__name__:>8}: {(time.perf_counter() - t)*1e3:6.1f} ms' +
+              ('' if n == (x.n_meas, x.n_state, x.n_status) else f', channels {n} declared otherwise'))
@@ -0,0 +1,362 @@
+#!/usr/bin/python3
+
+import argparse, heapq, math, os, pty, random, selectors, threading, time, tty
+from typing import Dict, List
+from serial.tools.list_ports_common import ListPortInfo
+
+###################################################
+# simulated instruments on linux pseudo-terminals
+#
+# each simulator owns a pty pair and speaks the wire protocol of an
+# instrument on the master side; a driver opens the slave path
+# (SimDevice.port) like a real /dev/ttyUSBx
+#
+# one SimHub thread serves all the simulators (selectors + a timer heap),
+# so hundreds of devices fit in one process; run them in their own process
+# (the command line below) since pyserial select()s, which fails for file
+# descriptors >= 1024
+#
+# fault injection of every simulator:
+#   latency: [sec] delay of the answer, a float or (min, max)
+#   baud   : the answer arrives after len*10/baud sec (None = at once)
+#   drop   : probability that an answer is lost
+#   garbage: probability that random bytes precede an answer
+#
+# linux keeps the settings of a pty after it is closed and stores it as 8N1;
+# a pty once opened with 7O1 (LS218) may refuse 7O1 the next time (EINVAL),
+# so start new simulators rather than reopening the old ones
+class SimHub(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sel = selectors.DefaultSelector()
+        self.heap = [] # (time, seq, sim, data or None (timer))
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_w, False)
+        self.sel.register(self.wake_r, selectors.EVENT_READ, None)
+        self.sims: List['SimDevice'] = []
+        self.stopped = threading.Event()
+
+    def add(self, sim: 'SimDevice') -> str:
+        sim.hub = self
+        master, slave = pty.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        os.set_blocking(master, False)
+        sim.master, sim.slave = master, slave # the slave stays open: no EIO when a driver closes it
+        sim.port = os.ttyname(slave)
+        self.sims.append(sim)
+        self.sel.register(master, selectors.EVENT_READ, sim)
+        sim.started()
+        self.wakeup()
+        return sim.port
+
+    def schedule(self, sim: 'SimDevice', delay: float, data: bytes = None):
+        with self.lock:
+            self.seq += 1
+            heapq.heappush(self.heap, (time.monotonic() + delay, self.seq, sim, data))
+        self.wakeup()
+
+    def wakeup(self):
+        try: os.write(self.wake_w, b'x')
+        except BlockingIOError: pass
+
+    def run(self):
+        while not self.stopped.is_set():
+            with self.lock: timeout = max(0., self.heap[0][0] - time.monotonic()) if self.heap else None
+            for key, _ in self.sel.select(timeout):
+                if key.data is None:
+                    os.read(self.wake_r, 4096)
+                    continue
+                try: data = os.read(key.fd, 4096)
+                except (BlockingIOError, OSError): continue
+                key.data.feed(data)
+            now = time.monotonic()
+            while True:
+                with self.lock:
+                    if not self.heap or self.heap[0][0] > now: break
+                    _, _, sim, data = heapq.heappop(self.heap)
+                if data is None: sim.timer()
+                else:            sim.write(data)
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup()
+        for sim in self.sims:
+            for fd in [sim.master, sim.slave]:
+                try: os.close(fd)
+                except OSError: pass
+
+###################################################
+# base of the simulators
+class SimDevice:
+    name = 'SimDevice'
+    vid_pid = None # usb ids reported by sim_ports()
+    term = b'\r'   # end of a command
+
+    def __init__(self, latency = 0., baud: int = None, drop: float = 0., garbage: float = 0.,
+                 seed: int = None):
+        self.latency, self.baud = latency, baud
+        self.drop, self.garbage = drop, garbage
+        self.rand = random.Random(seed)
+        self.hub: SimHub = None
+        self.port: str = None
+        self.buf = bytearray()
+        self.t0 = time.time()
+        self.n_cmd, self.n_drop, self.n_garbage, self.n_overrun = 0, 0, 0, 0
+
+    def started(self): pass # called when the pty is ready
+    def timer(self): pass   # called by the hub after schedule(sim, delay) without data
+
+    # bytes from the driver, split into commands at term
+    def feed(self, data: bytes):
+        self.buf += data
+        while True:
+            n = self.buf.find(self.term)
+            if n < 0: break
+            cmd = bytes(self.buf[:n]).strip()
+            del self.buf[:n + len(self.term)]
+            self.n_cmd += 1
+            r = self.handle(cmd)
+            if r is not None: self.reply(r)
+
+    # the answer (bytes) to a command or None
+    def handle(self, cmd: bytes):
+        return None
+
+    # answer with the configured faults
+    def reply(self, data: bytes):
+        if self.rand.random() < self.drop:
+            self.n_drop += 1
+            return
+        if self.rand.random() < self.garbage:
+            self.n_garbage += 1
+            data = bytes(self.rand.randrange(256) for _ in range(self.rand.randint(1, 8))) + data
+        delay = self.latency if not isinstance(self.latency, tuple) else self.rand.uniform(*self.latency)
+        if self.baud: delay += len(data)*10/self.baud
+        if delay <= 0: self.write(data)
+        else:          self.hub.schedule(self, delay, data)
+
+    def write(self, data: bytes):
+        try: os.write(self.master, data)
+        except (BlockingIOError, OSError): self.n_overrun += 1 # nobody reads the port
+
+    #########################################
+    # physical values
+    #
+    # pump-down from p0 to p1 with the time constant tau [sec], 2 % noise
+    def pressure(self, p0: float = 1e3, p1: float = 1e-6, tau: float = 600.):
+        t = time.time() - self.t0
+        return (p1 + (p0 - p1)*math.exp(-t/tau)) * (1 + 0.02*self.rand.uniform(-1, 1))
+
+    # cool-down from T0 to T1 [K]
+    def temperature(self, T0: float = 300., T1: float = 4., tau: float = 3600.):
+        t = time.time() - self.t0
+        return T1 + (T0 - T1)*math.exp(-t/tau) + 0.01*self.rand.uniform(-1, 1)
+    #########################################
+
+###################################################
+# Pfeiffer TPG36X: <cmd>CR -> ACK CR LF, then ENQ -> <data> CR LF
+class TPG36XSim(SimDevice):
+    name = 'TPG36X'
+    vid_pid = (0x0403, 0x6001)
+    units = ['mbar', 'Torr', 'Pa', 'Micron', 'hPa', 'Volt']
+
+    def __init__(self, unit: int = 0, **faults):
+        super().__init__(**faults)
+        self.unit = unit
+        self.last = b''
+
+    def feed(self, data: bytes):
+        for b in data:
+            if b == 0x05: # ENQ
+                self.n_cmd += 1
+                self.reply(self.answer(self.last) + b'\r\n')
+            elif b == 0x0D:
+                self.last = bytes(self.buf).strip()
+                self.buf.clear()
+                self.reply(b'\x06\r\n' if self.answer(self.last) != b'' else b'\x15\r\n')
+            elif b != 0x0A: self.buf.append(b)
+
+    def answer(self, cmd: bytes) -> bytes:
+        fac = [1., 0.750062, 100., 750.062, 1., 0.][self.unit]
+        if cmd == b'AYT': return b'TPG362,PTG28290,44990000,010100,T02'
+        if cmd == b'PR1': return b'0,%.4E' % (self.pressure()*fac)
+        if cmd == b'PR2': return b'0,%.4E' % (self.pressure(p1=1e-3)*fac)
+        if cmd == b'UNI': return b'%d' % self.unit
+        return b''
+
+###################################################
+# Edwards TIC100: ?V<oid>CR -> =V<oid> <data>CR, ?S<oid>CR -> =S<oid> <data>CR
+class TIC100Sim(SimDevice):
+    name = 'TIC100'
+
+    def handle(self, cmd: bytes):
+        c = cmd.decode(errors='replace')
+        if len(c) < 3 or c[0] not in '?!': return b'*E 1\r'
+        kind, oid = c[1], c[2:].split()[0]
+        if c[0] == '!': return b'*%s%s 0\r' % (kind.encode(), oid.encode())
+        data = self.data(kind, oid)
+        if data is None: return b'*%s%s 5\r' % (kind.encode(), oid.encode()) # no such object
+        return ('=%s%s %s\r' % (kind, oid, data)).encode()
+
+    def data(self, kind: str, oid: str):
+        if kind == 'S' and oid == '902': return 'TIC100;2.10;SIM%06d;1.5' % (id(self) % 1000000)
+        if kind != 'V': return None
+        if oid == '902': return '4;0;1;1;1;0;0;0' # turbo running, 3 gauges connected
+        if oid == '904': return '4;0;0'
+        if oid == '905': return '100;0;0;0'
+        if oid == '907': return '4;0;0'
+        if oid == '908': return '0;0;0'
+        if oid in ['913', '914', '915']:
+            return '%.2E;59;0;0' % self.pressure(p0=1e5, p1=1e-4*(int(oid) - 912))
+        return None
+
+###################################################
+# Lake Shore SCPI: <query>LF -> <answer>CR LF
+class LS218Sim(SimDevice):
+    name = 'LS218'
+    vid_pid = (0x067B, 0x2303)
+    term = b'\n'
+    idn = 'LSCI,MODEL218S,SIM218,010101'
+    chs = [str(x) for x in range(1, 9)]
+
+    def handle(self, cmd: bytes):
+        c = cmd.decode(errors='replace').strip().upper()
+        if c == '*IDN?': return (self.idn + '\r\n').encode()
+        for q, conv in [('KRDG?', lambda T: T), ('CRDG?', lambda T: T - 273.15), ('SRDG?', lambda T: T/100)]:
+            if c.startswith(q):
+                ch = c[len(q):].strip()
+                if ch == '0': vals = [conv(self.temperature(T1=4.+i)) for i in range(len(self.chs))]
+                elif ch in self.chs: vals = [conv(self.temperature(T1=4.+self.chs.index(ch)))]
+                else: return None
+                return (','.join('%+08.3f' % x for x in vals) + '\r\n').encode()
+        if c.startswith('RDGST?'): return b'000\r\n'
+        return None # commands have no answer
+
+# Lake Shore 335 (2 inputs, A and B)
+# the lakeshore package only opens ports with the Lake Shore usb ids, so the
+# LS335 driver does not attach to a pty; the protocol is the same SCPI
+class LS335Sim(LS218Sim):
+    name = 'LS335'
+    vid_pid = (0x1FB9, 0x0300)
+    idn = 'LSCI,MODEL335,SIM335,1.0'
+    chs = ['A', 'B']
+
+###################################################
+# Thyracont VSM7XX: ADR(3) AC CMD(2) LEN(2) DATA CHECKSUM CR
+#   AC 0 = read, 2 = write -> answer AC 1, 3
+#   CHECKSUM = sum of the characters % 64 + 64
+# addresses: gauges on the same (RS485) line, the others are silent
+class VSM7XXSim(SimDevice):
+    name = 'VSM7XX'
+
+    def __init__(self, addresses: List[int] = [1], **faults):
+        super().__init__(**faults)
+        self.addresses = list(addresses)
+
+    @staticmethod
+    def checksum(s: str) -> str:
+        return chr(sum(ord(x) for x in s) % 64 + 64)
+
+    def handle(self, cmd: bytes):
+        c = cmd.decode(errors='replace')
+        if len(c) < 9 or self.checksum(c[:-1]) != c[-1]: return None # broken frame: no answer
+        try: adr, ac, com, n = int(c[:3]), c[3], c[4:6], int(c[6:8])
+        except ValueError: return None
+        if adr not in self.addresses: return None
+        data = {'PN': 'VSM72', 'SD': 'SIMD%04d' % adr, 'SH': 'SIMH%04d' % adr,
+                'MV': '%.4E' % self.pressure(p0=1e3*adr), 'DU': 'mbar', 'DO': '0'}.get(com, '') \
+               if ac == '0' else c[8:8+n]
+        seq = '%03d%s%s%02d%s' % (adr, '1' if ac == '0' else '3', com, len(data), data)
+        return (seq + self.checksum(seq) + '\r').encode()
+
+###################################################
+# Inficon BCG450: continuous 9 byte frames (no commands needed)
+#   0x07 0x05 status error pres_hi pres_lo version type checksum
+#   pressure = 10**(value/4000 - const[unit])
+class BCG450Sim(SimDevice):
+    name = 'BCG450'
+    vid_pid = (0x067B, 0x2303)
+    unit_const = [12.5, 12.625, 10.5] # mbar, Torr, Pa
+
+    def __init__(self, unit: int = 0, period: float = 0.006, **faults):
+        super().__init__(**faults)
+        self.unit = unit
+        self.period = period
+
+    def started(self):
+        self.hub.schedule(self, self.period)
+
+    def frame(self) -> bytes:
+        v = int((math.log10(self.pressure()) + self.unit_const[self.unit])*4000)
+        v = min(max(v, 0), 0xFFFF)
+        b = bytes([0x05, (self.unit << 4) | 0x1, 0x00, v >> 8, v & 0xFF, 0x14, 0x0A])
+        return bytes([0x07]) + b + bytes([sum(b) % 256])
+
+    def timer(self):
+        self.n_cmd += 1
+        self.reply(self.frame())
+        self.hub.schedule(self, self.period)
+
+    def feed(self, data: bytes): pass # unit setting commands are ignored
+
+sim_classes = {x.name: x for x in [TPG36XSim, TIC100Sim, LS218Sim, LS335Sim, VSM7XXSim, BCG450Sim]}
+
+###################################################
+# port descriptions of the simulators for SerMan (comports() does not list ptys)
+def sim_ports(sims: List[SimDevice]) -> List[ListPortInfo]:
+    ports = []
+    for i, sim in enumerate(sims):
+        p = ListPortInfo(sim.port, skip_link_detection=True)
+        if sim.vid_pid is not None: p.vid, p.pid = sim.vid_pid
+        p.serial_number = 'SIM%04d' % i
+        p.description = f'{sim.name} simulator'
+        p.hwid = f'SIM {sim.name} {i}'
+        ports.append(p)
+    return ports
+
+# spec: {'TPG36X': 10, 'TIC100': 5, ...}
+def spawn(spec: Dict[str, int], hub: SimHub = None, **faults) -> List[SimDevice]:
+    if hub is None:
+        hub = SimHub()
+        hub.start()
+    sims = []
+    for name, n in spec.items():
+        for _ in range(n):
+            sim = sim_classes[name](**faults)
+            hub.add(sim)
+            sims.append(sim)
+    return sims
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='pty simulators of the CMMS instruments')
+    parser.add_argument('devices', nargs='+', help='<class>[:<number>], class in ' + ', '.join(sim_classes))
+    parser.add_argument('--latency', type=float, default=0., help='answer delay [sec]')
+    parser.add_argument('--baud', type=int, default=None, help='baud-rate pacing of the answers')
+    parser.add_argument('--drop', type=float, default=0., help='probability of a lost answer')
+    parser.add_argument('--garbage', type=float, default=0., help='probability of garbage before an answer')
+    parser.add_argument('--link', default=None, help='directory of symlinks <class>_<n> to the ptys')
+    args = parser.parse_args()
+    spec = {}
+    for x in args.devices:
+        name, _, n = x.partition(':')
+        spec[name] = spec.get(name, 0) + (int(n) if n else 1)
+    sims = spawn(spec, latency=args.latency, baud=args.baud, drop=args.drop, garbage=args.garbage)
+    count: Dict[str, int] = {}
+    for sim in sims:
+        k = count[sim.name] = count.get(sim.name, -1) + 1
+        line = f'{sim.name:>8} {k:>4}: {sim.port}'
+        if args.link is not None:
+            os.makedirs(args.link, exist_ok=True)
+            link = os.path.join(args.link, f'{sim.name}_{k}')
+            if os.path.lexists(link): os.remove(link)
+            os.symlink(sim.port, link)
+            line += f' <- {link}'
+        print(line, flush=True)
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt:
+        print(f'commands {sum(x.n_cmd for x in sims)}, dropped {sum(x.n_drop for x in sims)}, '
+              f'garbage {sum(x.n_garbage for x in sims)}, overrun {sum(x.n_overrun for x in sims)}')
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+
+import os, time, threading
+from typing import List, Tuple
+
+###################################################
+# store-and-forward spool of line-protocol records
+#
+# an append-only write-ahead log split into segments:
+#   <path>/<seq:012d>.lp : one line-protocol record per line
+#   <path>/ack           : '<seq> <offset>' of the first unacknowledged record
+#   <path>/rejected.txt  : batches the sink refused for good (quarantine),
+#                          each after a '# <time> <error>' comment
+# the writer appends every batch to the last segment, the drainer reads
+# bounded batches from the ack position, and segments which are completely
+# acknowledged are deleted (compaction)
+#
+# a record partially written before a crash is cut off when the spool is
+# opened again, so that the next batch does not continue it
+class Spool:
+    def __init__(self, path: str = 'spool', seg_bytes: int = 4 << 20,
+                 batch_lines: int = 5000, fsync: bool = False):
+        self.path = path
+        self.seg_bytes = seg_bytes
+        self.batch_lines = batch_lines
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        segs = self.segments()
+        self.wseq = segs[-1] if len(segs) > 0 else 0
+        self.truncate_partial(self.seg_name(self.wseq))
+        self.writer = open(self.seg_name(self.wseq), 'ab')
+        self.aseq, self.aoff = self.load_ack(segs)
+
+    def seg_name(self, seq: int):
+        return os.path.join(self.path, '%012d.lp' % seq)
+
+    def segments(self) -> List[int]:
+        return sorted(int(x[:-3]) for x in os.listdir(self.path) if x.endswith('.lp'))
+
+    # cut the file after its last complete record
+    def truncate_partial(self, name: str):
+        try: f = open(name, 'r+b')
+        except FileNotFoundError: return
+        with f:
+            size = pos = f.seek(0, os.SEEK_END)
+            end = 0
+            while pos > 0:
+                n = min(65536, pos)
+                f.seek(pos - n)
+                k = f.read(n).rfind(b'\n')
+                if k >= 0:
+                    end = pos - n + k + 1
+                    break
+                pos -= n
+            if end < size:
+                print(f'Spool: partial record of {size - end} bytes removed from {name}')
+                f.truncate(end)
+
+    def load_ack(self, segs: List[int]) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.path, 'ack')) as f:
+                seq, off = map(int, f.read().split())
+        except (OSError, ValueError):
+            seq, off = (segs[0] if len(segs) > 0 else 0), 0
+        return seq, off
+
+    #########################################
+    # writer side
+    def append(self, lines: List[str]):
+        if len(lines) == 0: return
+        data = ('\n'.join(lines) + '\n').encode('utf8')
+        with self.lock:
+            self.writer.write(data)
+            self.writer.flush()
+            if self.fsync: os.fsync(self.writer.fileno())
+            if self.writer.tell() >= self.seg_bytes: # rotation
+                self.writer.close()
+                self.wseq += 1
+                self.writer = open(self.seg_name(self.wseq), 'ab')
+
+    def close(self):
+        with self.lock: self.writer.close()
+    #########################################
+
+    #########################################
+    # drainer side
+    #
+    # read_batch returns at most batch_lines complete records from the ack
+    # position and the position after them, to be passed to ack()
+    def read_batch(self):
+        with self.lock: wseq = self.wseq
+        seq, off = self.aseq, self.aoff
+        while seq <= wseq:
+            try:
+                with open(self.seg_name(seq), 'rb') as f:
+                    f.seek(off)
+                    lines = []
+                    while len(lines) < self.batch_lines:
+                        line = f.readline()
+                        if not line.endswith(b'\n'): break # end or a partially written record
+                        lines.append(line[:-1].decode('utf8'))
+                        off += len(line)
+            except FileNotFoundError:
+                lines = []
+            if len(lines) > 0: return lines, (seq, off)
+            if seq == wseq: break
+            seq, off = seq + 1, 0 # this segment is completely read
+        return [], (seq, off)
+
+    def ack(self, pos: Tuple[int, int]):
+        self.aseq, self.aoff = pos
+        tmp = os.path.join(self.path, 'ack.tmp')
+        with open(tmp, 'w') as f: f.write(f'{self.aseq} {self.aoff}')
+        os.replace(tmp, os.path.join(self.path, 'ack'))
+        for seq in self.segments(): # compaction
+            if seq < self.aseq: os.remove(self.seg_name(seq))
+
+    # keep a batch the sink refused for good out of the way
+    def quarantine(self, lines: List[str], error: str):
+        with open(os.path.join(self.path, 'rejected.txt'), 'a', encoding='utf8') as f:
+            f.write(f'# {time.strftime("%Y-%m-%dT%H:%M:%S")} {error}\n' + '\n'.join(lines) + '\n')
+
+    def pending_bytes(self) -> int:
+        n = 0
+        for seq in self.segments():
+            if seq < self.aseq: continue
+            n += os.path.getsize(self.seg_name(seq)) - (self.aoff if seq == self.aseq else 0)
+        return n
+    #########################################
+
+###################################################
+# a failed write is retried unless the sink refused the batch itself: an
+# http 4xx answer (bad line protocol, field type conflict, ...) other than
+# 408 (timeout) and 429 (too many requests) is the same at every retry
+def retryable(e: Exception) -> bool:
+    status = getattr(e, 'status', None)
+    if not isinstance(status, int): return True
+    return not (400 <= status < 500) or status in (408, 429)
+
+###################################################
+# drain the spool into a sink (e.g. the influxdb write api) with backoff
+#
+# write: callable taking a list of line-protocol records, raising on failure
+# a batch refused for good (see retryable) goes to the quarantine of the
+# spool, so that it does not block the records behind it
+class SpoolDrainer(threading.Thread):
+    def __init__(self, spool: Spool, write, period: float = 1.,
+                 backoff_min: float = 1., backoff_max: float = 60.):
+        super().__init__(daemon=True)
+        self.spool = spool
+        self.write = write
+        self.period = period
+        self.backoff_min, self.backoff_max = backoff_min, backoff_max
+        self.stopped = threading.Event()
+        self.n_sent, self.n_fail, self.n_rejected = 0, 0, 0
+        self.rate = 0. # [records/sec] of the last backlog drain
+
+    def run(self):
+        backoff = self.backoff_min
+        t_drain, n_drain = None, 0 # backlog drain measurement
+        while not self.stopped.is_set():
+            lines, pos = self.spool.read_batch()
+            if len(lines) == 0:
+                if t_drain is not None and n_drain > self.spool.batch_lines:
+                    self.rate = n_drain/(time.perf_counter() - t_drain)
+                    print(f'Spool: {n_drain} records drained at {self.rate:.0f} records/s')
+                t_drain, n_drain = None, 0
+                self.stopped.wait(self.period)
+                continue
+            if t_drain is None: t_drain = time.perf_counter()
+            try: self.write(lines)
+            except Exception as e:
+                if not retryable(e):
+                    print(f'Error in SpoolDrainer: {str(e)}, {len(lines)} records quarantined')
+                    self.spool.quarantine(lines, str(e).replace('\n', ' '))
+                    self.spool.ack(pos)
+                    self.n_rejected += len(lines)
+                    continue
+                self.n_fail += 1
+                print(f'Error in SpoolDrainer: {str(e)}, retry in {backoff:.1f} s')
+                self.stopped.wait(backoff)
+                backoff = min(2*backoff, self.backoff_max)
+                t_drain, n_drain = None, 0
+                continue
+            backoff = self.backoff_min
+            self.spool.ack(pos)
+            self.n_sent += len(lines)
+            n_drain += len(lines)
+
+    def stop(self):
+        self.stopped.set()
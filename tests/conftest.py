@@ -0,0 +1,16 @@
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sermeasure import SerSession
+import simdev
+
+# a SimHub for the pty simulators of a test (few descriptors: in process)
+@pytest.fixture
+def hub():
+    hub = simdev.SimHub()
+    hub.start()
+    yield hub
+    SerSession.close_all()
+    hub.stop()
@@ -0,0 +1,66 @@
+import math
+from m1 import M2
+from sermeasure import Snapshot
+from aggregate import Accumulator, WindowAggregator
+from lineproto import LineSerializer
+
+def test_accumulator():
+    a = Accumulator()
+    assert a.mean is None
+    for x in [3., 1., 2.]: a.add(x)
+    assert (a.n, a.min, a.max, a.mean, a.last) == (3, 1., 3., 2., 2.)
+
+def snap(t, x, state = 'On'):
+    return Snapshot('t', [x, 2*x, float('nan')], [state], [x > 1], t)
+
+def test_windows_close_on_the_next_one():
+    agg = WindowAggregator([M2('t', '/dev/null')], [10.])
+    for k in range(10): agg.add(0, snap(1000. + k, float(k)))
+    assert agg.drain(now=1005.) == []
+    agg.add(0, snap(1010., 100., 'Off'))
+    (i, w), = agg.drain(now=1010.)
+    assert (i, w.n, w.start, w.end) == (0, 10, 1000., 1010.)
+    assert (w.meas[0].min, w.meas[0].max, w.meas[0].mean, w.meas[0].last) == (0., 9., 4.5, 9.)
+    assert w.meas[2].n == 0 and w.state == ['On'] and w.status == [True]
+
+def test_grace_late_and_flush():
+    agg = WindowAggregator([M2('t', '/dev/null')], [10.], grace=2.)
+    agg.add(0, snap(1001., 1.))
+    assert agg.drain(now=1011.) == [] and len(agg.drain(now=1012.)) == 1
+    agg.add(0, snap(1009., 1.)) # its window is already closed
+    assert agg.n_late == 1
+    agg.add(0, snap(1021., 1.))
+    assert len(agg.drain(now=1021., flush=True)) == 1
+
+def test_not_aggregated_device_is_ignored():
+    agg = WindowAggregator([M2('t', '/dev/null')], [0.])
+    agg.add(0, snap(1000., 1.))
+    assert agg.drain(flush=True) == []
+
+def test_aggregate_lines():
+    devs = [M2('t', '/dev/null')]
+    agg = WindowAggregator(devs, [10.])
+    for k in range(4): agg.add(0, snap(1000. + k, float(k)))
+    ser = LineSerializer({}, [{}], [], devs)
+    lines = ser.aggregate_lines(agg.drain(flush=True))
+    assert lines[0] == 'Measure,channel=0,dev=t value=1.5,min=0.0,max=3.0,count=4i,last=3.0 1010000000000'
+    assert len(lines) == 4 # the channel without finite samples is not written
+    assert lines[2] == 'State,channel=0,dev=t value="On",count=4i 1010000000000'
+
+def test_windows_wait_for_units():
+    devs = [M2('t', '/dev/null')]
+    agg = WindowAggregator(devs, [10.])
+    ser = LineSerializer({}, [{}], [], devs, normalize=True)
+    for k in range(4): agg.add(0, snap(1000. + k, float(k)))
+    agg.add(0, snap(1010., 1.))
+    assert agg.drain(now=1010., ready=ser.ready()) == [] # units not known yet: kept
+    ser.set_units(0, 3*['K'])
+    (i, w), = agg.drain(now=1010., ready=ser.ready())
+    assert w.end == 1010. and ser.aggregate_lines([(i, w)])[0].split()[1].startswith('value=1.5,')
+
+def test_held_windows_are_bounded():
+    agg = WindowAggregator([M2('t', '/dev/null')], [10.])
+    agg.max_held = 2
+    for k in range(4): agg.add(0, snap(1000. + 10*k, 1.))
+    assert agg.drain(now=1100., ready=[False]) == [] and agg.n_dropped == 2
+    assert [w.start for _, w in agg.drain(ready=[True])] == [1020., 1030.] # the newest are kept
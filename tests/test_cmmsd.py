@@ -0,0 +1,42 @@
+import os
+from cmmsd import load_config, dump_toml, resolve, make_sender
+from serman import SerMan
+
+example = os.path.join(os.path.dirname(__file__), '..', 'cmmsd.example.toml')
+
+def test_config_round_trip(tmp_path):
+    conf = load_config(example)
+    assert conf['run']['period'] == 1.0 and conf['tags'] == {'site': 'CENS'}
+    assert conf['device'][1]['class'] == 'auto' and conf['device'][1]['window'] == 10.0
+    assert conf['device'][2]['enabled'] is False and conf['device'][0]['enabled'] is True # defaults filled in
+    path = tmp_path / 'cmmsd.resolved.toml'
+    path.write_text(dump_toml(conf))
+    assert load_config(str(path)) == conf
+
+def test_missing_device_keeps_its_entry(tmp_path):
+    conf = load_config(example)
+    sm = SerMan()
+    sm.ports = [] # nothing plugged in
+    out = resolve(conf, sm)
+    auto = out['device'][1]
+    assert auto['class'] == 'auto' and auto['enabled'] is True and 'port' not in auto
+    path = tmp_path / 'cmmsd.resolved.toml'
+    path.write_text(dump_toml(out))
+    assert load_config(str(path))['device'][1] == conf['device'][1] # probed again at the next start
+    out['run']['sink'] = 'stdout'
+    sender = make_sender(out)
+    assert [x[1].__name__ for x in sender.dev_list] == ['TPG36X'] # skipped at runtime only, VSM7XX disabled
+
+def test_make_sender():
+    conf = load_config(example)
+    conf['run'].update(sink='stdout', engine='async', normalize=True, period=0.5)
+    conf['device'][1].update(**{'class': 'TIC100', 'port': '/dev/ttyUSB1'})
+    conf['device'][2]['enabled'] = True
+    sender = make_sender(conf)
+    assert sender.use_async and sender.normalize and sender.n_dev == 3
+    assert sender.dev_freq == [0.5, 0.1, 0.5] and sender.dev_window == [0., 10., 0.]
+    assert sender.dev_list[2][3] == {'address': 2} # driver attributes
+    assert sender.tag_gen == {'site': 'CENS'} and sender.tag_dev[0] == {'room': 'A1'}
+    assert sender.tag_chan[0][:2] == [{'gauge': 'chamber'}, {'gauge': 'foreline'}]
+    assert len(sender.tag_chan[0]) == 2 # one per measure of the TPG36X
+    assert sender.chan_deadband[0] == [{'log': 0.002}, {}]
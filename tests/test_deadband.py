@@ -0,0 +1,35 @@
+import time
+from m1 import M1, M2
+from sermeasure import Snapshot, UnitType
+from deadband import Deadband, ChangeFilter, type_default
+from lineproto import LineSerializer
+
+def test_deadband_kinds():
+    assert Deadband('abs', 0.5).exceeded(1., 1.6) and not Deadband('abs', 0.5).exceeded(1., 1.4)
+    assert Deadband('rel', 0.1).exceeded(10., 11.5) and not Deadband('rel', 0.1).exceeded(10., 10.5)
+    assert Deadband('log', 0.1).exceeded(1e-6, 1.3e-6) and not Deadband('log', 0.1).exceeded(1e-6, 1.2e-6)
+    assert Deadband('log', 0.1).exceeded(1e-6, 0.)
+
+def test_parse():
+    assert repr(Deadband.parse({'rel': '0.01'})) == '{rel: 0.01}'
+    assert Deadband.parse({}) is None and Deadband.parse({'abs': 1, 'rel': 2}) is None
+
+def test_type_defaults():
+    f = ChangeFilter([M2('t', '/dev/null')], [[{}, {'abs': 0.5}]])
+    assert f.bands[0][0] is type_default[UnitType.Temp]
+    assert repr(f.bands[0][1]) == '{abs: 0.5}'
+
+def test_change_only_with_heartbeat():
+    devs = [M1('p', '/dev/null'), M2('t', '/dev/null')]
+    ser = LineSerializer({}, [{}, {}], [], devs)
+    ser.filter = ChangeFilter(devs, [[{'abs': 0.5}]], heartbeat=60.)
+    kept = [len(ser.lines([Snapshot('p', [x], [], [], t), None])) for x, t in
+            [(1., 0.), (1.2, 1.), (1.6, 2.), (1.6, 3.), (1.6, 70.)]]
+    assert kept == [1, 0, 1, 0, 1] # first, moved by 0.6, heartbeat
+    assert ser.filter.reduction() == 0.4
+
+def test_states_and_statuses_on_change():
+    devs = [M2('t', '/dev/null')]
+    f = ChangeFilter(devs)
+    assert f.keep(0, 1, 0, 'On', 0.) and not f.keep(0, 1, 0, 'On', 1.) and f.keep(0, 1, 0, 'Off', 2.)
+    assert f.keep(0, 2, 0, True, 0.) and not f.keep(0, 2, 0, True, 1.) and f.keep(0, 2, 0, False, 2.)
@@ -0,0 +1,136 @@
+import asyncio, time
+import simdev
+from ls218 import LS218
+
+def ls218(hub, **faults):
+    sim = simdev.LS218Sim(seed=1, **faults)
+    hub.add(sim)
+    dev = LS218('ls218', sim.port)
+    dev.timeout = 0.2
+    return sim, dev
+
+def test_ls218_readall(hub):
+    sim, dev = ls218(hub)
+    snap = dev.ReadAll()
+    assert dev.ok
+    assert len(snap.meas) == 8 and all(x > 4. for x in snap.meas)
+
+def test_ls218_no_answer_is_missing(hub):
+    sim, dev = ls218(hub, drop=1.)
+    snap = dev.ReadAll()
+    assert not dev.ok
+    assert snap.meas == 8*[None]
+    assert dev.ser is None
+
+def test_ls218_malformed_answer_is_missing(hub):
+    class Broken(simdev.LS218Sim):
+        def handle(self, cmd): return b'+004.000,ERR\r\n'
+    sim = Broken()
+    hub.add(sim)
+    dev = LS218('ls218', sim.port)
+    dev.timeout = 0.2
+    snap = dev.ReadAll()
+    assert not dev.ok
+    assert snap.meas == 8*[None]
+
+def test_ls218_areadall(hub):
+    sim, dev = ls218(hub)
+    snap = asyncio.run(dev.AReadAll())
+    assert dev.ok and len(snap.meas) == 8
+
+def test_ls335_unreachable_is_missing():
+    from ls335 import LS335
+    dev = LS335('ls335', '/dev/nonexistent-cmms')
+    assert dev.tc is None # opened lazily
+    snap = dev.ReadAll()
+    assert not dev.ok
+    assert snap.meas == 2*[None]
+
+def test_tic100_readall_counts_saved(hub):
+    import metrics
+    from tic100 import TIC100
+    sim = simdev.TIC100Sim(seed=1)
+    hub.add(sim)
+    dev = TIC100('tic', sim.port)
+    dev.timeout = 0.2
+    snap = dev.ReadAll()
+    assert snap.meas[3] == 100.
+    assert dev.cycle_saved > 0
+    text = metrics.registry.render()
+    assert f'cmms_saved_total{{driver="TIC100",port="{sim.port}"}} {dev.total_saved}' in text
+    assert f'cmms_cycle_saved{{driver="TIC100",port="{sim.port}"}} {dev.cycle_saved}' in text
+
+def test_tic100_failed_speed_does_not_break_readall(hub):
+    from tic100 import TIC100
+    class NoSpeed(simdev.TIC100Sim):
+        def data(self, kind, oid): return None if oid == '905' else super().data(kind, oid)
+    sim = NoSpeed(seed=1)
+    hub.add(sim)
+    dev = TIC100('tic', sim.port)
+    dev.timeout = 0.2
+    snap = dev.ReadAll()
+    assert snap.meas[3] == 0
+    assert len(snap.meas) == 4
+
+def test_bcg450_stream_keeps_its_timeout(hub):
+    from bcg450 import BCG450
+    sim = simdev.BCG450Sim(seed=1)
+    hub.add(sim)
+    dev = BCG450('bcg', sim.port)
+    assert dev.GetMeasure(0) > 0
+    # another transaction on the port reconfigures the shared session
+    ser = dev.open_session(timeout=5., write_timeout=5.)
+    assert ser is not None and ser.timeout == 5.
+    n = dev.n_frame
+    time.sleep(0.2)
+    assert dev.n_frame > n
+    dev.close()
+    assert dev.stream is None and dev.ser is None
+
+def test_vsm7xx_follows_its_port(hub):
+    from vsm7xx import VSM7XX
+    old, new = simdev.VSM7XXSim([2], seed=1), simdev.VSM7XXSim([2], seed=2)
+    hub.add(old)
+    hub.add(new)
+    dev = VSM7XX('vsm', old.port, 2)
+    dev.timeout = 0.2
+    assert dev.get_prod_name() == 'VSM72'
+    dev.port = new.port # attached to the replugged adapter
+    assert dev.bus.port == new.port
+    n = new.n_cmd
+    assert dev.get_prod_name() == 'VSM72' and new.n_cmd == n + 1
+
+def test_vsm7xx_port_closed_without_persistent_sessions(hub, monkeypatch):
+    from vsm7xx import VSM7XX
+    from sermeasure import SerSession
+    monkeypatch.setattr(SerSession, 'persistent', False)
+    sim = simdev.VSM7XXSim([2], seed=1)
+    hub.add(sim)
+    dev = VSM7XX('vsm', sim.port, 2)
+    dev.timeout = 0.2
+    n = dev.bus.session.n_close
+    assert dev.get_prod_name() == 'VSM72'
+    assert dev.bus.session.ser is None and dev.bus.session.n_close == n + 1
+
+def test_vsm7xx_discover(hub):
+    from vsm7xx import VSM7XX
+    sim = simdev.VSM7XXSim([1, 3], seed=1)
+    hub.add(sim)
+    devs = VSM7XX.discover(sim.port, range(1, 5), 0.1)
+    assert [x.address for x in devs] == [1, 3]
+    assert all(x.GetMeasure(0) > 0 for x in devs)
+
+def test_tic100_failed_cycle_clears_the_cache(hub):
+    import pytest
+    from tic100 import TIC100
+    class Malformed(simdev.TIC100Sim):
+        def data(self, kind, oid): return 'x;59;0;0' if oid == '913' else super().data(kind, oid)
+    sim = Malformed(seed=1)
+    hub.add(sim)
+    dev = TIC100('tic', sim.port)
+    dev.timeout = 0.2
+    with pytest.raises(ValueError): dev.ReadAll()
+    assert dev.cycle_cache is None
+    n = sim.n_cmd
+    dev.GetMeasure(1) # queried, not answered from the cache of the failed cycle
+    assert sim.n_cmd > n
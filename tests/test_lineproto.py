@@ -0,0 +1,41 @@
+import time
+from m1 import M1, M2
+from sermeasure import Snapshot
+from lineproto import LineSerializer, series_key, format_field
+
+def serializer(**kw):
+    devs = [M1('p', '/dev/null'), M2('t', '/dev/null')]
+    return LineSerializer({'site': 'CENS'}, [{'rack': 'r1'}, {}], [], devs, **kw), devs
+
+def test_series_key_escapes_and_sorts():
+    assert series_key('Measure', {'b': 'x y', 'a': 'k=v', 'e': ''}) == 'Measure,a=k\\=v,b=x\\ y value='
+    assert format_field(True) == 'true' and format_field(3) == '3i' and format_field('a"b') == '"a\\"b"'
+
+def test_lines_of_a_snapshot():
+    ser, _ = serializer()
+    t = time.time()
+    lines = ser.lines([Snapshot('p', [1.5], [], [], t), Snapshot('t', [4.2, None, float('nan')], ['On'], [True], t)])
+    ns = str(int(t*1e9))
+    assert lines == ['Measure,channel=0,dev=p,rack=r1,site=CENS value=1.5 ' + ns,
+                     'Measure,channel=0,dev=t,site=CENS value=4.2 ' + ns,
+                     'State,channel=0,dev=t,site=CENS value="On" ' + ns,
+                     'Status,channel=0,dev=t,site=CENS value=true ' + ns]
+
+def test_snapshot_is_written_once_and_staleness_separately():
+    ser, _ = serializer()
+    old = time.time() - 100.
+    snaps = [Snapshot('p', [1.5], [], [], old), None]
+    assert len(ser.lines(snaps, 10.)) == 2 # the sample, and Stale=true now
+    again = ser.lines(snaps, 10.)
+    assert len(again) == 1 and again[0].startswith('Stale,dev=p,rack=r1,site=CENS value=true ')
+    assert int(again[0].split()[-1]) > old*1e9 + 50e9 # at the time of writing
+    fresh = ser.lines([Snapshot('p', [1.6], [], [], time.time()), None], 10.)
+    assert [x.split(' value=')[1].split()[0] for x in fresh] == ['false', '1.6']
+    assert ser.lines([Snapshot('p', [1.6], [], [], ser.sent[0]), None], 10.) == []
+
+def test_normalized_lines_wait_for_units():
+    ser, _ = serializer(normalize=True)
+    snap = Snapshot('p', [2.], [], [], time.time())
+    assert ser.lines([snap, None]) == []
+    ser.set_units(0, ['mbar'])
+    assert ser.lines([snap, None])[0].split()[1] == 'value=200.0'
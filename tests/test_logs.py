@@ -0,0 +1,84 @@
+import os, shutil
+import numpy as np
+from m1 import M2
+from sermeasure import Snapshot
+from binlog import BinLogger, read_records, compress_file, to_text
+from logreader import LogReader, read_logs
+
+def write_log(path, n, **kw):
+    dev = M2('m2', '/dev/null')
+    log = BinLogger(dev, ['K', 'K', 'K'], str(path), **kw)
+    for k in range(n):
+        log.write(Snapshot('m2', [float(k), 2.*k, None], ['On' if k % 2 else 'Off'], [k % 3 == 0], 1000. + k))
+    log.close()
+    return log.fname
+
+def test_binlog_roundtrip(tmp_path):
+    fname = write_log(tmp_path, 10)
+    assert fname.endswith('.cmms') and os.path.exists(fname) # not compressed by default
+    recs = list(read_records(fname))
+    assert len(recs) == 10
+    t, meas, states, statuses = recs[3]
+    assert t == 1003. and meas[:2] == [3., 6.] and np.isnan(meas[2])
+    assert states == ['On'] and statuses == [True]
+
+def test_binlog_gzip_roundtrip(tmp_path):
+    fname = write_log(tmp_path, 5)
+    compress_file(fname)
+    assert [r[0] for r in read_records(fname + '.gz')] == [1000. + k for k in range(5)]
+
+def test_logreader_range_and_index(tmp_path):
+    LogReader.step = 16
+    try:
+        fname = write_log(tmp_path, 1000)
+        r = LogReader(fname)
+        assert r.n_rec == 1000 and len(r.t_idx) == 63
+        t, v = r.read(1, 1100., 1199.)
+        assert len(t) == 100 and t[0] == 1100. and np.all(v == 2*(t - 1000.))
+        t, s = r.read('state0', 1000., 1003.)
+        assert list(s) == ['Off', 'On', 'Off', 'On']
+        t, b = r.read('status0', 1000., 1003.)
+        assert list(b) == [True, False, False, True]
+        r.close()
+        assert os.path.exists(fname + '.idx')
+        r = LogReader(fname) # from the cached index
+        assert r.n_rec == 1000 and r.read(0, 1500., 1500.)[1][0] == 500.
+        r.close()
+    finally:
+        LogReader.step = 1024
+
+def test_logreader_unit_and_downsample(tmp_path):
+    fname = write_log(tmp_path, 120)
+    d = read_logs([fname, fname + '.idx'], 0, dt=60.)
+    assert list(d['t']) == [1000., 1060.] and list(d['max']) == [59., 119.]
+    r = LogReader(fname)
+    assert r.read(0, 1001., 1001., unit='C')[1][0] == 1. - 273.15
+    r.close()
+
+def test_text_log_columns(tmp_path):
+    fname = write_log(tmp_path, 4)
+    txt = to_text(fname, str(tmp_path / 'M2_m2_240101_000000.txt'))
+    r = LogReader(txt)
+    assert (r.n_meas, r.n_state, r.n_status) == (3, 1, 1)
+    assert list(r.read('state0')[1]) == ['Off', 'On', 'Off', 'On']
+    assert list(r.read('status0')[1]) == [True, False, False, True]
+    assert list(r.read(1)[1]) == [0., 2., 4., 6.]
+    r.close()
+
+def test_text_log_status_order(tmp_path):
+    # a TIC100 log of the former GUI: 4 measures, 1 state, 2 statuses
+    src = os.path.join(os.path.dirname(__file__), '..', 'log', 'TIC100_TIC1001_240604_141155.txt')
+    fname = str(tmp_path / os.path.basename(src))
+    shutil.copy(src, fname)
+    r = LogReader(fname)
+    assert r.read('status0')[1][0] == True and r.read('status1')[1][0] == False
+    assert r.read('state0')[1][0] == 'Running'
+    r.close()
+
+def test_text_log_unknown_driver(tmp_path):
+    fname = str(tmp_path / 'X_x_240101_000000.txt')
+    with open(fname, 'w') as f: f.write('2024-01-01 00:00:00 1.0E+00 2.0E+00 Idle True False \n')
+    r = LogReader(fname)
+    assert r.read('state0')[1][0] == 'Idle' and r.read('status1')[1][0] == False
+    assert (r.n_meas, r.n_state, r.n_status) == (2, 1, 2)
+    r.close()
@@ -0,0 +1,45 @@
+import simdev
+from serial.tools.list_ports_common import ListPortInfo
+from serman import SerMan, ProbeCache
+
+def test_cache_persists(tmp_path):
+    path = str(tmp_path / 'probe_cache.json')
+    c = ProbeCache(path)
+    c.put('0403:6001:A1', {'class': 'TPG36X'})
+    assert ProbeCache(path).get('0403:6001:A1') == {'class': 'TPG36X'}
+    c.drop('0403:6001:A1')
+    assert ProbeCache(path).get('0403:6001:A1') is None
+
+def test_key_of_an_adapter():
+    p = ListPortInfo('/dev/ttyUSB0', skip_link_detection=True)
+    p.vid, p.pid, p.serial_number, p.hwid = 0x0403, 0x6001, 'A1', 'USB VID:PID=0403:6001 LOCATION=1-1'
+    assert ProbeCache.key(p) == '0403:6001:A1' # the same on another usb socket
+    p.serial_number = None
+    assert ProbeCache.key(p) == p.hwid
+
+def test_probe_then_confirm_from_cache(hub, tmp_path, capsys):
+    sims = simdev.spawn({'TPG36X': 1}, hub)
+    port, = simdev.sim_ports(sims)
+    sm = SerMan()
+    sm.cache = ProbeCache(str(tmp_path / 'probe_cache.json'))
+    cl = sm.find_port_class(port)
+    assert cl.__name__ == 'TPG36X'
+    entry = sm.cache.get(ProbeCache.key(port))
+    assert entry['class'] == 'TPG36X' and entry['port'] == port.device
+    capsys.readouterr()
+    assert sm.find_port_class(port).__name__ == 'TPG36X'
+    out = capsys.readouterr().out
+    assert '(cached)' in out and 'Trying the class' in out and out.count('Trying the class') == 1
+
+def test_swapped_instrument_is_probed_again(hub, tmp_path, capsys):
+    sims = simdev.spawn({'TPG36X': 1}, hub)
+    port, = simdev.sim_ports(sims)
+    sm = SerMan()
+    sm.cache = ProbeCache(str(tmp_path / 'probe_cache.json'))
+    key = ProbeCache.key(port)
+    sm.cache.put(key, {'class': 'TPG36X', 'port': port.device, 'time': 0., 'model': 'PTG28290', 'serial': '11110000'})
+    capsys.readouterr()
+    assert sm.find_port_class(port).__name__ == 'TPG36X'
+    out = capsys.readouterr().out
+    assert '(cached)' not in out and 'Find a class' in out # same model, another unit
+    assert sm.cache.get(key)['serial'] == '44990000'
@@ -0,0 +1,21 @@
+import pytest
+import sermeasure_list
+from sermeasure_list import Driver, drivers
+
+@pytest.mark.parametrize('name', sorted(drivers))
+def test_declared_counts_match_the_class(name):
+    d = drivers[name]
+    if not d.available: pytest.skip(d.error)
+    cl = d.load()
+    assert (d.n_meas, d.n_state, d.n_status) == (cl.n_meas, cl.n_state, cl.n_status)
+
+def test_driver_is_lazy():
+    d = Driver('M1', 'm1')
+    assert d.cls is None and d.n_meas == 1 # declared, not imported
+    dev = d('m', '/dev/null')
+    assert d.cls is not None and type(dev).__name__ == 'M1'
+    assert sermeasure_list.M1 is drivers['M1']
+
+def test_missing_dependency_disables_the_driver():
+    d = Driver('X', 'x', deps=('no_such_module_cmms',))
+    assert not d.available and 'no_such_module_cmms' in d.error
@@ -0,0 +1,17 @@
+import numpy as np
+from ringbuf import RingBuffer, column_minmax
+
+def test_ring_wraps_in_time_order():
+    rb = RingBuffer(4)
+    for i in range(6): rb.append(float(i), None if i == 5 else 10.*i)
+    t, v = rb.data()
+    assert list(t) == [2., 3., 4., 5.] and list(v[:3]) == [20., 30., 40.] and np.isnan(v[3])
+    assert list(rb.window(3., 4.)[0]) == [3., 4.] and list(rb.tail(2)[0]) == [4., 5.]
+    assert rb.last()[0] == 5. and rb.total == 6
+
+def test_column_minmax():
+    t = np.arange(10.)
+    v = np.array([1., 5., 2., np.nan, 3., 0., 4., 4., 9., 8.])
+    cmin, cmax = column_minmax(t, v, 0., 2., 6)
+    assert list(cmin[:5]) == [1., 2., 0., 4., 8.] and list(cmax[:5]) == [5., 2., 3., 4., 9.]
+    assert np.isnan(cmin[5]) and np.isnan(cmax[5])
@@ -0,0 +1,52 @@
+import time
+from scheduler import FixedRate, DeviceSchedule
+
+def test_fixed_rate_does_not_drift():
+    r = FixedRate(1., t0=100.)
+    assert r.due(100.) and r.remaining(99.5) == 0.5
+    r.advance(100.3) # the work took 0.3 s
+    assert r.next == 101. and r.n_missed == 0
+
+def test_missed_deadlines_are_skipped():
+    r = FixedRate(1., t0=100.)
+    r.advance(103.5) # 101, 102 and 103 are over
+    assert r.next == 104. and r.n_missed == 3 and r.n_tick == 1
+
+def test_wait_stops_early():
+    import threading
+    r = FixedRate(10.)
+    r.advance()
+    stopped = threading.Event()
+    stopped.set()
+    assert not r.wait(stopped)
+
+def test_device_schedule_channels():
+    s = DeviceSchedule(1., [0.1, 0, 5.]) # only channel 0 is faster than the device
+    assert list(s.chans) == [0]
+    assert s.due() == 'all'
+    s.advance('all')
+    assert s.due() == [] and 0. < s.remaining() <= 0.1
+    time.sleep(s.remaining() + 0.01)
+    assert s.due() == [0]
+    s.advance([0])
+    assert s.n_missed() == 0
+
+def test_async_engine_schedules_channels():
+    from m1 import M2
+    from serasync import AioEngine
+    class Counting(M2):
+        n_all, n_chan = 0, 0
+        def ReadAll(self):
+            self.n_all += 1
+            return super().ReadAll()
+        def GetMeasure(self, i):
+            if i == 0: self.n_chan += 1
+            return super().GetMeasure(i)
+    dev = Counting('g', '/dev/null')
+    snaps = []
+    engine = AioEngine([dev], 1., callback=lambda i, s: snaps.append(s), chan_freq=[[0.05, 0, 0]])
+    engine.start()
+    time.sleep(0.5)
+    engine.stop()
+    assert dev.n_all == 1 and dev.n_chan > 5 # channel 0 is read alone between the ReadAlls
+    assert len(snaps) == dev.n_chan
@@ -0,0 +1,36 @@
+import time
+from m1 import M1
+from sermeasure import SerSession
+from cmmsis import InfluxSender
+
+def sender(**kw):
+    s = InfluxSender()
+    s.set_device_setting(0.02, [('/dev/null', M1, True)], {}, [{}], [], **kw)
+    devs = s.make_devs()
+    s.serializer = s.make_serializer(devs)
+    s.start_workers(devs)
+    return s
+
+def wait_snapshot(s):
+    t_end = time.time() + 5.
+    while s.table.snapshot()[0] is None and time.time() < t_end: time.sleep(0.01)
+
+def test_detached_device_is_reported_stale():
+    s = sender()
+    wait_snapshot(s)
+    s.detach('/dev/null')
+    assert s.table.snapshot()[0] is not None # the last snapshot is kept
+    time.sleep(s.stale_t + 0.05)
+    lines = s.make_lines(s.table.snapshot())
+    s.stop_workers()
+    SerSession.close_all()
+    assert any(x.startswith('Stale,dev=M1 value=true ') for x in lines)
+
+def test_aggregated_device_is_reported_stale():
+    s = sender(dev_window=[1e6]) # no window closes during the test
+    wait_snapshot(s)
+    s.stop_workers() # the device stops updating
+    time.sleep(s.stale_t + 0.05)
+    lines = s.make_lines(s.table.snapshot())
+    SerSession.close_all()
+    assert [x.split()[0] for x in lines] == ['Stale,dev=M1'] # and no raw sample
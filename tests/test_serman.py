@@ -0,0 +1,46 @@
+import threading, time
+from serial.tools.list_ports_common import ListPortInfo
+import serman
+from serman import SerMan, PortWatcher
+
+def port(dev, hwid = None):
+    p = ListPortInfo(dev, skip_link_detection=True)
+    p.hwid = hwid or f'SIM {dev}'
+    return p
+
+def test_port_list_is_replaced_not_modified(monkeypatch):
+    monkeypatch.setattr(serman, 'scan_ports', lambda: [port('/dev/ttyUSB0')])
+    sm = SerMan()
+    held = sm.ports
+    sm.add_port(port('/dev/ttyUSB1'))
+    sm.add_port(port('/dev/ttyUSB1'))
+    assert [x.device for x in held] == ['/dev/ttyUSB0']
+    assert [x.device for x in sm.ports] == ['/dev/ttyUSB0', '/dev/ttyUSB1']
+    held = sm.ports
+    sm.remove_port('/dev/ttyUSB0')
+    assert len(held) == 2 and [x.device for x in sm.ports] == ['/dev/ttyUSB1']
+
+def test_watcher_events(monkeypatch):
+    now = [port('/dev/ttyUSB0')]
+    monkeypatch.setattr(serman, 'scan_ports', lambda: list(now))
+    sm = SerMan()
+    events, seen = [], threading.Event()
+    w = PortWatcher(sm, period=0.01, probe=False)
+    def added(p, cl):
+        sm.add_port(p)
+        events.append(('added', p.device, cl))
+    def removed(p):
+        sm.remove_port(p.device)
+        events.append(('removed', p.device))
+        seen.set()
+    w.subscribe(added, removed)
+    w.start()
+    now.append(port('/dev/ttyUSB1'))
+    t_end = time.time() + 5.
+    while len(events) == 0 and time.time() < t_end: time.sleep(0.01)
+    now.pop(0)
+    assert seen.wait(5.)
+    w.stop()
+    w.join()
+    assert events == [('added', '/dev/ttyUSB1', None), ('removed', '/dev/ttyUSB0')]
+    assert [x.device for x in sm.ports] == ['/dev/ttyUSB1']
@@ -0,0 +1,83 @@
+import os, threading
+from spool import Spool, SpoolDrainer, retryable
+
+def test_append_read_ack_and_compaction(tmp_path):
+    sp = Spool(str(tmp_path), seg_bytes=64, batch_lines=3)
+    sp.append([f'm value={i} {i}' for i in range(10)])
+    sp.append(['m value=10 10'])
+    got = []
+    while True:
+        lines, pos = sp.read_batch()
+        if not lines: break
+        assert len(lines) <= 3
+        got += lines
+        sp.ack(pos)
+    assert got == [f'm value={i} {i}' for i in range(11)]
+    assert sp.segments() == [sp.wseq]
+    assert sp.pending_bytes() == 0
+    sp.close()
+
+def test_reopen_resumes_from_ack(tmp_path):
+    sp = Spool(str(tmp_path))
+    sp.append(['a value=1 1', 'b value=2 2'])
+    lines, pos = sp.read_batch()
+    sp.ack((pos[0], len(b'a value=1 1\n')))
+    sp.close()
+    sp = Spool(str(tmp_path))
+    assert sp.read_batch()[0] == ['b value=2 2']
+    sp.close()
+
+def test_partial_record_is_cut_on_open(tmp_path):
+    sp = Spool(str(tmp_path))
+    sp.append(['a value=1 1'])
+    sp.close()
+    with open(sp.seg_name(sp.wseq), 'ab') as f: f.write(b'b valu') # crash in the middle of a record
+    sp = Spool(str(tmp_path))
+    sp.append(['c value=3 3'])
+    assert sp.read_batch()[0] == ['a value=1 1', 'c value=3 3']
+    sp.close()
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f'http {status}')
+        self.status = status
+
+def test_retryable():
+    assert retryable(OSError('connection refused'))
+    assert retryable(HttpError(503)) and retryable(HttpError(429)) and retryable(HttpError(408))
+    assert not retryable(HttpError(400)) and not retryable(HttpError(422))
+
+def test_rejected_batch_is_quarantined(tmp_path):
+    sp = Spool(str(tmp_path), batch_lines=2)
+    sp.append(['bad line', 'm value=1 1', 'm value=2 2', 'm value=3 3'])
+    sent, done = [], threading.Event()
+    def write(lines):
+        if 'bad line' in lines: raise HttpError(400)
+        sent.extend(lines)
+        if len(sent) == 2: done.set()
+    dr = SpoolDrainer(sp, write, period=0.01)
+    dr.start()
+    assert done.wait(5.)
+    dr.stop()
+    dr.join()
+    assert sent == ['m value=2 2', 'm value=3 3']
+    assert dr.n_rejected == 2 and dr.n_fail == 0
+    text = open(os.path.join(str(tmp_path), 'rejected.txt')).read().splitlines()
+    assert text[0].startswith('# ') and text[1:] == ['bad line', 'm value=1 1']
+    sp.close()
+
+def test_failed_write_is_retried(tmp_path):
+    sp = Spool(str(tmp_path))
+    sp.append(['m value=1 1'])
+    calls, done = [], threading.Event()
+    def write(lines):
+        calls.append(lines)
+        if len(calls) < 3: raise HttpError(503)
+        done.set()
+    dr = SpoolDrainer(sp, write, period=0.01, backoff_min=0.01)
+    dr.start()
+    assert done.wait(5.)
+    dr.stop()
+    dr.join()
+    assert dr.n_fail == 2 and sp.pending_bytes() == 0
+    sp.close()
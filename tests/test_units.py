@@ -0,0 +1,67 @@
+import time, threading
+import units
+from units import convert, factors, checked, DEG
+from m1 import M1
+from sermeasure import Snapshot
+from lineproto import LineSerializer
+from cmmsis import ThreadSermeasure, LatestTable
+
+def test_conversions():
+    assert convert(1., 'Torr', 'Pa') == 101325./760.
+    assert abs(convert(300., 'K', DEG + 'C') - 26.85) < 1e-9
+    assert convert(50., '%', ' ') == 0.5
+    assert all(x != x for x in factors('Volt', 'Pa')) and all(x != x for x in factors('K', 'Pa'))
+
+def test_checked_retries_and_reports_once(capsys):
+    units.reported.clear()
+    assert checked('g', None) is None and checked('g', ['']) is None
+    assert capsys.readouterr().out == '' # a failed read is retried quietly
+    assert checked('g', ['mbar', 'Volt']) is None
+    assert checked('g', ['mbar', 'Volt']) is None
+    assert capsys.readouterr().out.count('Volt') == 1
+    assert checked('g', ['mbar', 'Torr']) == ['mbar', 'Torr']
+
+def test_serializer_keeps_only_convertible_units():
+    ser = LineSerializer({}, [{}], [], [M1('g', '/dev/null')], normalize=True)
+    snap = Snapshot('g', [1.], [], [], time.time())
+    assert not ser.set_units(0, ['Volt']) and ser.conv[0] is None
+    assert ser.lines([snap]) == []
+    assert ser.set_units(0, ['mbar'])
+    assert ser.lines([snap])[0].split()[1] == 'value=100.0'
+
+def test_worker_reads_units_until_they_convert():
+    class Flaky(M1):
+        answers = [None, 'Volt', 'Torr']
+        def is_open(self): return True
+        def GetUnit(self, i): return self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+    table = LatestTable(1)
+    th = ThreadSermeasure(Flaky('g', '/dev/null'), 0, table, 0.01, read_units=True)
+    th.unit_poll.backoff = 0.05 # Volt is read again after the backoff
+    th.start()
+    t_end = time.time() + 5.
+    while th.units is None and time.time() < t_end: time.sleep(0.01)
+    th.stop()
+    th.join()
+    assert th.units == ['Torr']
+
+def test_worker_reads_units_only_when_needed():
+    class Counting(M1):
+        n_unit = 0
+        def GetUnit(self, i):
+            self.n_unit += 1
+            return 'Volt'
+    dev = Counting('g', '/dev/null')
+    th = ThreadSermeasure(dev, 0, LatestTable(1), 0.01)
+    th.start()
+    time.sleep(0.1)
+    th.stop()
+    th.join()
+    assert dev.n_unit == 0 and th.units is None
+
+def test_unconvertible_units_are_read_again_later():
+    units.reported.clear()
+    up = units.UnitPoll('g', backoff=60.)
+    assert up.due() and up.read(None) is None and up.due() # a failed read is retried at once
+    assert up.read(['Volt']) is None and not up.due() and up.backoff == 120.
+    up.next = 0.
+    assert up.due() and up.read(['mbar']) == ['mbar'] and not up.due()
@@ -1,8 +1,12 @@
 #!/usr/bin/python3
 
-from sermeasure import SerMeasure, UnitType
+from sermeasure import SerMeasure, UnitType, Snapshot
+import time
 from serial import Serial, SerialException, SerialTimeoutException
 from serial.tools.list_ports import comports
+from typing import Dict
+from serasync import AioSerial
+import metrics
 
 ###################################################
 # class for reading the pressure from TIC100
@@ -10,10 +14,15 @@ from serial.tools.list_ports import comports
 # TIC100 should be connected via RS232 (RS232-USB converter)
 class TIC100(SerMeasure):
     n_meas, n_state, n_status = 4, 1, 2
+    tmp_states = ['Stopped', 'Starting Delay',
+                  'Stopping Short Delay', 'Stopping Normal Delay',
+                  'Running', 'Accelerating',
+                  'Fault Braking', 'Braking' ]
 
     def __init__(self, name: str, port: str):
         self.name: str   = name
         self.port: str   = port
+        self.ser = None
         self.type: list[UnitType] = [UnitType.Pres, UnitType.Pres, UnitType.Pres, UnitType.Perc]
         self.type: list[UnitType] = self.n_meas * [UnitType.Pres]
         self.ok = False
@@ -30,21 +39,19 @@ class TIC100(SerMeasure):
         self.gauge_st = (0, 0, 0)
         self.relay_st = (0, 0, 0)
 
+        # cycle-scoped cache of query answers: each OID is queried once per cycle
+        self.cycle_cache: Dict[str, str] = None # None = no cycle is running
+        self.cycle_saved: int = 0 # transactions saved in the last cycle
+        self.total_saved: int = 0
+
     def open(self):
-        try: 
-            self.ser = Serial(self.port, timeout=1, write_timeout=1) # default is okay
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in open: {str(e)}")
-            self.ser = None
-            self.ok = False
-        else: self.ok = True
+        self.ser = self.open_session(timeout=self.timeout, write_timeout=self.timeout) # default is okay
+        self.ok = self.ser is not None
         return self.ok
         
     def close(self):
         if self.ser is None: return
-        try: self.ser.close()
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in close: {str(e)}")
+        self.close_session()
         self.ser = None
     
     def is_open(self):
@@ -58,8 +65,7 @@ class TIC100(SerMeasure):
         if i >= self.n_meas: return 0
         if i == self.n_meas - 1:  return self.GetTMPSpeed()
         self.status_queryv()
-        if self.gauge_st[i] == 0: return 0 # gauge is not connected
-        return float(self.gauge_queryv(i+1).split(';')[0]) # gauge number convention (1 ~ 3)
+        return self.GetGauge(i)
 
     def GetUnit(self, i: int):
         if i >= self.n_meas: return ''
@@ -71,12 +77,8 @@ class TIC100(SerMeasure):
         else: return ''
 
     def GetState(self, i: int):
-        states = ['Stopped', 'Starting Delay',
-                  'Stopping Short Delay', 'Stopping Normal Delay',
-                  'Running', 'Accelerating',
-                  'Fault Braking', 'Braking' ]
         if i == 0:
-            return states[self.GetTMPStatus()]
+            return self.tmp_states[self.GetTMPStatus()]
         else: return ''
 
     def GetStatusName(self, i: int):
@@ -88,29 +90,76 @@ class TIC100(SerMeasure):
         if i == 1: return self.GetTMPStandby()
         return True
 
+    # one ?V902 serves all gauge states and the turbo state
+    def ReadAll(self):
+        t = time.time()
+        self.begin_cycle()
+        try:
+            self.status_queryv()
+            meas = [self.GetGauge(i) for i in range(self.n_meas - 1)] + [self.GetTMPSpeed()]
+            state = [self.tmp_states[self.GetTMPStatus()]]
+            status = [self.GetTMPNormal(), self.GetTMPStandby()]
+        finally: self.end_cycle() # a failed cycle must not leave its answers cached
+        return Snapshot(self.name, meas, state, status, t)
+
+    #########################################
+    # acquisition cycle
+    #
+    # between begin_cycle and end_cycle, answers of ?V/?S queries are cached
+    # and the same OID is not queried again; the cache is invalidated
+    # when the next cycle starts
+    def begin_cycle(self):
+        self.cycle_cache = {}
+        self.cycle_saved = 0
+
+    def end_cycle(self):
+        self.total_saved += self.cycle_saved
+        metrics.count(self, 'saved', self.cycle_saved)
+        metrics.gauge(self, 'cycle_saved', self.cycle_saved)
+        if self.verbose: print(f'{self.name}: {self.cycle_saved} transactions saved in the cycle')
+        self.cycle_cache = None
+
+    def cached_query(self, kind: str, oid: int):
+        key = kind + str(oid)
+        if self.cycle_cache is not None and key in self.cycle_cache:
+            self.cycle_saved += 1
+            return self.cycle_cache[key]
+        data = self.send_queryv(oid) if kind == 'V' else self.send_querys(oid)
+        if self.cycle_cache is not None and data is not None: self.cycle_cache[key] = data
+        return data
+    #########################################
+
+    # gauge value with the last gauge states (status_queryv)
+    def GetGauge(self, i: int):
+        if self.gauge_st[i] == 0: return 0 # gauge is not connected
+        data = self.gauge_queryv(i+1) # gauge number convention (1 ~ 3)
+        if not isinstance(data, str): return 0
+        return float(data.split(';')[0])
+
     def GetTMPStatus(self):
         self.status_queryv() 
         return int(self.turbo_st)
     
     def GetTMPSpeed(self):
-        return float(self.tspeed_queryv().split(';')[0]) # speed in %
+        data = self.tspeed_queryv()
+        if not isinstance(data, str): return 0
+        return float(data.split(';')[0]) # speed in %
 
     def GetTMPNormal(self):
-        ans = self.send_queryv(907)
-        if ans is None: return False
-        if   int(ans.split(';')[0]) == 0: return False
-        elif int(ans.split(';')[0]) == 4: return True
-        else: return False
+        return self.tmp_flag(self.cached_query('V', 907))
 
     def GetTMPStandby(self):
-        ans = self.send_queryv(908)
+        return self.tmp_flag(self.cached_query('V', 908))
+
+    # answer of 907 (normal) and 908 (standby): 4 = on
+    def tmp_flag(self, ans):
         if ans is None: return False
         if   int(ans.split(';')[0]) == 0: return False
         elif int(ans.split(';')[0]) == 4: return True
         else: return False        
 
     def status_querys(self): # System string
-        ans = self.send_querys(902)
+        ans = self.cached_query('S', 902)
         if ans is None: return False
         status = [x.strip() for x in ans.split(';')] # TIxxx; SW Ver; Ser Num; PIC SW ver
         self.model     = status[0]
@@ -120,7 +169,9 @@ class TIC100(SerMeasure):
         return True
     
     def status_queryv(self): # system status (True / False)
-        ans = self.send_queryv(902)
+        return self.set_status(self.cached_query('V', 902))
+
+    def set_status(self, ans):
         if ans is None:
             return False
         status = list(map(int, ans.split(';')))
@@ -130,7 +181,7 @@ class TIC100(SerMeasure):
         return True
 
     def turbo_queryv(self):
-        ans = self.send_queryv(904)
+        ans = self.cached_query('V', 904)
         if ans is None: return False
         status = [x.strip() for x in ans.split(';')] # Pump status - state; alert ID; priority
         self.turbo_status = status[0]
@@ -138,23 +189,23 @@ class TIC100(SerMeasure):
         return True
     
     def tspeed_queryv(self):
-        data = self.send_queryv(905)
+        data = self.cached_query('V', 905)
         if data is None: return 0.
         return data
     
     def tnormal_queryv(self):
-        data = self.send_queryv(907)
+        data = self.cached_query('V', 907)
         if data is None: return 0.
         return data
 
     def tstandby_queryv(self):
-        data = self.send_queryv(908)
+        data = self.cached_query('V', 908)
         if data is None: return 0.
         return data     
 
     def gauge_queryv(self, i: int): # i = 1, 2, 3
         if i < 1 or i > 3: return 0. # Error
-        data = self.send_queryv(912+i)
+        data = self.cached_query('V', 912+i)
         if data is None: return 0.
         return data
     
@@ -204,6 +255,7 @@ class TIC100(SerMeasure):
         self.ok = True
         return True
 
+    @metrics.timed(lambda oid: 'S' + str(oid))
     def send_querys(self, oid: int):
         if not self.open(): return None
         try:
@@ -216,19 +268,9 @@ class TIC100(SerMeasure):
             self.close()
             return None
         self.close()
-        if len(answer) < 2 or answer.index('=S') != 0:
-            print(f"Error in send_querys: No available answer")
-            self.ok = False
-            return None
-        answers = answer[answer.index('=S')+2:].split()
-        oid_a = int(answers[0])
-        data = answers[1]
-        if oid_a != oid or data == '':
-            self.ok = False
-            return None
-        self.ok = True
-        return data
+        return self.parse_query(answer, 'S', oid)
 
+    @metrics.timed(lambda oid: 'V' + str(oid))
     def send_queryv(self, oid: int):
         if not self.open(): return None
         try:
@@ -242,17 +284,57 @@ class TIC100(SerMeasure):
             self.close()
             return None
         self.close()
-        if answer.index('=V') != 0:
+        return self.parse_query(answer, 'V', oid)
+
+    # answer: =Vxxx data or =Sxxx data
+    def parse_query(self, answer: str, kind: str, oid: int):
+        if len(answer) < 2 or not answer.startswith('=' + kind):
+            print(f"Error in send_query{kind.lower()}: No available answer")
+            metrics.count(self, 'timeouts' if answer == '' else 'naks') # *V<oid> <error>
             self.ok = False
             return None
-        answers= answer[answer.index('=V')+2:].split()
-        oid_a = int(answers[0])
-        data = answers[1]
-        if oid_a != oid or data == '':
+        answers = answer[2:].split()
+        if len(answers) < 2 or answers[0] != str(oid) or answers[1] == '':
             self.ok = False
             return None
         self.ok = True
-        return data
+        return answers[1]
+    #############################################################################
+
+    #############################################################################
+    # asyncio transactions (see serasync)
+    @metrics.timed(lambda kind, oid: kind + str(oid))
+    async def asend_query(self, kind: str, oid: int):
+        try:
+            aser = AioSerial.get(self.port, timeout=1, write_timeout=1)
+            async with aser.lock:
+                aser.reset_input_buffer()
+                aser.write( bytes('?' + kind + str(oid) + '\r', 'utf8') )
+                answer = (await aser.read_until(b'\r')).decode().rstrip()
+        except (SerialException, SerialTimeoutException) as e:
+            print(f"Error in asend_query{kind.lower()}: {str(e)}")
+            self.ok = False
+            return None
+        return self.parse_query(answer, kind, oid)
+
+    async def asend_querys(self, oid: int):
+        return await self.asend_query('S', oid)
+
+    async def asend_queryv(self, oid: int):
+        return await self.asend_query('V', oid)
+
+    async def AReadAll(self):
+        t = time.time()
+        self.set_status(await self.asend_queryv(902))
+        meas = []
+        for i in range(self.n_meas - 1):
+            data = await self.asend_queryv(913+i) if self.gauge_st[i] != 0 else None
+            meas.append(float(data.split(';')[0]) if data is not None else 0)
+        data = await self.asend_queryv(905)
+        meas.append(float(data.split(';')[0]) if data is not None else 0)
+        state = [self.tmp_states[int(self.turbo_st)]]
+        status = [self.tmp_flag(await self.asend_queryv(907)), self.tmp_flag(await self.asend_queryv(908))]
+        return Snapshot(self.name, meas, state, status, t)
     #############################################################################
 
 if __name__=="__main__":
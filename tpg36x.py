@@ -1,9 +1,12 @@
 #!/usr/bin/python3
 
-from sermeasure import UnitType, SerMeasure
+from sermeasure import UnitType, SerMeasure, Snapshot
 from serial import Serial, SerialException, SerialTimeoutException
 from serial.tools.list_ports import comports
 from typing import Dict, List
+from serasync import AioSerial
+import metrics
+import time
 
 ###################################################
 # class for reading the pressure from TPG36X
@@ -17,30 +20,26 @@ class TPG36X(SerMeasure):
     ACK = b'\x06'
     NAK = b'\x15'
     n_meas, n_state, n_status = 2, 0, 0
+    unit_name = ['mbar', 'Torr', 'Pa', 'Micron', 'hPa', 'Volt' ]
     def __init__(self, name, port):
         self.name = name
         self.port = port
         self.type: list[UnitType] = self.n_meas * [UnitType.Pres]
 
+        self.ser = None
         self.ok = False
         print(f'TPG36X with name: {self.name} and port: {self.port}  opened')
         self.verbose = False
         #self.open()
 
     def open(self):
-        try: 
-            self.ser = Serial(self.port, timeout=1, write_timeout=1) # default is okay
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in open: {str(e)}")
-            self.ok = False
-        else: self.ok = True
+        self.ser = self.open_session(timeout=self.timeout, write_timeout=self.timeout) # default is okay
+        self.ok = self.ser is not None
         return self.ok
         
     def close(self):
         if self.ser is None: return
-        try: self.ser.close()
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in close: {str(e)}")
+        self.close_session()
         self.ser = None
 
     def is_open(self):
@@ -80,7 +79,7 @@ class TPG36X(SerMeasure):
         return float(r[1])
     
     def get_pr2(self):
-        r = self.comm_pr1()
+        r = self.comm_pr2()
         if r is None: return 0
         return float(r[1])
     #########################################
@@ -89,10 +88,9 @@ class TPG36X(SerMeasure):
     # pressure unit
     #
     def get_uni(self):
-        units = ['mbar', 'Torr', 'Pa', 'Micron', 'hPa', 'Volt' ]
         r = self.comm_uni()
         if r is None: return ''
-        return units[int(r[0])]
+        return self.unit_name[int(r[0])]
     #########################################
 
     #########################################
@@ -121,6 +119,7 @@ class TPG36X(SerMeasure):
 
     
 ########################################################################################################################        
+    @metrics.timed()
     def send_command(self, command, val: List[str] = []):
         if command == '': return False
         s = command
@@ -141,9 +140,12 @@ class TPG36X(SerMeasure):
         if answer == b'': 
             self.ok = False
             print(f"Error in send_command: Nothing is received")
+            metrics.count(self, 'timeouts')
             return False
         self.ok = True
-        if answer[0] == self.NAK: return False
+        if answer[:1] == self.NAK:
+            metrics.count(self, 'naks')
+            return False
         else: return True
 
     def send_query(self):
@@ -157,6 +159,7 @@ class TPG36X(SerMeasure):
         self.ok = True
         return a
 
+    @metrics.timed()
     def send_command_with_query(self, command):
         if not self.open(): return None
         if self.send_command(command):
@@ -167,6 +170,43 @@ class TPG36X(SerMeasure):
             self.close() 
             return None
 
+    #########################################
+    # asyncio transactions (see serasync)
+    @metrics.timed()
+    async def asend_command_with_query(self, command):
+        try:
+            aser = AioSerial.get(self.port, timeout=1, write_timeout=1)
+            async with aser.lock:
+                aser.reset_input_buffer()
+                aser.write( bytes(command + '\r', 'utf8') )
+                answer = (await aser.readline()).rstrip()
+                if answer == b'' or answer[:1] == self.NAK:
+                    metrics.count(self, 'timeouts' if answer == b'' else 'naks')
+                    if answer == b'': print(f"Error in asend_command_with_query: Nothing is received")
+                    self.ok = answer != b''
+                    return None
+                aser.write(self.ENQ)
+                a = (await aser.readline()).decode('utf8').rstrip()
+        except (SerialException, SerialTimeoutException) as e:
+            print(f"Error in asend_command_with_query: {str(e)}")
+            self.ok = False
+            return None
+        self.ok = True
+        return a
+
+    async def AReadAll(self):
+        t = time.time()
+        meas = []
+        for command in ['PR1', 'PR2']:
+            a = await self.asend_command_with_query(command)
+            meas.append(float(a.split(',')[1]) if a is not None else 0)
+        return Snapshot(self.name, meas, [], [], t)
+
+    async def AGetUnits(self):
+        a = await self.asend_command_with_query('UNI')
+        return self.n_meas * [self.unit_name[int(a.split(',')[0])] if a is not None else '']
+    #########################################
+
     def comm_ayt(self):
         a = self.send_command_with_query('AYT')
         return a.split(',') if a is not None else None
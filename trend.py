@@ -0,0 +1,124 @@
+from PyQt5 import QtGui
+from PyQt5.QtCore import Qt, QTimer, QPointF
+from PyQt5.QtWidgets import QWidget
+
+import time
+import numpy as np
+from ringbuf import RingBuffer, column_minmax
+
+from typing import List
+
+###################################################
+# trend plot of a ring buffer
+#
+# the samples in the time span are decimated to min/max per pixel column;
+# the columns are cached and a repaint only adds the samples appended since
+# the previous one, so it costs the same for minutes or hours of history
+#
+# the widgets do not repaint on every new sample: append() only marks the
+# trend dirty, and a single timer shared by all the trends repaints the dirty
+# and visible ones (coalesced redraws)
+class QTrend(QWidget):
+    refresh_t = 500 # [msec]
+    trends: List['QTrend'] = []
+    timer: QTimer = None
+
+    def __init__(self, buf: RingBuffer, conv = None, log: bool = False, *args):
+        super().__init__(*args)
+        self.buf = buf
+        self.conv = conv # function converting an array of the input unit to the displayed unit
+        self.log = log
+        self.span = 600. # [sec]
+        self.dirty = True
+        self.cache = None # (column width [sec], first column, number of samples done)
+        self.setMinimumHeight(80)
+        self.setMinimumWidth(150)
+        QTrend.trends.append(self)
+        if QTrend.timer is None:
+            QTrend.timer = QTimer()
+            QTrend.timer.timeout.connect(QTrend.refresh)
+            QTrend.timer.start(self.refresh_t)
+
+    def append(self, t: float, v: float):
+        self.buf.append(t, v)
+        self.dirty = True
+
+    def setSpan(self, span: float):
+        self.span = span
+        self.dirty = True
+
+    @staticmethod
+    def refresh():
+        for x in QTrend.trends:
+            if x.dirty and x.isVisible():
+                x.dirty = False
+                x.update()
+
+    def closeEvent(self, event):
+        self.release()
+        super().closeEvent(event)
+
+    def release(self):
+        if self in QTrend.trends: QTrend.trends.remove(self)
+
+    # min/max of the pixel columns of the time span
+    def columns(self, now: float):
+        n_col = max(1, self.width())
+        dt = self.span/n_col
+        first = int(np.floor(now/dt)) - n_col + 1
+        if self.cache is None or self.cache[0] != dt or len(self.cmin) != n_col \
+           or self.buf.total < self.cache[2] or self.buf.total - self.cache[2] > self.buf.count:
+            t, v = self.buf.window(first*dt, now)
+            self.cmin, self.cmax = column_minmax(t, v, first*dt, dt, n_col)
+        else:
+            shift = first - self.cache[1]
+            if shift > 0:
+                self.cmin, self.cmax = np.roll(self.cmin, -shift), np.roll(self.cmax, -shift)
+                self.cmin[-shift:], self.cmax[-shift:] = np.nan, np.nan
+            t, v = self.buf.tail(self.buf.total - self.cache[2])
+            nmin, nmax = column_minmax(t, v, first*dt, dt, n_col)
+            self.cmin, self.cmax = np.fmin(self.cmin, nmin), np.fmax(self.cmax, nmax)
+        self.cache = (dt, first, self.buf.total)
+        return (first + np.arange(n_col))*dt, self.cmin, self.cmax
+
+    def points(self):
+        now = time.time()
+        t, vmin, vmax = self.columns(now)
+        t, v = np.repeat(t, 2), np.empty(2*len(t))
+        v[0::2], v[1::2] = vmin, vmax
+        if self.conv is not None and len(v) > 0: v = np.broadcast_to(self.conv(v), v.shape).astype(np.float64)
+        if self.log:
+            v = np.where(v > 0, v, np.nan)
+            v = np.log10(v)
+        return now, t, v
+
+    def paintEvent(self, event):
+        p = QtGui.QPainter(self)
+        p.fillRect(self.rect(), Qt.white)
+        p.setPen(Qt.gray)
+        p.drawRect(0, 0, self.width() - 1, self.height() - 1)
+        now, t, v = self.points()
+        ok = np.isfinite(v)
+        if ok.sum() == 0:
+            p.end()
+            return
+        vmin, vmax = v[ok].min(), v[ok].max()
+        if vmax - vmin < 1e-12: vmin, vmax = vmin - 0.5, vmax + 0.5
+        w, h, m = self.width(), self.height(), 12
+        x = (t - (now - self.span))/self.span*(w - 1)
+        y = (h - m) - (v - vmin)/(vmax - vmin)*(h - 2*m)
+        p.setRenderHint(QtGui.QPainter.Antialiasing, False)
+        p.setPen(QtGui.QPen(Qt.blue))
+        # a polyline per run of valid points
+        line = QtGui.QPolygonF()
+        for xi, yi, oki in zip(x, y, ok):
+            if oki: line.append(QPointF(xi, yi))
+            elif line.size() > 0:
+                p.drawPolyline(line)
+                line = QtGui.QPolygonF()
+        if line.size() > 0: p.drawPolyline(line)
+        p.setPen(Qt.black)
+        lab = (lambda a: '%.2E' % 10**a) if self.log else (lambda a: '%.3g' % a)
+        p.drawText(2, 10, lab(vmax))
+        p.drawText(2, h - 2, lab(vmin))
+        p.end()
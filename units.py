@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+import time
+import numpy as np
+from sermeasure import UnitType
+from typing import Dict, List, Tuple
+
+###################################################
+# unit conversion of pressures, temperatures and percentages
+#
+# each unit is an affine map to the SI unit of its type: si = a*x + b
+# the (scale, offset) of every pair of units of the same type is precomputed,
+# so a conversion is one multiply-add on a scalar or on a whole numpy array
+#
+# an unknown unit or a pair of different types gives nan (never 0)
+DEG = '\N{DEGREE SIGN}'
+units: Dict[str, Tuple[UnitType, float, float]] = {
+    # pressure -> Pa
+    'Pa':     (UnitType.Pres, 1., 0.),
+    'hPa':    (UnitType.Pres, 100., 0.),
+    'kPa':    (UnitType.Pres, 1000., 0.),
+    'mbar':   (UnitType.Pres, 100., 0.),
+    'bar':    (UnitType.Pres, 1e5, 0.),
+    'Torr':   (UnitType.Pres, 101325./760., 0.),
+    'Micron': (UnitType.Pres, 101325./760e3, 0.), # mTorr
+    'mTorr':  (UnitType.Pres, 101325./760e3, 0.),
+    'atm':    (UnitType.Pres, 101325., 0.),
+    'psi':    (UnitType.Pres, 6894.757293168, 0.),
+    # temperature -> K
+    'K':        (UnitType.Temp, 1., 0.),
+    DEG + 'C':  (UnitType.Temp, 1., 273.15),
+    DEG + 'F':  (UnitType.Temp, 5/9, 273.15 - 32*5/9),
+    'C':        (UnitType.Temp, 1., 273.15),
+    'F':        (UnitType.Temp, 5/9, 273.15 - 32*5/9),
+    # percentage -> fraction
+    ' ':                  (UnitType.Perc, 1., 0.),
+    '%':                  (UnitType.Perc, 0.01, 0.),
+    '\N{PER MILLE SIGN}': (UnitType.Perc, 0.001, 0.),
+}
+si_units = {UnitType.Pres: 'Pa', UnitType.Temp: 'K', UnitType.Perc: ' '}
+
+# (scale, offset) from unit u1 to unit u2: x2 = scale*x1 + offset
+table: Dict[Tuple[str, str], Tuple[float, float]] = {}
+for u1, (t1, a1, b1) in units.items():
+    for u2, (t2, a2, b2) in units.items():
+        if t1 == t2: table[(u1, u2)] = (a1/a2, (b1 - b2)/a2)
+
+def unit_type(u: str) -> UnitType:
+    return units[u][0] if u in units else None
+
+def si_unit(u: str) -> str:
+    return si_units[units[u][0]] if u in units else None
+
+def factors(u1: str, u2: str) -> Tuple[float, float]:
+    return table.get((u1, u2), (np.nan, np.nan))
+
+# x: scalar or numpy array
+def convert(x, u1: str, u2: str):
+    if u1 == u2: return x
+    a, b = factors(u1, u2)
+    if x is None: return np.nan
+    if isinstance(x, (list, tuple)): x = np.asarray(x, np.float64)
+    return a*x + b
+
+def to_si(x, u: str):
+    return convert(x, u, si_unit(u))
+
+# units read from a device (SerMeasure.GetUnits): the list if every unit
+# converts, None to read them again later; a failed read gives None or ''
+# (retried quietly), a unit without conversion (e.g. 'Volt') is reported
+# once per device
+reported = set()
+def checked(name: str, u: List[str]) -> List[str]:
+    if u is None: return None
+    bad = [x for x in u if x not in units]
+    if len(bad) == 0: return list(u)
+    for x in bad:
+        if x is None or x == '' or (name, x) in reported: continue
+        reported.add((name, x))
+        print(f"Error in {name}: unit {x} cannot be converted")
+    return None
+
+###################################################
+# units of a device read after its acquisitions until they convert
+#
+# a failed read is retried at the next cycle; after an unconvertible unit
+# (e.g. a gauge set to Volt) the next read waits backoff [sec], doubled
+# each time up to max_backoff, instead of costing a transaction every cycle
+class UnitPoll:
+    def __init__(self, name: str, backoff: float = 60., max_backoff: float = 3600.):
+        self.name = name
+        self.units: List[str] = None
+        self.backoff, self.max_backoff = backoff, max_backoff
+        self.next = 0. # monotonic time of the next read
+
+    def due(self) -> bool:
+        return self.units is None and time.monotonic() >= self.next
+
+    def read(self, u: List[str]) -> List[str]:
+        self.units = checked(self.name, u)
+        if self.units is None and u is not None and any(x not in (None, '') and x not in units for x in u):
+            self.next = time.monotonic() + self.backoff
+            self.backoff = min(2*self.backoff, self.max_backoff)
+        return self.units
+
+# units of a type in the order of the gui
+def units_of(type: UnitType) -> List[str]:
+    return [u for u, (t, _, _) in units.items() if t == type]
+
+if __name__=="__main__":
+    import time
+    print('1 Torr   =', convert(1., 'Torr', 'Pa'), 'Pa')
+    print('1 Micron =', convert(1., 'Micron', 'mbar'), 'mbar')
+    print('300 K    =', convert(300., 'K', DEG + 'F'), DEG + 'F')
+    print('50 %     =', convert(50., '%', '\N{PER MILLE SIGN}'), '\N{PER MILLE SIGN}')
+    print('1 Volt   =', convert(1., 'Volt', 'Pa'), 'Pa')
+    x = np.random.rand(86400*10)
+    t = time.perf_counter()
+    convert(x, 'mbar', 'Torr')
+    print(f'{len(x)} samples: {(time.perf_counter() - t)*1e3:.2f} ms')
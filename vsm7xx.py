@@ -1,8 +1,12 @@
 #!/usr/bin/python3
 
-from sermeasure import UnitType, SerMeasure
+from sermeasure import UnitType, SerMeasure, Snapshot
 from serial import Serial, SerialException, SerialTimeoutException
 from serial.tools.list_ports import comports
+from serasync import AioSerial
+from serbus import SerBus
+import metrics
+import time
 
 ###################################################
 # class for reading the pressure from VSM7XX
@@ -13,6 +17,7 @@ class VSM7XX(SerMeasure):
         self.name = name
         self.port = port
         self.type: list[UnitType] = self.n_meas * [UnitType.Pres]
+        self.ser = None
         self.ok = False
         print(f'VSN7XX with name: {self.name} and port: {self.port}  opened')
 
@@ -20,21 +25,21 @@ class VSM7XX(SerMeasure):
 
         self.address = _address
 
+    # gauges with different addresses may share the port (RS-485); looked up
+    # by the current port, so a device attached to another port (hot-plug)
+    # talks to the bus of that port
+    @property
+    def bus(self) -> SerBus:
+        return SerBus.get(self.port)
+
     def open(self):
-        try: 
-            self.ser = Serial(self.port, timeout=1, write_timeout=1) # default is okay
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in open: {str(e)}")
-            self.ser = None
-            self.ok = False
-        else: self.ok = True
+        self.ser = self.open_session(timeout=self.timeout, write_timeout=self.timeout) # default is okay
+        self.ok = self.ser is not None
         return self.ok
         
     def close(self):
         if self.ser is None: return
-        try: self.ser.close()
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in close: {str(e)}")
+        self.close_session()
         self.ser = None
 
     def is_open(self):
@@ -45,7 +50,9 @@ class VSM7XX(SerMeasure):
         return self.ok
     
     def GetMeasure(self, i: int):
-        r = self.get_pr()
+        return self.pr_value(self.get_pr())
+
+    def pr_value(self, r):
         if   r == '' or r == None or r == 'UR': return 0
         if   r == 'OR': return 1e3
         return float(r)
@@ -116,74 +123,97 @@ class VSM7XX(SerMeasure):
     #########################################    
     
 ########################################################################################################################        
+    @metrics.timed()
     def read_command(self, command: str):
-        if not self.open(): return None
         if command == '': return None
-        # ADR (0XX) + AC + CMD (XX) + Length (00) + CheckSum + CR
-        seq = ('%03d' % self.address) + '0' + command + '00'
-        seq = seq + chr(sum([ord(x) for x in seq]) % 64 + 64)
-        try: self.ser.write( bytes(seq + '\r', 'utf8') ) # works better with older Python3 versions (<3.5)
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in read_command: {str(e)}")
-            self.ok = False
-            self.close()
-            return None
-        if self.verbose: print("The sent sequence is: ",seq) 
-        try: answer = self.ser.read_until(b'\r').rstrip() # return response from the unit
+        answer = self.transact(self.make_seq('0', command), 'read_command')
+        if answer is None: return None
+        return self.parse_answer(answer, 49, 'read_command')
+
+    def write_command(self, command: str, data: str):
+        if command == '': return None
+        answer = self.transact(self.make_seq('2', command, data), 'write_command')
+        if answer is None: return None
+        return self.parse_answer(answer, 51, 'write_command')
+
+    # one transaction on the bus of the port (see serbus.SerBus)
+    def transact(self, seq: str, where: str):
+        if self.verbose: print("The sent sequence is: ",seq)
+        try: answer = self.bus.transact(self.address, bytes(seq + '\r', 'utf8'), b'\r', self.timeout).rstrip()
         except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in read_command: {str(e)}")
+            print(f"Error in {where}: {str(e)}")
             self.ok = False
-            self.close()
             return None
         if self.verbose: print("The received command is: ",answer)
+        return answer
+
+    #########################################
+    # gauges on the port: one VSM7XX for every address answering the product name
+    @classmethod
+    def discover(cls, port: str, addresses = range(1, 17), timeout: float = 0.2):
+        probe = cls('sweep', port)
+        def request(address):
+            probe.address = address
+            return bytes(probe.make_seq('0', 'PN') + '\r', 'utf8')
+        def check(answer):
+            try: return len(answer) > 8 and answer[3] == 49 and int(answer[:3]) == probe.address
+            except ValueError: return False
+        found = probe.bus.sweep(request, check, addresses, timeout)
+        return [cls(f'vsm{x}', port, x) for x in found]
+    #########################################
+
+    # ADR (0XX) + AC + CMD (XX) + Length (XX) + Data + CheckSum + CR
+    # AC = 0 (read), 2 (write)
+    def make_seq(self, ac: str, command: str, data: str = ''):
+        seq = ('%03d' % self.address) + ac + command + ('%02d' % len(data)) + data
+        return seq + chr(sum([ord(x) for x in seq]) % 64 + 64)
+
+    # answer AC = 49 ('1', read) or 51 ('3', write)
+    def parse_answer(self, answer: bytes, ac: int, where: str):
         try: dlen = int(answer[6:8])
         except (IndexError, ValueError) as e:
-            print(f"Error in read_command: {str(e)}")
+            print(f"Error in {where}: {str(e)}")
+            metrics.count(self, 'timeouts' if answer == b'' else 'naks')
             self.ok = False
-            self.close()
             return None
         self.ok = True
-        self.close()        
-        if answer[3] == 49:
+        if answer[3] == ac:
             if dlen > 0: return answer[8:8+dlen].decode()
             else:        return ''
         else: 
-            print('read_command: error in communication')
+            print(f'{where}: error in communication')
+            metrics.count(self, 'naks')
             return None
 
-    def write_command(self, command: str, data: str):
-        if not self.open(): return None
+    #########################################
+    # asyncio transactions (see serasync)
+    @metrics.timed()
+    async def aread_command(self, command: str):
         if command == '': return None
-        # ADR (0XX) + AC + CMD (XX) + Length (00) + CheckSum + CR
-        seq = ('%03d' % self.address) + '2' + command + ('%02d' % len(data)) + data
-        seq = seq + chr(sum([ord(x) for x in seq]) % 64 + 64)
-        try: self.ser.write( bytes(seq + '\r', 'utf8') ) # works better with older Python3 versions (<3.5)
-        except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in write_command: {str(e)}")
-            self.ok = False
-            self.close()
-            return None
-        if self.verbose: print("The sent sequence is: ",seq) 
-        try: answer = self.ser.read_until(b'\r').rstrip() # return response from the unit
+        seq = self.make_seq('0', command)
+        t = time.perf_counter()
+        answer = b''
+        try:
+            aser = AioSerial.get(self.port, timeout=1, write_timeout=1)
+            async with aser.lock: # first come, first served like the bus
+                t_turn = time.perf_counter()
+                try:
+                    aser.reset_input_buffer()
+                    aser.write( bytes(seq + '\r', 'utf8') )
+                    answer = await aser.read_until(b'\r', self.bus.timeout_of(self.address, self.timeout))
+                finally: self.bus.record(self.address, time.perf_counter() - t_turn, answer.endswith(b'\r'),
+                                         t_turn - t)
         except (SerialException, SerialTimeoutException) as e:
-            print(f"Error in write_command: {str(e)}")
+            print(f"Error in aread_command: {str(e)}")
             self.ok = False
-            self.close()
             return None
-        self.close()
-        if self.verbose: print("The received command is: ",answer)
-        try: dlen = int(answer[6:8])
-        except (IndexError, ValueError) as e:
-            print(f"Error in write_command: {str(e)}")
-            self.ok = False
-            return None    
-        self.ok = True
-        if answer[3] == 51: 
-            if dlen > 0: return answer[8:8+dlen].decode()
-            else:        return ''
-        else: 
-            print('write_command: error in communication')
-            return None     
+        answer = answer.rstrip()
+        return self.parse_answer(answer, 49, 'aread_command')
+
+    async def AReadAll(self):
+        t = time.time()
+        return Snapshot(self.name, [self.pr_value(await self.aread_command('MV'))], [], [], t)
+    #########################################
 ########################################################################################################################        
 
 if __name__=="__main__":